@@ -0,0 +1,349 @@
+import os
+import json
+import math
+import time
+import asyncio
+import hashlib
+import logging
+import ipaddress
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from fastapi import Depends, HTTPException, Request
+
+from metrics import REGISTRY
+from tracing import call_id
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_REJECTED = REGISTRY.counter("admission_rejected_total", "Requisições recusadas com 429.",
+                                      ("endpoint", "reason"))
+OPERATION_IN_USE = REGISTRY.gauge("admission_in_use", "Requisições em andamento por operação do GLPI.",
+                                  ("operation",))
+
+
+class Overloaded(Exception):
+    """
+    Requisição recusada pelo controle de admissão; `retry_after` em segundos.
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Limite atingido ({reason}); tente novamente em {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Balde de fichas: `rate` fichas por segundo, acumulando até `burst`.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now=None):
+        """
+        Consome uma ficha. Retorna 0 se a requisição pode passar, senão quantos segundos esperar.
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    Um balde por chamador (chave de API, ID da chamada ou IP). Guarda no
+    máximo `max_keys` baldes; os menos usados são descartados (voltam cheios).
+    """
+
+    def __init__(self, rate, burst, max_keys=10000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    def check(self, key):
+        """
+        Levanta Overloaded se o chamador já gastou o seu limite.
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        wait = bucket.take()
+        if wait:
+            raise Overloaded("rate", max(1, math.ceil(wait)))
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class ConcurrencyLimit:
+    """
+    Teto de requisições simultâneas de uma operação do GLPI.
+
+    Com o teto ocupado, até `max_waiting` requisições esperam uma vaga por
+    no máximo `max_wait` segundos; as demais são recusadas na hora, em vez
+    de formar uma fila sem limite.
+    """
+
+    def __init__(self, name, limit, max_waiting=0, max_wait=1.0):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.in_use = 0
+        self.waiting = 0
+        self.rejected = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise Overloaded(f"concurrency:{self.name}", max(1, math.ceil(self.max_wait)))
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.max_wait)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise Overloaded(f"concurrency:{self.name}", max(1, math.ceil(self.max_wait)))
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_use += 1
+        OPERATION_IN_USE.set(self.name, value=self.in_use)
+
+    def release(self):
+        self.in_use -= 1
+        OPERATION_IN_USE.set(self.name, value=self.in_use)
+        self._semaphore.release()
+
+    def snapshot(self):
+        return {"limit": self.limit, "in_use": self.in_use, "waiting": self.waiting, "rejected": self.rejected}
+
+
+def parse_rate(spec):
+    """
+    "5/10" -> (5.0, 10): 5 requisições por segundo com rajada de 10. "5" -> (5.0, 5).
+    """
+    rate, _, burst = str(spec).partition("/")
+    rate = float(rate)
+    return rate, int(burst) if burst else max(1, math.ceil(rate))
+
+
+def parse_networks(spec):
+    """
+    "10.0.0.0/8, 127.0.0.1" -> redes dos proxies confiáveis. Entradas inválidas são ignoradas.
+    """
+    networks = []
+    for item in (spec or "").split(","):
+        try:
+            networks.append(ipaddress.ip_network(item.strip(), strict=False))
+        except ValueError:
+            if item.strip():
+                logger.warning(f"TRUSTED_PROXIES: endereço inválido ignorado: {item.strip()}")
+    return tuple(networks)
+
+
+def _trusted(address, trusted_proxies):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_proxies)
+
+
+def client_ip(request, trusted_proxies=()):
+    """
+    IP de origem da requisição. X-Forwarded-For só é considerado quando a
+    conexão vem de um proxy confiável (`trusted_proxies`); nesse caso vale o
+    último endereço da cadeia que não é de um proxy confiável.
+    """
+    address = request.client.host if request.client else "desconhecido"
+    if not _trusted(address, trusted_proxies):
+        return address
+    for hop in reversed(request.headers.get("x-forwarded-for", "").split(",")):
+        hop = hop.strip()
+        if hop and not _trusted(hop, trusted_proxies):
+            return hop
+    return address
+
+
+def source_key(request, trusted_proxies=()):
+    """
+    Identifica a origem autenticada: chave de API (resumida, nunca guardada
+    em claro) ou, sem credencial, o IP de origem. Não depende de nada que o
+    chamador possa trocar livremente a cada requisição.
+    """
+    headers = request.headers
+    credential = headers.get("authorization") or headers.get("x-api-key") or headers.get("x-vapi-secret")
+    if credential:
+        return "key:" + hashlib.sha256(credential.encode()).hexdigest()[:16]
+    return "ip:" + client_ip(request, trusted_proxies)
+
+
+def caller_key(request, vapi_call_id=None, trusted_proxies=()):
+    """
+    Identifica o chamador: ID da chamada do VAPI (header ou `message.call.id`
+    do corpo, em `vapi_call_id`) ou, na falta dele, a origem (source_key).
+    O ID da chamada vem antes da chave porque o VAPI usa a mesma chave
+    (Authorization / X-Vapi-Secret) em todas as ligações. Como o ID vem do
+    chamador, o limite por ligação é sempre acompanhado de um limite maior
+    por origem (ver AdmissionControl).
+    """
+    headers = request.headers
+    vapi_call_id = headers.get("x-call-id") or headers.get("x-vapi-call-id") or vapi_call_id
+    if vapi_call_id:
+        return f"call:{vapi_call_id}"
+    return source_key(request, trusted_proxies)
+
+
+async def request_call_id(request):
+    """
+    `message.call.id` do corpo JSON da requisição do VAPI, se houver (o corpo
+    lido fica guardado no Request e é reaproveitado pelo endpoint).
+    """
+    if request.headers.get("x-call-id") or request.headers.get("x-vapi-call-id"):
+        return None
+    if "json" not in request.headers.get("content-type", ""):
+        return None
+    try:
+        return call_id(json.loads(await request.body()))
+    except ValueError:
+        return None
+
+
+class AdmissionControl:
+    """
+    Controle de admissão da API: limite de taxa por chamador em cada
+    endpoint e teto de concorrência por operação do GLPI, compartilhado
+    pelos endpoints que a usam. O excesso recebe 429 com Retry-After.
+
+    Os limites declarados em `limit()` podem ser trocados pelo ambiente:
+    RATE_LIMIT_<ENDPOINT>="taxa/rajada" (ex.: "5/10"; "0" desliga) e
+    CONCURRENCY_<OPERACAO>=teto. Os limites valem por processo: com vários
+    workers, o total é o limite vezes o número de workers.
+
+    Requisições identificadas pelo ID da ligação também gastam fichas do
+    balde da origem (credencial ou IP), com `source_factor` vezes o limite
+    do endpoint: trocar o ID a cada requisição não escapa do limite.
+    """
+
+    def __init__(self, max_waiting=10, max_wait=1.0, enabled=True, source_factor=20, trusted_proxies=()):
+        self.max_waiting = max_waiting
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self.source_factor = source_factor
+        self.trusted_proxies = tuple(trusted_proxies)
+        self._limiters = {}
+        self._source_limiters = {}
+        self._operations = {}
+
+    def rate_limiter(self, endpoint, rate=None):
+        name = endpoint.upper().replace("-", "_")
+        spec = os.getenv(f"RATE_LIMIT_{name}") or rate
+        if not spec or parse_rate(spec)[0] <= 0:
+            return None
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            rate, burst = parse_rate(spec)
+            limiter = self._limiters[endpoint] = RateLimiter(rate, burst)
+            self._source_limiters[endpoint] = RateLimiter(rate * self.source_factor, burst * self.source_factor)
+        return limiter
+
+    def check_rate(self, endpoint, request, vapi_call_id=None):
+        """
+        Gasta uma ficha do chamador (ligação ou origem) e, se ele foi
+        identificado pelo ID da ligação, outra do balde da origem.
+        """
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            return
+        key = caller_key(request, vapi_call_id, self.trusted_proxies)
+        limiter.check(key)
+        if key.startswith("call:"):
+            self._source_limiters[endpoint].check(source_key(request, self.trusted_proxies))
+
+    def operation(self, name, concurrency=None):
+        limit = self._operations.get(name)
+        if limit is None:
+            value = int(os.getenv(f"CONCURRENCY_{name.upper()}") or concurrency or 0)
+            if value <= 0:
+                return None
+            limit = self._operations[name] = ConcurrencyLimit(name, value, self.max_waiting, self.max_wait)
+        return limit
+
+    @asynccontextmanager
+    async def slot(self, operation):
+        """
+        Ocupa uma vaga da operação (ou levanta Overloaded) enquanto o bloco executa.
+        """
+        limit = self._operations.get(operation) if self.enabled and operation else None
+        if limit is None:
+            yield
+            return
+        await limit.acquire()
+        try:
+            yield
+        finally:
+            limit.release()
+
+    def limit(self, endpoint, rate=None, operation=None, concurrency=None):
+        """
+        Dependência do FastAPI para o endpoint: `rate` ("taxa/rajada") por
+        chamador e, se `operation` for informada, uma vaga da operação do
+        GLPI durante a requisição.
+        """
+        limiter = self.rate_limiter(endpoint, rate)
+        if operation:
+            self.operation(operation, concurrency)
+
+        async def admit(request: Request):
+            limit = self._operations.get(operation) if self.enabled and operation else None
+            try:
+                if self.enabled and limiter is not None:
+                    self.check_rate(endpoint, request, await request_call_id(request))
+                if limit is not None:
+                    await limit.acquire()
+            except Overloaded as e:
+                ADMISSION_REJECTED.inc(endpoint, e.reason.split(":")[0])
+                logger.warning(f"Requisição recusada em {endpoint}: {str(e)}")
+                raise HTTPException(status_code=429, detail="Muitas requisições. Tente novamente em instantes.",
+                                    headers={"Retry-After": str(e.retry_after)})
+            try:
+                yield
+            finally:
+                if limit is not None:
+                    limit.release()
+
+        return Depends(admit)
+
+    def snapshot(self):
+        return {
+            "rate_limits": {name: {"rate": limiter.rate, "burst": limiter.burst, "callers": len(limiter),
+                                   "sources": len(self._source_limiters[name])}
+                            for name, limiter in sorted(self._limiters.items())},
+            "operations": {name: limit.snapshot() for name, limit in sorted(self._operations.items())},
+        }
+
+
+def admission_from_env():
+    return AdmissionControl(
+        max_waiting=int(os.getenv("ADMISSION_MAX_WAITING", "10")),
+        max_wait=float(os.getenv("ADMISSION_MAX_WAIT", "1")),
+        enabled=os.getenv("ADMISSION_ENABLED", "1") != "0",
+        source_factor=float(os.getenv("RATE_LIMIT_SOURCE_FACTOR", "20")),
+        trusted_proxies=parse_networks(os.getenv("TRUSTED_PROXIES")),
+    )
@@ -0,0 +1,300 @@
+import os
+import json
+import asyncio
+import logging
+import secrets
+import mimetypes
+from urllib.parse import urlparse
+
+import httpx
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENTS = REGISTRY.counter("call_attachments_total", "Transcrições e gravações anexadas aos tickets.",
+                               ("kind", "result"))
+
+# Papéis das mensagens do VAPI que entram na transcrição
+SPEAKERS = {"user": "Usuário", "bot": "Assistente", "assistant": "Assistente"}
+
+
+def call_transcript(data):
+    """
+    Transcrição de uma chamada ou mensagem do VAPI: `artifact.transcript`,
+    `transcript` ou, na falta deles, montada a partir de `artifact.messages`.
+    """
+    if not isinstance(data, dict):
+        return None
+    artifact = data.get("artifact") or {}
+    transcript = artifact.get("transcript") or data.get("transcript")
+    if transcript:
+        return transcript
+    lines = [f"{SPEAKERS[m['role']]}: {m.get('message', '').strip()}"
+             for m in artifact.get("messages") or []
+             if isinstance(m, dict) and m.get("role") in SPEAKERS and m.get("message")]
+    return "\n".join(lines) or None
+
+
+def recording_url(data):
+    """
+    URL da gravação de uma chamada do VAPI (só existe depois que a ligação termina).
+    """
+    if not isinstance(data, dict):
+        return None
+    artifact = data.get("artifact") or {}
+    mono = (artifact.get("recording") or {}).get("mono") or {}
+    return artifact.get("recordingUrl") or data.get("recordingUrl") or mono.get("combinedUrl")
+
+
+class MultipartUpload:
+    """
+    Corpo multipart/form-data do upload de Document do GLPI (`uploadManifest`
+    + `filename[0]`), gerado em pedaços à medida que o httpx envia: o
+    arquivo nunca fica inteiro na memória.
+
+    `open_file()` devolve um iterador assíncrono com os bytes do arquivo.
+    O corpo pode ser percorrido de novo (o cliente GLPI reenvia a
+    requisição quando a sessão expira); cada passada abre o arquivo outra
+    vez. Com `size` conhecido o corpo vai com Content-Length, senão em
+    Transfer-Encoding: chunked.
+    """
+
+    def __init__(self, manifest, filename, content_type, open_file, size=None):
+        self.boundary = secrets.token_hex(16)
+        self.open_file = open_file
+        self.size = size
+        self.head = (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="uploadManifest"\r\n'
+            f"Content-Type: application/json\r\n\r\n"
+            f"{json.dumps(manifest, ensure_ascii=False)}\r\n"
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="filename[0]"; filename="{filename}"\r\n'
+            f"Content-Type: {content_type}\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{self.boundary}--\r\n".encode()
+
+    def headers(self):
+        headers = {"Content-Type": f"multipart/form-data; boundary={self.boundary}"}
+        if self.size is not None:
+            headers["Content-Length"] = str(len(self.head) + self.size + len(self.tail))
+        return headers
+
+    async def __aiter__(self):
+        yield self.head
+        sent = 0
+        async for chunk in self.open_file():
+            sent += len(chunk)
+            if self.size is not None and sent > self.size:
+                raise ValueError(f"Arquivo maior que o tamanho informado ({self.size} bytes)")
+            yield chunk
+        if self.size is not None and sent != self.size:
+            raise ValueError(f"Arquivo com {sent} bytes, esperado {self.size}")
+        yield self.tail
+
+
+class CallAttachments:
+    """
+    Anexa ao ticket criado pelo fluxo de voz a transcrição da ligação e,
+    opcionalmente (`recording=True`), a gravação, como Documents do GLPI.
+
+    Roda depois que o ID do ticket já foi devolvido ao VAPI: `schedule()`
+    só agenda a tarefa. Como o ticket é criado no meio da ligação, a tarefa
+    consulta a chamada na API do VAPI a cada `poll_interval` segundos, por
+    até `wait` segundos, até a ligação terminar, e usa a transcrição
+    completa e a gravação de lá. Sem a API, ou se a ligação não terminar a
+    tempo, anexa a transcrição parcial recebida junto com a ferramenta.
+
+    A gravação é baixada e enviada ao GLPI em pedaços de `chunk_size`
+    (nunca inteira na memória), com no máximo `concurrency` envios
+    simultâneos e recusada acima de `max_bytes`. Até `max_pending` tickets
+    aguardam ao mesmo tempo; o excesso fica sem anexo. As tarefas são
+    locais ao worker: no encerramento (`stop()`) quem ainda aguarda o fim
+    da ligação anexa a transcrição parcial, sem a gravação, dentro de
+    `stop_grace` segundos; só o que passar desse prazo é descartado.
+    """
+
+    def __init__(self, client_getter, vapi_url="https://api.vapi.ai", vapi_key=None, recording=False,
+                 wait=900.0, poll_interval=15.0, chunk_size=64 * 1024, max_bytes=200 * 1024 * 1024,
+                 concurrency=2, max_pending=500, timeout=120.0, stop_grace=10.0):
+        self.client_getter = client_getter
+        self.vapi_url = vapi_url.rstrip("/")
+        self.vapi_key = vapi_key
+        self.recording = recording
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.stop_grace = stop_grace
+        self.http = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0), follow_redirects=True)
+        self._uploads = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+        self.skipped = 0
+
+    def schedule(self, ticket_id, message):
+        """
+        Agenda os anexos do ticket a partir da mensagem do VAPI (dict) que o criou.
+        """
+        if not ticket_id or not isinstance(message, dict):
+            return
+        if len(self._tasks) >= self.max_pending:
+            self.skipped += 1
+            logger.warning(f"Muitos anexos pendentes; ticket {ticket_id} fica sem a transcrição.")
+            return
+        call = message.get("call") or {}
+        task = asyncio.create_task(self._attach(ticket_id, call.get("id"), call_transcript(message),
+                                                recording_url(message)))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _ended_call(self, call_id):
+        """
+        Chamada do VAPI depois de encerrada, ou None (sem API, erro ou tempo esgotado).
+        """
+        if not (call_id and self.vapi_key and self.wait > 0):
+            return None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.wait
+        while not self._stopping.is_set():
+            try:
+                response = await self.http.get(f"{self.vapi_url}/call/{call_id}",
+                                               headers={"Authorization": f"Bearer {self.vapi_key}"})
+                response.raise_for_status()
+                call = response.json()
+                if call.get("status") == "ended" or call.get("endedAt"):
+                    return call
+            except (httpx.HTTPError, ValueError) as e:
+                logger.warning(f"Falha ao consultar a chamada {call_id} no VAPI: {str(e)}")
+            if loop.time() + self.poll_interval > deadline:
+                logger.warning(f"Chamada {call_id} não terminou em {self.wait:.0f}s; anexando a transcrição parcial.")
+                return None
+            try:
+                # Acorda antes no encerramento do worker
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.warning(f"Encerrando antes do fim da chamada {call_id}; anexando a transcrição parcial.")
+        return None
+
+    async def _attach(self, ticket_id, call_id, transcript, audio_url):
+        try:
+            call = await self._ended_call(call_id)
+            partial = call is None
+            if call is not None:
+                transcript = call_transcript(call) or transcript
+                audio_url = recording_url(call) or audio_url
+            if transcript:
+                await self._run("transcript", self.upload_transcript(ticket_id, transcript, call_id, partial))
+            if self.recording and audio_url and not self._stopping.is_set():
+                await self._run("recording", self.upload_recording(ticket_id, audio_url, call_id))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Erro ao anexar a ligação ao ticket {ticket_id}: {str(e)}")
+
+    async def _run(self, kind, upload):
+        try:
+            async with self._uploads:
+                document_id = await upload
+        except Exception:
+            ATTACHMENTS.inc(kind, "erro")
+            raise
+        ATTACHMENTS.inc(kind, "ok" if document_id else "ignorado")
+
+    async def _upload(self, ticket_id, name, filename, content_type, open_file, size=None):
+        manifest = {"input": {"name": name, "_filename": [filename], "itemtype": "Ticket", "items_id": ticket_id}}
+        body = MultipartUpload(manifest, filename, content_type, open_file, size)
+        response = await self.client_getter().request("POST", "Document", content=body, headers=body.headers(),
+                                                      timeout=self.timeout)
+        if response.status_code != 201:
+            raise RuntimeError(f"Upload de {filename} recusado pelo GLPI: Status {response.status_code} - {response.text[:300]}")
+        document_id = response.json().get("id")
+        logger.info(f"{name} anexada ao ticket {ticket_id} (Document {document_id}).")
+        return document_id
+
+    async def upload_transcript(self, ticket_id, transcript, call_id=None, partial=False):
+        data = transcript.encode("utf-8")
+
+        async def open_file():
+            for start in range(0, len(data), self.chunk_size):
+                yield data[start:start + self.chunk_size]
+
+        name = "Transcrição parcial da ligação" if partial else "Transcrição da ligação"
+        return await self._upload(ticket_id, f"{name} {call_id or ''}".strip(),
+                                  f"transcricao-chamado-{ticket_id}.txt", "text/plain; charset=utf-8", open_file, len(data))
+
+    async def upload_recording(self, ticket_id, url, call_id=None):
+        size, content_type = None, None
+        try:
+            head = await self.http.head(url)
+            if head.status_code == 200:
+                size = int(head.headers["content-length"]) if head.headers.get("content-length") else None
+                content_type = head.headers.get("content-type")
+        except httpx.HTTPError:
+            pass
+        if size is not None and size > self.max_bytes:
+            logger.warning(f"Gravação do ticket {ticket_id} com {size} bytes acima do limite; não anexada.")
+            return None
+
+        async def open_file():
+            received = 0
+            async with self.http.stream("GET", url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(self.chunk_size):
+                    received += len(chunk)
+                    if received > self.max_bytes:
+                        raise ValueError(f"Gravação acima de {self.max_bytes} bytes")
+                    yield chunk
+
+        extension = os.path.splitext(urlparse(url).path)[1] or ".wav"
+        content_type = content_type or mimetypes.guess_type(f"x{extension}")[0] or "application/octet-stream"
+        return await self._upload(ticket_id, f"Gravação da ligação {call_id or ''}".strip(),
+                                  f"gravacao-chamado-{ticket_id}{extension}", content_type, open_file, size)
+
+    async def stop(self):
+        """
+        Para de esperar pelo fim das ligações, dá `stop_grace` segundos para
+        os anexos pendentes subirem a transcrição parcial, cancela o restante
+        e fecha as conexões com o VAPI.
+        """
+        self._stopping.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(list(self._tasks), timeout=self.stop_grace)
+            if pending:
+                logger.warning(f"{len(pending)} anexo(s) de ligação pendente(s) descartado(s) no encerramento.")
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+        await self.http.aclose()
+
+    def stats(self):
+        return {"pending": len(self._tasks), "skipped": self.skipped}
+
+
+def attachments_from_env(client_getter):
+    """
+    Anexos das ligações, ou None se CALL_ATTACHMENTS não for 1 ou faltar
+    VAPI_PRIVATE_KEY (chave da API do VAPI; o segredo do webhook de entrada,
+    VAPI_API_KEY, nunca é enviado para fora).
+    """
+    if os.getenv("CALL_ATTACHMENTS", "0") != "1":
+        return None
+    vapi_key = os.getenv("VAPI_PRIVATE_KEY")
+    if not vapi_key:
+        logger.warning("CALL_ATTACHMENTS=1 sem VAPI_PRIVATE_KEY; anexos das ligações desativados.")
+        return None
+    return CallAttachments(
+        client_getter,
+        vapi_url=os.getenv("VAPI_API_URL", "https://api.vapi.ai"),
+        vapi_key=vapi_key,
+        recording=os.getenv("CALL_RECORDING_UPLOAD", "0") == "1",
+        wait=float(os.getenv("CALL_ATTACHMENT_WAIT", "900")),
+        poll_interval=float(os.getenv("CALL_ATTACHMENT_POLL", "15")),
+        max_bytes=int(float(os.getenv("CALL_RECORDING_MAX_MB", "200")) * 1024 * 1024),
+        concurrency=int(os.getenv("CALL_ATTACHMENT_CONCURRENCY", "2")),
+        stop_grace=float(os.getenv("CALL_ATTACHMENT_STOP_GRACE", "10")),
+    )
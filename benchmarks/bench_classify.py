@@ -0,0 +1,78 @@
+"""
+Micro-benchmark: classify_intent antigo (varredura + substring) x CategoryClassifier.
+
+Uso:
+    python benchmarks/bench_classify.py [--leaves 5000] [--number 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from categorias import CATEGORIAS  # noqa: E402
+from classifier import CategoryClassifier  # noqa: E402
+
+TEXTOS = [
+    "infraestrutura rede sem conexão no prédio",
+    "minha impressora está sem toner, infraestrutura impressoras falta de tinta toner",
+    "a vpn não conecta desde ontem",
+    "infraestrutura servidores linux fora do ar",
+    "preciso de ajuda com o teclado e o mouse",
+    "o computador não liga",
+]
+
+
+def legacy_classify(categorias, texto, match=all):
+    # Implementação original de main.py (match=all) e chamado_api.py (match=any)
+    texto = texto.lower()
+    for key, value in sorted(categorias.items(), key=lambda x: x[0].count(' '), reverse=True):
+        if match(word in texto for word in key.split()):
+            return value
+    return categorias.get("infraestrutura", {"category_id": 1, "title": "Infraestrutura"})
+
+
+def synthetic_tree(leaves, seed=42):
+    """
+    Gera uma árvore de categorias com `leaves` folhas, no formato de CATEGORIAS.
+    """
+    rng = random.Random(seed)
+    words = [f"termo{i}" for i in range(leaves // 4 + 50)]
+    categorias = {"infraestrutura": {"category_id": 1, "title": "Infraestrutura"}}
+    while len(categorias) < leaves:
+        depth = rng.randint(1, 4)
+        key = " ".join(["infraestrutura"] + rng.sample(words, depth))
+        categorias.setdefault(key, {"category_id": len(categorias) + 1, "title": key.title()})
+    return categorias
+
+
+def bench(label, categorias, textos, number):
+    compiled = CategoryClassifier(categorias, match="all")
+    legacy_t = timeit.timeit(lambda: [legacy_classify(categorias, t) for t in textos], number=number)
+    compiled_t = timeit.timeit(lambda: compiled.classify_many(textos), number=number)
+    calls = number * len(textos)
+    print(f"{label:<28} categorias={len(categorias):>6}  "
+          f"antigo={legacy_t / calls * 1e6:9.2f} µs/texto  "
+          f"compilado={compiled_t / calls * 1e6:7.2f} µs/texto  "
+          f"ganho={legacy_t / compiled_t:7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leaves", type=int, default=5000)
+    parser.add_argument("--number", type=int, default=2000)
+    args = parser.parse_args()
+
+    build_t = timeit.timeit(lambda: CategoryClassifier(CATEGORIAS), number=100) / 100
+    print(f"compilação do índice ({len(CATEGORIAS)} categorias): {build_t * 1e3:.3f} ms")
+    bench("CATEGORIAS atual", CATEGORIAS, TEXTOS, args.number)
+
+    synthetic = synthetic_tree(args.leaves)
+    words = [k for k in synthetic if k.count(" ") >= 2][:len(TEXTOS)]
+    bench("árvore sintética", synthetic, words + TEXTOS, max(1, args.number // 50))
+
+
+if __name__ == "__main__":
+    main()
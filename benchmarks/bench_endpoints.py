@@ -0,0 +1,176 @@
+"""
+Teste de carga das tool calls contra o GLPI falso (sem rede, roda em CI).
+
+Executa a aplicação FastAPI no mesmo processo (httpx.ASGITransport) com o
+cliente GLPI apontando para benchmarks/fake_glpi.py e envia payloads no
+formato do VAPI em diferentes níveis de concorrência. Para cada endpoint
+e concorrência informa RPS, p50/p95/p99, erros e chamadas ao GLPI por
+requisição.
+
+Uso:
+    python benchmarks/bench_endpoints.py [--concurrency 1,10,50] [--requests 200]
+        [--endpoints criar_ticket,consultar_solucao,coletar_feedback,chamado]
+        [--latency 0.02] [--error-rate 0] [--admission] [--json resultado.json]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+from fake_glpi import FakeGLPI  # noqa: E402
+
+PROBLEMAS = [
+    "minha impressora está sem toner",
+    "a vpn não conecta desde ontem",
+    "infraestrutura rede sem conexão no prédio",
+    "o computador não liga",
+    "preciso de ajuda com o teclado e o mouse",
+    "infraestrutura servidores linux fora do ar",
+]
+
+
+def vapi_payload(call_id, arguments):
+    return {"message": {"type": "tool-calls", "toolCalls": [
+        {"id": call_id, "type": "function", "function": {"name": "criar_ticket", "arguments": arguments}}
+    ]}}
+
+
+def build_request(endpoint, n):
+    """
+    Monta a requisição `n` do endpoint: (caminho, argumentos do httpx).
+    """
+    problema = PROBLEMAS[n % len(PROBLEMAS)]
+    if endpoint == "criar_ticket":
+        arguments = {"nome": f"Usuário {n}", "email": f"usuario{n}@example.com", "problema": problema}
+        return "/criar_ticket", {"json": vapi_payload(f"call_{n}", arguments)}
+    if endpoint == "consultar_solucao":
+        return "/consultar_solucao", {"data": {"problema": problema}}
+    if endpoint == "coletar_feedback":
+        return "/coletar_feedback", {"json": {"nota": n % 5 + 1, "comentario": "ok", "ticket_id": str(n + 1)}}
+    if endpoint == "chamado":
+        return "/chamado", {"json": {"texto": problema}}
+    raise ValueError(f"Endpoint desconhecido: {endpoint}")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def run_level(client, fake, endpoint, concurrency, total, offset):
+    """
+    Envia `total` requisições com `concurrency` clientes simultâneos.
+    `offset` mantém os IDs de tool call únicos entre as rodadas.
+    """
+    latencies, errors = [], 0
+    before = sum(fake.calls.values())
+    counter = itertools.count(offset)
+
+    async def worker():
+        nonlocal errors
+        while True:
+            n = next(counter)
+            if n >= offset + total:
+                return
+            path, kwargs = build_request(endpoint, n)
+            started = time.perf_counter()
+            response = await client.post(path, **kwargs)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "endpoint": endpoint,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "errors": errors,
+        "upstream_per_request": round((sum(fake.calls.values()) - before) / max(1, len(latencies)), 3),
+    }
+
+
+def load_app(fake, **env):
+    """
+    Importa a aplicação com o cliente GLPI apontando para o GLPI falso e
+    estado local (SQLite) em um diretório temporário. `env` sobrepõe o ambiente.
+
+    O controle de admissão fica desligado (senão o teste de carga mede só os
+    429 de um único chamador); passe ADMISSION_ENABLED="1" para medi-lo.
+    """
+    # A aplicação lê a configuração do ambiente na importação
+    workdir = tempfile.mkdtemp(prefix="bench_endpoints_")
+    os.environ.update({
+        "GLPI_URL": "http://fake-glpi/apirest.php",
+        "GLPI_APP_TOKEN": "bench-app-token",
+        "GLPI_USER_TOKEN": "bench-user-token",
+        "VAPI_API_KEY": "bench-vapi-key",
+        "KB_MIRROR_ENABLED": "0",
+        "CAPTURE_FILE": "",
+        "SHARED_STORE_PATH": "",
+        "ADMISSION_ENABLED": "0",
+        "FEEDBACK_DB_PATH": os.path.join(workdir, "feedback.db"),
+        "TICKET_QUEUE_PATH": os.path.join(workdir, "ticket_queue.db"),
+        **env,
+    })
+    import glpi_client
+    glpi_client._client = glpi_client.client_from_env(transport=httpx.ASGITransport(app=fake.app))
+    import main
+    return main
+
+
+async def run(args):
+    fake = FakeGLPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=42)
+    main = load_app(fake, ADMISSION_ENABLED="1" if args.admission else "0")
+
+    results = []
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+            for endpoint in args.endpoints:
+                for concurrency in args.concurrency:
+                    offset = len(results) * args.requests
+                    results.append(await run_level(client, fake, endpoint, concurrency, args.requests, offset))
+                    print(format_row(results[-1]))
+    print(f"Chamadas ao GLPI falso por operação: {dict(fake.calls)}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"latency": args.latency, "error_rate": args.error_rate, "results": results}, f, indent=2)
+
+
+def format_row(r):
+    return (f"{r['endpoint']:<18} c={r['concurrency']:<4} n={r['requests']:<5} "
+            f"rps={r['rps']:>8}  p50={r['p50_ms']:>8}ms  p95={r['p95_ms']:>8}ms  p99={r['p99_ms']:>8}ms  "
+            f"erros={r['errors']:<4} glpi/req={r['upstream_per_request']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga das tool calls contra o GLPI falso.")
+    parser.add_argument("--endpoints", default="criar_ticket,consultar_solucao,coletar_feedback,chamado",
+                        type=lambda s: s.split(","))
+    parser.add_argument("--concurrency", default="1,10,50", type=lambda s: [int(c) for c in s.split(",")])
+    parser.add_argument("--requests", type=int, default=200, help="requisições por endpoint e concorrência")
+    parser.add_argument("--latency", type=float, default=0.02, help="latência do GLPI falso (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--admission", action="store_true",
+                        help="mantém o controle de admissão (limites por chamador e 429) ligado")
+    parser.add_argument("--json", help="grava os resultados neste arquivo (linha de base para comparação)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+GLPI falso (em memória) para testes de carga e benchmarks sem um GLPI real.
+
+Implementa o subconjunto da API REST usado pela aplicação: initSession,
+killSession, Ticket (input único ou em lista), TicketFollowup, Solution,
+Document (upload multipart), search/<itemtype> e GET <itemtype>/<id>. Latência e erros podem ser
+injetados por operação.
+
+Uso como servidor:
+    python benchmarks/fake_glpi.py --port 8081 --latency 0.05 --error-rate 0.01
+    GLPI_URL=http://127.0.0.1:8081/apirest.php uvicorn main:app
+
+Uso no mesmo processo (ver bench_endpoints.py):
+    fake = FakeGLPI(latency=0.05)
+    transport = httpx.ASGITransport(app=fake.app)
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import secrets
+import time
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+SOLUCOES = [
+    "Reinicie o roteador e aguarde dois minutos antes de testar a conexão.",
+    "Verifique se a impressora está ligada à rede e troque o toner se necessário.",
+    "Reinstale o cliente da VPN e confirme o usuário no AD.",
+    "Limpe o cache do navegador e tente acessar o sistema novamente.",
+    "Confira se o cabo de energia do computador está conectado à tomada.",
+]
+
+
+class FakeGLPI:
+    """
+    Estado e regras do GLPI falso.
+
+    `latency` e `error_rate` aceitam um número (todas as operações) ou um
+    dicionário por operação (ex.: {"Ticket": 0.2}). `calls` conta as
+    chamadas recebidas por operação. Com `reject` (função do item), um POST
+    com algum item rejeitado falha inteiro com 400, como o GLPI faz.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reject = None
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.sessions = set()
+        self.tickets = {}
+        self.followups = []
+        self.documents = []
+        self.solutions = [
+            {"id": i + 1, "content": content, "date_mod": "2024-01-01 00:00:00"}
+            for i, content in enumerate(SOLUCOES)
+        ]
+        self._ids = itertools.count(1)
+        self.app = self._build_app()
+
+    def _option(self, value, operation):
+        if isinstance(value, dict):
+            return value.get(operation, value.get("*", 0.0))
+        return value
+
+    async def _simulate(self, operation):
+        """
+        Conta a chamada, aplica a latência e decide se deve falhar.
+        """
+        self.calls[operation] += 1
+        delay = self._option(self.latency, operation)
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        if self.random.random() < self._option(self.error_rate, operation):
+            return JSONResponse(["ERROR_GLPI_FAKE", "Erro injetado pelo GLPI falso"], status_code=self.error_status)
+        return None
+
+    def _check_session(self, request):
+        if request.headers.get("Session-Token") not in self.sessions:
+            return JSONResponse(["ERROR_SESSION_TOKEN_INVALID", "session_token seems invalid"], status_code=401)
+        return None
+
+    def expire_sessions(self):
+        """
+        Invalida todos os tokens (simula expiração de sessão no GLPI).
+        """
+        self.sessions.clear()
+
+    def _create(self, itemtype, data):
+        item_id = next(self._ids)
+        if itemtype == "Ticket":
+            now = time.strftime("%Y-%m-%d %H:%M:%S")
+            self.tickets[item_id] = {"id": item_id, "status": 1, "date_creation": now, "date_mod": now, **data}
+        else:
+            self.followups.append({"id": item_id, **data})
+        return {"id": item_id, "message": f"Item {item_id} adicionado"}
+
+    def _search_rows(self, itemtype):
+        if itemtype == "Ticket":
+            return [{"2": t["id"], "1": t.get("name", ""), "12": t["status"], "15": t["date_creation"],
+                     "21": t.get("content", ""),
+                     "19": t["date_mod"]}
+                    for t in self.tickets.values()]
+        if itemtype in ("ITILSolution", "KnowbaseItem", "Solution"):
+            return [{"2": s["id"], "1": s["content"], "6": s["content"], "7": s["content"], "19": s["date_mod"]}
+                    for s in self.solutions]
+        return []
+
+    def _build_app(self):
+        app = FastAPI(title="GLPI falso")
+
+        @app.post("/apirest.php/initSession")
+        async def init_session(request: Request):
+            error = await self._simulate("initSession")
+            if error is not None:
+                return error
+            if not request.headers.get("App-Token"):
+                return JSONResponse(["ERROR_APP_TOKEN_PARAMETERS_MISSING", ""], status_code=400)
+            token = secrets.token_hex(13)
+            self.sessions.add(token)
+            return {"session_token": token}
+
+        @app.get("/apirest.php/killSession")
+        async def kill_session(request: Request):
+            error = await self._simulate("killSession")
+            if error is not None:
+                return error
+            self.sessions.discard(request.headers.get("Session-Token"))
+            return {}
+
+        @app.post("/apirest.php/Solution")
+        async def solution(request: Request):
+            error = await self._simulate("Solution") or self._check_session(request)
+            if error is not None:
+                return error
+            return {"data": [{"id": s["id"], "content": s["content"]} for s in self.solutions[:1]]}
+
+        @app.post("/apirest.php/Document")
+        async def document(request: Request):
+            error = await self._simulate("Document") or self._check_session(request)
+            if error is not None:
+                return error
+            # Lê o multipart em pedaços, como o GLPI: só o manifesto (início do corpo) é guardado
+            head, size = b"", 0
+            async for chunk in request.stream():
+                size += len(chunk)
+                if len(head) < 4096:
+                    head += chunk[:4096 - len(head)]
+            manifest = head.split(b"\r\n\r\n", 1)[-1].split(b"\r\n", 1)[0]
+            try:
+                data = json.loads(manifest).get("input") or {}
+            except ValueError:
+                return JSONResponse(["ERROR_UPLOAD_FILE_TOO_BIG_POST_MAX_SIZE", "manifesto inválido"], status_code=400)
+            item_id = next(self._ids)
+            self.documents.append({"id": item_id, "bytes": size, **data})
+            return JSONResponse({"id": item_id, "message": f"Documento {item_id} adicionado"}, status_code=201)
+
+        @app.get("/apirest.php/search/{itemtype}")
+        async def search(itemtype: str, request: Request):
+            error = await self._simulate(f"search/{itemtype}") or self._check_session(request)
+            if error is not None:
+                return error
+            rows = self._search_rows(itemtype)
+            start, _, end = request.query_params.get("range", "0-49").partition("-")
+            start, end = int(start), int(end or start)
+            page = rows[start:end + 1]
+            headers = {"Content-Range": f"{start}-{start + len(page) - 1}/{len(rows)}"}
+            status = 200 if len(page) == len(rows) else 206
+            return JSONResponse({"totalcount": len(rows), "count": len(page), "data": page},
+                                status_code=status, headers=headers)
+
+        @app.post("/apirest.php/{itemtype}")
+        async def create(itemtype: str, request: Request):
+            error = await self._simulate(itemtype) or self._check_session(request)
+            if error is not None:
+                return error
+            data = (await request.json()).get("input")
+            items = data if isinstance(data, list) else [data or {}]
+            if self.reject is not None and any(self.reject(item) for item in items):
+                return JSONResponse(["ERROR_GLPI_ADD", "Item inválido"], status_code=400)
+            if isinstance(data, list):
+                return JSONResponse([self._create(itemtype, item) for item in data], status_code=201)
+            return JSONResponse(self._create(itemtype, data or {}), status_code=201)
+
+        @app.get("/apirest.php/{itemtype}/{item_id}")
+        async def get_item(itemtype: str, item_id: int, request: Request):
+            error = await self._simulate(itemtype) or self._check_session(request)
+            if error is not None:
+                return error
+            item = self.tickets.get(item_id) if itemtype == "Ticket" else None
+            if item is None:
+                return JSONResponse(["ERROR_ITEM_NOT_FOUND", ""], status_code=404)
+            return item
+
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GLPI falso para testes de carga.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="latência fixa por chamada (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="latência aleatória adicional (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fração de chamadas que falham")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    fake = FakeGLPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    uvicorn.run(fake.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Reproduz o tráfego capturado em produção (CAPTURE_FILE, ver capture.py)
+contra a aplicação, para medir mudanças de desempenho com o mix real de
+chamadas antes do deploy.
+
+Por padrão a aplicação roda no mesmo processo (httpx.ASGITransport) com o
+GLPI falso de benchmarks/fake_glpi.py; com --target as requisições vão
+para uma instância já em execução (ex.: uvicorn apontando para o GLPI
+falso rodando como servidor).
+
+As requisições saem nos mesmos intervalos da captura divididos por
+--speed (1 = tempo real, 10 = dez vezes mais rápido) ou, com
+--speed max, todas de uma vez; em ambos os casos com no máximo
+--concurrency simultâneas. Pausas
+maiores que --max-gap segundos (madrugada, por exemplo) são encurtadas.
+Cada requisição leva o pseudônimo do chamador original no X-Call-Id, de
+modo que, com --admission, os limites por chamador se comportam como na
+captura (sem a opção o controle de admissão fica desligado).
+
+Ao final, por endpoint: latência capturada x reproduzida (p50/p95/p99),
+erros e as mudanças de status em relação à captura (ex.: 200 -> 429).
+
+Uso:
+    python benchmarks/replay.py data/capture.jsonl data/capture.*.jsonl.gz
+        [--speed 1|N|max] [--concurrency 50] [--max-gap 10] [--limit N]
+        [--paths /criar_ticket,/coletar_feedback] [--target http://127.0.0.1:8000]
+        [--latency 0.02] [--error-rate 0] [--admission] [--json resultado.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+from bench_endpoints import load_app, percentile  # noqa: E402
+from capture import read_capture  # noqa: E402
+from fake_glpi import FakeGLPI  # noqa: E402
+
+# Quantos detalhes de erro distintos mostrar por endpoint
+ERROR_SAMPLES = 3
+
+
+def schedule(records, speed, max_gap):
+    """
+    Instante (s desde o início do replay) de cada registro, ou 0 com speed=None (máximo).
+    """
+    offsets, elapsed = [], 0.0
+    for previous, record in zip([None] + records[:-1], records):
+        if speed and previous is not None:
+            gap = record["ts"] - previous["ts"]
+            if max_gap:
+                gap = min(gap, max_gap)
+            elapsed += max(0.0, gap) / speed
+        offsets.append(elapsed)
+    return offsets
+
+
+def build_request(record):
+    """
+    Argumentos do httpx para reenviar o registro.
+    """
+    headers = dict(record.get("headers") or {})
+    headers.setdefault("x-call-id", record["caller"])
+    kwargs = {"headers": headers}
+    if record.get("query"):
+        kwargs["params"] = record["query"]
+    kind, body = record.get("kind"), record.get("body")
+    if kind == "json":
+        kwargs["content"] = json.dumps(body, ensure_ascii=False).encode()
+        headers.setdefault("content-type", "application/json")
+    elif kind == "form":
+        kwargs["data"] = body
+        headers.pop("content-type", None)
+    elif kind == "text":
+        kwargs["content"] = body.encode()
+    return kwargs
+
+
+async def replay(client, records, offsets, concurrency):
+    """
+    Envia os registros nos instantes de `offsets`. Retorna uma lista de
+    (registro, status, latência em s, detalhe do erro, atraso do agendamento em s).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+
+    async def send(record, offset):
+        delay = offset - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            lag = max(0.0, time.perf_counter() - started - offset)
+            sent = time.perf_counter()
+            try:
+                response = await client.request(record["method"], record["path"], **build_request(record))
+                status = response.status_code
+                error = response.text[:300] if status >= 400 else None
+            except httpx.HTTPError as e:
+                status, error = 0, f"{type(e).__name__}: {str(e)}"
+            return record, status, time.perf_counter() - sent, error, lag
+
+    return await asyncio.gather(*(send(r, o) for r, o in zip(records, offsets))), time.perf_counter() - started
+
+
+def summarize(results):
+    by_path = defaultdict(list)
+    for result in results:
+        by_path[result[0]["path"]].append(result)
+    summary = []
+    for path, items in sorted(by_path.items()):
+        captured = [r["ms"] / 1000 for r, *_ in items if r.get("ms") is not None]
+        latencies = [latency for _, _, latency, _, _ in items]
+        changes = Counter((r["status"], status) for r, status, *_ in items if r.get("status") != status)
+        errors = Counter(error for _, status, _, error, _ in items if status >= 400 or status == 0)
+        summary.append({
+            "path": path,
+            "requests": len(items),
+            "captured": {f"p{int(q * 100)}_ms": round(percentile(captured, q) * 1000, 2) for q in (0.5, 0.95, 0.99)},
+            "replayed": {f"p{int(q * 100)}_ms": round(percentile(latencies, q) * 1000, 2) for q in (0.5, 0.95, 0.99)},
+            "captured_errors": sum(1 for r, *_ in items if r.get("status", 0) >= 400),
+            "errors": sum(errors.values()),
+            "status_changes": {f"{before} -> {after}": n for (before, after), n in changes.most_common()},
+            "error_samples": [e for e, _ in errors.most_common(ERROR_SAMPLES)],
+        })
+    return summary
+
+
+def print_summary(summary, elapsed, span, lags):
+    print(f"Reproduzidas {sum(s['requests'] for s in summary)} requisições em {elapsed:.1f}s "
+          f"(captura de {span:.1f}s); atraso do agendamento p99={percentile(lags, 0.99) * 1000:.1f}ms")
+    for s in summary:
+        c, r = s["captured"], s["replayed"]
+        print(f"{s['path']:<20} n={s['requests']:<6} "
+              f"capturado p50/p95/p99={c['p50_ms']}/{c['p95_ms']}/{c['p99_ms']}ms  "
+              f"replay p50/p95/p99={r['p50_ms']}/{r['p95_ms']}/{r['p99_ms']}ms  "
+              f"erros {s['captured_errors']} -> {s['errors']}")
+        for change, n in s["status_changes"].items():
+            print(f"    status {change}: {n}")
+        for sample in s["error_samples"]:
+            print(f"    erro: {sample}")
+
+
+async def run(args):
+    records = read_capture(args.files)
+    if args.paths:
+        records = [r for r in records if r["path"] in args.paths]
+    records = [r for r in records if r.get("kind") != "omitted"][:args.limit or None]
+    if not records:
+        sys.exit("Nenhum registro para reproduzir.")
+    offsets = schedule(records, args.speed, args.max_gap)
+
+    if args.target:
+        async with httpx.AsyncClient(base_url=args.target, timeout=60) as client:
+            results, elapsed = await replay(client, records, offsets, args.concurrency)
+    else:
+        fake = FakeGLPI(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=42)
+        main = load_app(fake, REQUESTER_PRELOAD_INTERVAL="0", ADMISSION_ENABLED="1" if args.admission else "0")
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://app", timeout=60) as client:
+                results, elapsed = await replay(client, records, offsets, args.concurrency)
+        print(f"Chamadas ao GLPI falso por operação: {dict(fake.calls)}")
+
+    summary = summarize(results)
+    print_summary(summary, elapsed, records[-1]["ts"] - records[0]["ts"], [lag for *_, lag in results])
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"speed": args.speed or "max", "target": args.target or "in-process",
+                       "elapsed_s": round(elapsed, 2), "results": summary}, f, indent=2, ensure_ascii=False)
+
+
+def parse_speed(value):
+    return None if value == "max" else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz o tráfego capturado contra a aplicação.")
+    parser.add_argument("files", nargs="+", help="arquivos de captura (.jsonl e segmentos .jsonl.gz)")
+    parser.add_argument("--speed", default="1", type=parse_speed, help='multiplicador de velocidade ou "max"')
+    parser.add_argument("--concurrency", type=int, default=50, help="requisições simultâneas no máximo")
+    parser.add_argument("--max-gap", type=float, default=10.0, help="pausa máxima entre requisições (s; 0 = sem limite)")
+    parser.add_argument("--limit", type=int, default=0, help="reproduz só os primeiros N registros")
+    parser.add_argument("--paths", type=lambda s: set(s.split(",")), help="só estes endpoints")
+    parser.add_argument("--target", help="URL de uma instância em execução (padrão: aplicação no processo)")
+    parser.add_argument("--latency", type=float, default=0.02, help="latência do GLPI falso (s)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--admission", action="store_true",
+                        help="mantém o controle de admissão ligado (no processo; com --target vale o da instância)")
+    parser.add_argument("--json", help="grava o resumo neste arquivo (linha de base para comparação)")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+from classifier import tokenize
+from tracing import span
+
+
+def normalize_key(texto):
+    """
+    Chave de cache independente de acentos, caixa e pontuação.
+    """
+    return " ".join(tokenize(texto))
+
+
+class TTLCache:
+    """
+    Cache em memória com expiração (TTL) e descarte LRU, limitado a `maxsize`.
+
+    get_or_load() agrupa misses concorrentes da mesma chave: apenas a primeira
+    requisição chama o loader, as demais aguardam o mesmo resultado.
+    Com um `backend` compartilhado (ex.: store.SQLiteStore) as entradas também
+    são gravadas/lidas nele, permitindo que vários workers reaproveitem o
+    resultado. Erros do loader não são armazenados. `local_ttl` limita a
+    cópia local de cada worker (0 = sempre consulta o backend), para que um
+    delete() em um worker valha logo para os demais.
+
+    get/set/delete acessam o backend na própria thread; no event loop use
+    get_async/set_async/delete_async, que levam o acesso ao backend (SQLite)
+    para uma thread.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0, backend=None, local_ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.backend = backend
+        self.local_ttl = local_ttl
+        self._data = OrderedDict()
+        self._inflight = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.coalesced = 0
+        self.backend_hits = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def _get_local(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def _set_local(self, key, value, ttl):
+        if self.backend is not None and self.local_ttl is not None:
+            ttl = min(ttl, self.local_ttl)
+            if ttl <= 0:
+                self._data.pop(key, None)
+                return
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        item = self._get_local(key)
+        if item is not None:
+            self.hits += 1
+            return item[0]
+        if self.backend is not None:
+            value = self.backend.get(key)
+            if value is not None:
+                self.hits += 1
+                self.backend_hits += 1
+                self._set_local(key, value, self.ttl)
+                return value
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._set_local(key, value, ttl)
+        if self.backend is not None:
+            self.backend.set(key, value, ttl)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+        if self.backend is not None:
+            self.backend.delete(key)
+
+    async def get_async(self, key, default=None):
+        item = self._get_local(key)
+        if item is not None or self.backend is None:
+            return self.get(key, default)
+        value = await asyncio.to_thread(self.backend.get, key)
+        if value is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.backend_hits += 1
+        self._set_local(key, value, self.ttl)
+        return value
+
+    async def set_async(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._set_local(key, value, ttl)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.set, key, value, ttl)
+
+    async def delete_async(self, key):
+        self._data.pop(key, None)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.delete, key)
+
+    async def _load(self, key, loader, ttl):
+        try:
+            value = await loader()
+            if value is not None:
+                await self.set_async(key, value, ttl(value) if callable(ttl) else ttl)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def get_or_load(self, key, loader, ttl=None):
+        """
+        Retorna o valor em cache ou chama `loader()` (corrotina) uma única vez por chave.
+        `ttl` pode ser uma função do valor carregado (ex.: prazo menor para "não encontrado").
+
+        A carga roda em uma tarefa própria, compartilhada por todos que pedem a
+        chave: quem desiste de esperar (prazo estourado, cliente desconectado)
+        só deixa de aguardar, sem cancelar a carga dos demais, que termina e
+        preenche o cache.
+        """
+        with span("cache.get_or_load") as cache_span:
+            value = await self.get_async(key)
+            cache_span.set("cache.hit", value is not None)
+            if value is not None:
+                return value
+            task = self._inflight.get(key)
+            if task is not None:
+                self.coalesced += 1
+                cache_span.set("cache.coalesced", True)
+            else:
+                task = self._inflight[key] = asyncio.ensure_future(self._load(key, loader, ttl))
+                # Evita o aviso "exception was never retrieved" quando todos desistiram de esperar
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            return await asyncio.shield(task)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "coalesced": self.coalesced,
+            "backend_hits": self.backend_hits,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,329 @@
+import os
+import re
+import glob
+import gzip
+import hmac
+import json
+import time
+import queue
+import atexit
+import random
+import hashlib
+import logging
+import secrets
+import threading
+from urllib.parse import parse_qsl
+
+from starlette.requests import Request
+
+from admission import caller_key
+from logging_config import redact
+from tracing import call_id, sampled_for, trace_id_for
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATHS = ("/criar_ticket", "/consultar_solucao", "/coletar_feedback", "/vapi/tool-calls")
+
+# Headers que influenciam a resposta e não identificam ninguém
+KEPT_HEADERS = ("content-type", "x-deadline-ms", "x-call-id", "x-vapi-call-id")
+
+# Chaves cujo valor identifica a pessoa: trocado por um pseudônimo estável
+PERSONAL_KEYS = {"nome", "telefone", "phone", "phonenumber", "number", "cpf", "usuario", "username"}
+# Objetos inteiros com dados pessoais (ex.: message.call.customer do VAPI)
+PERSONAL_OBJECTS = {"customer"}
+EMAIL_KEYS = {"email", "e-mail", "alternative_email"}
+SECRET_KEYS = {"authorization", "password", "senha", "token", "secret", "api_key", "apikey"}
+
+# Sequências longas de dígitos em texto livre (telefone, CPF, cartão)
+_DIGITS_RE = re.compile(r"\d[\d .-]{6,}\d")
+
+# Tamanho máximo do detalhe de erro guardado da resposta
+ERROR_MAX_CHARS = 300
+
+
+class Redactor:
+    """
+    Remove dados pessoais dos corpos capturados sem mudar a forma deles:
+    nomes, telefones e e-mails viram pseudônimos estáveis (o mesmo e-mail
+    vira sempre o mesmo endereço, então caches e limites por chamador se
+    comportam como em produção), segredos viram "***" e o texto livre passa
+    pela mesma máscara dos logs, com as sequências longas de dígitos zeradas.
+
+    Os pseudônimos usam HMAC com `salt` (CAPTURE_SALT); sem ele a chave é
+    sorteada e só vale dentro do processo.
+    """
+
+    def __init__(self, salt=None):
+        self.salt = (salt or secrets.token_hex(16)).encode()
+
+    def pseudonym(self, value, prefix="anon"):
+        digest = hmac.new(self.salt, str(value).strip().lower().encode(), hashlib.sha256).hexdigest()[:10]
+        return f"{prefix}-{digest}"
+
+    def email(self, value):
+        return f"{self.pseudonym(value, 'u')}@example.com" if value else value
+
+    def text(self, value):
+        return _DIGITS_RE.sub(lambda m: re.sub(r"\d", "0", m.group(0)), redact(value))
+
+    def value(self, value, key=None, personal=False):
+        key = (key or "").lower()
+        if isinstance(value, dict):
+            personal = personal or key in PERSONAL_OBJECTS
+            return {k: self.value(v, k, personal) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.value(v, key, personal) for v in value]
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        value = str(value)
+        if key in SECRET_KEYS:
+            return "***"
+        if key in EMAIL_KEYS or (personal and "@" in value):
+            return self.email(value)
+        if personal or key in PERSONAL_KEYS:
+            return self.pseudonym(value)
+        if key == "arguments" and value.lstrip().startswith("{"):
+            # Argumentos de ferramenta às vezes chegam como JSON em texto
+            try:
+                return json.dumps(self.value(json.loads(value)), ensure_ascii=False)
+            except ValueError:
+                pass
+        return self.text(value)
+
+
+class CaptureWriter:
+    """
+    Grava os registros em JSONL compacto. A requisição só coloca o registro
+    em uma fila limitada (cheia, ele é descartado e contado); uma thread
+    separada escreve e, quando o arquivo passa de `max_bytes`, o fecha em
+    um segmento .gz com data e hora, mantendo os `backups` mais recentes.
+    """
+
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, backups=10, interval=1.0, max_queue=10000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.interval = interval
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="capture-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def write(self, record):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _segments(self):
+        root, ext = os.path.splitext(self.path)
+        return sorted(glob.glob(f"{glob.escape(root)}.*{ext}.gz"))
+
+    def _rotate(self):
+        root, ext = os.path.splitext(self.path)
+        segment = f"{root}.{time.strftime('%Y%m%d-%H%M%S')}-{self.rotations}{ext}.gz"
+        with open(self.path, "rb") as src, gzip.open(segment, "wb") as dst:
+            while chunk := src.read(1024 * 1024):
+                dst.write(chunk)
+        os.remove(self.path)
+        self.rotations += 1
+        for old in self._segments()[:-self.backups or None]:
+            os.remove(old)
+
+    def flush(self):
+        lines = []
+        while True:
+            try:
+                lines.append(json.dumps(self._queue.get_nowait(), ensure_ascii=False, separators=(",", ":")))
+            except queue.Empty:
+                break
+        if not lines:
+            return
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            self.written += len(lines)
+            if self.max_bytes and os.path.getsize(self.path) >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            logger.warning(f"Falha ao gravar a captura de tráfego: {str(e)}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.interval)
+            self.flush()
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+
+
+class CaptureMiddleware:
+    """
+    Middleware ASGI que grava as requisições de `paths` (corpo redigido,
+    chamador pseudonimizado, status, duração e detalhe dos erros) para
+    reproduzir a carga real com benchmarks/replay.py.
+
+    Amostra por ligação (`sample_rate`, pelo ID da chamada do VAPI, como o
+    tracing) para manter o encadeamento das ferramentas de cada ligação.
+    Corpos maiores que `max_body` são registrados sem o corpo.
+    """
+
+    def __init__(self, app, writer=None, redactor=None, paths=DEFAULT_PATHS, sample_rate=1.0, max_body=65536):
+        self.app = app
+        self.writer = writer
+        self.redactor = redactor or Redactor()
+        self.paths = set(paths)
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+
+    async def _read_body(self, receive):
+        chunks, more = [], True
+        while more:
+            message = await receive()
+            if message["type"] != "http.request":
+                return None, message
+            chunks.append(message.get("body", b""))
+            more = message.get("more_body", False)
+        return b"".join(chunks), None
+
+    def _vapi_call(self, body, headers):
+        vapi_call = headers.get("x-vapi-call-id") or headers.get("x-call-id")
+        if not vapi_call and body and body.lstrip().startswith(b"{"):
+            try:
+                vapi_call = call_id(json.loads(body))
+            except ValueError:
+                pass
+        return vapi_call
+
+    def _sampled(self, vapi_call):
+        if self.sample_rate >= 1:
+            return True
+        if vapi_call:
+            return sampled_for(trace_id_for(vapi_call), self.sample_rate)
+        return random.random() < self.sample_rate
+
+    def _body(self, body, content_type):
+        if not body:
+            return None, None
+        if len(body) > self.max_body:
+            return "omitted", None
+        text = body.decode("utf-8", errors="replace")
+        if "application/x-www-form-urlencoded" in content_type:
+            return "form", self.redactor.value(dict(parse_qsl(text, keep_blank_values=True)))
+        try:
+            return "json", self.redactor.value(json.loads(text))
+        except ValueError:
+            return "text", self.redactor.text(text)
+
+    async def __call__(self, scope, receive, send):
+        if self.writer is None or scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        started = time.time()
+        body, pending = await self._read_body(receive)
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        vapi_call = self._vapi_call(body, headers)
+        if pending is not None or not self._sampled(vapi_call):
+            await self.app(scope, _replay_receive(body or b"", pending, receive), send)
+            return
+
+        status, error = 500, bytearray()
+
+        async def send_capturing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and status >= 400 and len(error) < ERROR_MAX_CHARS:
+                error.extend(message.get("body", b"")[:ERROR_MAX_CHARS - len(error)])
+            await send(message)
+
+        try:
+            await self.app(scope, _replay_receive(body, None, receive), send_capturing)
+        finally:
+            kind, captured = self._body(body, headers.get("content-type", ""))
+            record = {
+                "ts": round(started, 3),
+                "method": scope["method"],
+                "path": scope["path"],
+                "caller": self.redactor.pseudonym(caller_key(Request(scope), vapi_call), "caller"),
+                "headers": {k: headers[k] for k in KEPT_HEADERS if k in headers},
+                "status": status,
+                "ms": round((time.time() - started) * 1000, 1),
+            }
+            if scope.get("query_string"):
+                record["query"] = self.redactor.text(scope["query_string"].decode("latin-1"))
+            if kind:
+                record["kind"] = kind
+            if captured is not None:
+                record["body"] = captured
+            if error:
+                record["error"] = self.redactor.text(error.decode("utf-8", errors="replace"))
+            self.writer.write(record)
+
+
+def _replay_receive(body, pending, receive):
+    """
+    `receive` que entrega à aplicação o corpo já lido pelo middleware.
+    """
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return pending or {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return replay
+
+
+def capture_from_env():
+    """
+    Argumentos do CaptureMiddleware a partir do ambiente. A captura é opcional:
+    sem CAPTURE_FILE o middleware não faz nada. "{pid}" no caminho separa o
+    arquivo de cada worker.
+    """
+    path = os.getenv("CAPTURE_FILE", "")
+    if not path:
+        return {"writer": None}
+    writer = CaptureWriter(
+        path.replace("{pid}", str(os.getpid())),
+        max_bytes=int(float(os.getenv("CAPTURE_MAX_MB", "50")) * 1024 * 1024),
+        backups=int(os.getenv("CAPTURE_BACKUPS", "10")),
+    )
+    paths = [p.strip() for p in os.getenv("CAPTURE_PATHS", "").split(",") if p.strip()] or DEFAULT_PATHS
+    logger.warning(f"Captura de tráfego ligada em {writer.path} para {', '.join(paths)}.")
+    return {
+        "writer": writer,
+        "redactor": Redactor(os.getenv("CAPTURE_SALT") or None),
+        "paths": paths,
+        "sample_rate": float(os.getenv("CAPTURE_SAMPLE_RATE", "1")),
+        "max_body": int(os.getenv("CAPTURE_MAX_BODY", "65536")),
+    }
+
+
+def read_capture(paths):
+    """
+    Lê os registros dos arquivos de captura (.jsonl e segmentos .jsonl.gz), em ordem de chegada.
+    """
+    records = []
+    for path in paths:
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Última linha incompleta de um arquivo ainda em gravação
+                        continue
+    return sorted(records, key=lambda r: r["ts"])
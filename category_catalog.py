@@ -0,0 +1,221 @@
+import os
+import re
+import json
+import asyncio
+import logging
+
+from categorias import CATEGORIAS
+from classifier import CategoryClassifier
+from store import shared_store_from_env
+
+logger = logging.getLogger(__name__)
+
+# Campos da busca de ITILCategory: 1 = nome completo ("Pai > Filho"), 2 = ID, 19 = data de modificação
+FIELD_COMPLETENAME = 1
+FIELD_ID = 2
+FIELD_DATE_MOD = 19
+
+_SEPARATORS_RE = re.compile(r"[\s>/]+")
+
+
+def category_key(completename):
+    """
+    Chave no formato de CATEGORIAS: "Infraestrutura > Firewall/Security" -> "infraestrutura firewall security".
+    """
+    return _SEPARATORS_RE.sub(" ", completename.lower()).strip()
+
+
+def build_categorias(categories):
+    """
+    Converte {id: (completename, date_mod)} no formato de CATEGORIAS, em ordem de nome completo.
+    """
+    categorias = {}
+    for category_id, (completename, _) in sorted(categories.items(), key=lambda item: item[1][0].lower()):
+        key = category_key(completename)
+        if key:
+            categorias.setdefault(key, {"category_id": category_id, "title": completename})
+    return categorias
+
+
+class CategoryCatalog:
+    """
+    Árvore de categorias ITIL carregada do GLPI, com o classificador de intenção.
+
+    Na inicialização usa o snapshot em disco (ou CATEGORIAS, se ainda não
+    houver snapshot), sem acessar a rede. Em segundo plano busca no GLPI
+    apenas as categorias com date_mod maior que a marca d'água, paginando e
+    pedindo só os campos usados; a cada `full_every` rodadas faz uma carga
+    completa para descobrir categorias removidas. Quando a árvore muda, o
+    classificador é reconstruído fora do event loop e trocado de uma vez:
+    a classificação nunca espera pelo GLPI.
+
+    Com um `lock_store` compartilhado, só um worker consulta o GLPI por
+    rodada; os demais recarregam o snapshot quando ele muda.
+    """
+
+    def __init__(self, snapshot_path, match="all", interval=600, page_size=200, full_every=12, lock_store=None):
+        self.snapshot_path = snapshot_path
+        self.match = match
+        self.interval = interval
+        self.page_size = page_size
+        self.full_every = max(1, full_every)
+        self.lock_store = lock_store
+        self.watermark = None
+        self._categories = {}
+        self._snapshot_mtime = None
+        self._task = None
+        # Com snapshot, a primeira rodada já pode ser incremental
+        self._rounds = 1 if self._load_snapshot() else 0
+        if not self._categories:
+            self._categories = {v["category_id"]: (v["title"], None) for v in CATEGORIAS.values()}
+        self.classifier = CategoryClassifier(build_categorias(self._categories), match=match)
+
+    def __len__(self):
+        return len(self._categories)
+
+    def classify(self, texto):
+        return self.classifier.classify(texto)
+
+    def classify_many(self, textos):
+        return self.classifier.classify_many(textos)
+
+    def categorias(self):
+        return build_categorias(self._categories)
+
+    # -- snapshot em disco ---------------------------------------------------
+    def _load_snapshot(self):
+        try:
+            mtime = os.path.getmtime(self.snapshot_path)
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self._categories = {item[0]: (item[1], item[2]) for item in snapshot.get("categories", [])}
+        self.watermark = snapshot.get("watermark")
+        self._snapshot_mtime = mtime
+        return bool(self._categories)
+
+    def _write_snapshot(self):
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        snapshot = {
+            "watermark": self.watermark,
+            "categories": [[cid, name, date_mod] for cid, (name, date_mod) in sorted(self._categories.items())],
+        }
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, self.snapshot_path)
+        self._snapshot_mtime = os.path.getmtime(self.snapshot_path)
+
+    # -- sincronização com o GLPI --------------------------------------------
+    async def _fetch(self, client, since=None):
+        """
+        Busca categorias (todas ou alteradas desde `since`). Retorna {id: (completename, date_mod)}.
+        """
+        params = {
+            "forcedisplay[0]": FIELD_ID,
+            "forcedisplay[1]": FIELD_COMPLETENAME,
+            "forcedisplay[2]": FIELD_DATE_MOD,
+            "sort": FIELD_DATE_MOD,
+            "order": "ASC",
+        }
+        if since:
+            params.update({
+                "criteria[0][field]": FIELD_DATE_MOD,
+                "criteria[0][searchtype]": "morethan",
+                "criteria[0][value]": since,
+            })
+        found, start = {}, 0
+        while True:
+            params["range"] = f"{start}-{start + self.page_size - 1}"
+            response = await client.search("ITILCategory", params)
+            if response.status_code not in (200, 206):
+                raise RuntimeError(f"Busca de categorias falhou: Status {response.status_code}")
+            data = response.json().get("data") or []
+            for item in data:
+                completename = item.get(str(FIELD_COMPLETENAME))
+                if item.get(str(FIELD_ID)) and completename:
+                    found[int(item[str(FIELD_ID)])] = (completename, item.get(str(FIELD_DATE_MOD)))
+            if len(data) < self.page_size:
+                return found
+            start += self.page_size
+
+    async def _swap(self, categories):
+        classifier = await asyncio.to_thread(CategoryClassifier, build_categorias(categories), self.match)
+        self._categories = categories
+        self.classifier = classifier
+
+    async def refresh(self, client, full=False):
+        """
+        Atualiza a árvore a partir do GLPI. Retorna quantas categorias mudaram.
+        """
+        full = full or self.watermark is None
+        changed = await self._fetch(client, None if full else self.watermark)
+        if full:
+            categories = changed
+            updated = categories != self._categories
+        else:
+            categories = {**self._categories, **changed}
+            updated = bool(changed)
+        if not categories:
+            return 0
+        watermark = max((date for _, date in categories.values() if date), default=self.watermark)
+        if not updated and watermark == self.watermark:
+            return 0
+        self.watermark = watermark
+        if updated:
+            await self._swap(categories)
+            logger.info(f"Árvore de categorias atualizada: {len(categories)} categorias ({len(changed)} alteradas).")
+        await asyncio.to_thread(self._write_snapshot)
+        return len(changed) if updated else 0
+
+    async def _reload_if_changed(self):
+        try:
+            mtime = os.path.getmtime(self.snapshot_path)
+        except OSError:
+            return
+        if mtime != self._snapshot_mtime and await asyncio.to_thread(self._load_snapshot):
+            await self._swap(self._categories)
+
+    async def _run(self, client_getter):
+        while True:
+            try:
+                if self.lock_store is None or self.lock_store.add("sync", os.getpid(), self.interval * 0.9):
+                    await self.refresh(client_getter(), full=self._rounds % self.full_every == 0)
+                    self._rounds += 1
+                else:
+                    await self._reload_if_changed()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Falha ao atualizar categorias do GLPI: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, client_getter):
+        """
+        Inicia a atualização periódica em segundo plano.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(client_getter))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def catalog_from_env(match="all"):
+    return CategoryCatalog(
+        os.getenv("CATEGORY_SNAPSHOT_PATH", "data/categorias.json"),
+        match=match,
+        interval=float(os.getenv("CATEGORY_SYNC_INTERVAL", "600")),
+        page_size=int(os.getenv("CATEGORY_SYNC_PAGE_SIZE", "200")),
+        full_every=int(os.getenv("CATEGORY_FULL_SYNC_EVERY", "12")),
+        lock_store=shared_store_from_env("category_catalog"),
+    )
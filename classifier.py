@@ -0,0 +1,112 @@
+import re
+import unicodedata
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+
+DEFAULT_CATEGORY = {"category_id": 1, "title": "Infraestrutura"}
+
+
+def fold(texto):
+    """
+    Remove acentos e normaliza caixa ("Conexão" -> "conexao").
+    """
+    decomposed = unicodedata.normalize("NFKD", texto or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def tokenize(texto):
+    return _TOKEN_RE.findall(fold(texto))
+
+
+# Palavras sem valor de busca (já sem acento, como saem de tokenize)
+STOPWORDS = frozenset("""
+a o e as os ao aos de da do das dos em no na nos nas num numa um uma uns umas para pra por pelo pela
+com sem que se nao sim mais mas ou ja eu me meu minha meus minhas voce ele ela isso esse essa este esta
+estou esta estao foi ser ter tem tenho tinha ta ai la aqui como quando onde porque qual quais muito
+pouco tambem so ainda hoje ontem agora favor preciso ajuda problema consegui consigo
+""".split())
+
+
+def terms(texto):
+    """
+    Tokens com valor de busca: sem stopwords e sem tokens de uma letra.
+    """
+    return [t for t in tokenize(texto) if len(t) > 1 and t not in STOPWORDS]
+
+
+class CategoryClassifier:
+    """
+    Classificador de intenção compilado uma única vez a partir de CATEGORIAS.
+
+    Cada chave de categoria vira um conjunto de tokens (sem acento/caixa).
+    - match="all": a categoria casa quando todos os seus tokens aparecem no
+      texto. O índice invertido aponta apenas do token mais raro de cada
+      categoria (âncora) para ela, então só as categorias candidatas são
+      verificadas.
+    - match="any": basta um token em comum; o melhor resultado de cada token
+      é pré-calculado.
+    Em ambos os modos vence a categoria mais específica (mais tokens na chave);
+    empates ficam com a que aparece primeiro em CATEGORIAS, como antes.
+    O custo por texto é proporcional ao número de tokens, não de categorias.
+    """
+
+    def __init__(self, categorias, match="all", default_key="infraestrutura"):
+        if match not in ("all", "any"):
+            raise ValueError("match deve ser 'all' ou 'any'")
+        self.match = match
+        self.default = categorias.get(default_key, DEFAULT_CATEGORY)
+        self._values = []
+        self._tokens = []
+        # Rank menor = mais específico (mais palavras na chave) e, no empate, anterior no dicionário
+        self._rank = []
+
+        frequency = {}
+        for order, (key, value) in enumerate(categorias.items()):
+            tokens = frozenset(tokenize(key))
+            if not tokens:
+                continue
+            self._values.append(value)
+            self._tokens.append(tokens)
+            self._rank.append((-(key.count(" ") + 1), order))
+            for token in tokens:
+                frequency[token] = frequency.get(token, 0) + 1
+
+        self._anchors = {}
+        self._best_by_token = {}
+        for idx, tokens in enumerate(self._tokens):
+            anchor = min(tokens, key=lambda t: (frequency[t], t))
+            self._anchors.setdefault(anchor, []).append(idx)
+            for token in tokens:
+                best = self._best_by_token.get(token)
+                if best is None or self._rank[idx] < self._rank[best]:
+                    self._best_by_token[token] = idx
+
+    def __len__(self):
+        return len(self._values)
+
+    def _best_all(self, tokens):
+        best = None
+        for token in tokens:
+            for idx in self._anchors.get(token, ()):
+                if (best is None or self._rank[idx] < self._rank[best]) and self._tokens[idx] <= tokens:
+                    best = idx
+        return best
+
+    def _best_any(self, tokens):
+        best = None
+        for token in tokens:
+            idx = self._best_by_token.get(token)
+            if idx is not None and (best is None or self._rank[idx] < self._rank[best]):
+                best = idx
+        return best
+
+    def classify(self, texto):
+        """
+        Retorna {"category_id", "title"} da categoria mais específica para o texto.
+        """
+        tokens = frozenset(tokenize(texto))
+        best = self._best_all(tokens) if self.match == "all" else self._best_any(tokens)
+        return self.default if best is None else self._values[best]
+
+    def classify_many(self, textos):
+        return [self.classify(texto) for texto in textos]
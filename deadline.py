@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+from tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+# Respostas faladas pelo assistente quando a ferramenta estoura o prazo do turno de voz
+FALLBACKS = {
+    "consultar_solucao": "Ainda não consegui consultar a base de soluções. "
+                         "Posso abrir um chamado para a equipe de suporte analisar o seu problema?",
+    "criar_ticket": "Estou registrando o seu chamado. O sistema está um pouco lento, "
+                    "mas o registro vai ser concluído e a equipe de suporte vai entrar em contato.",
+    "chamado": "Estou registrando o seu chamado e ele será concluído em instantes.",
+    "coletar_feedback": "Obrigado pela sua avaliação!",
+    "consultar_status": "Não consegui consultar o chamado agora. Posso tentar de novo em instantes?",
+}
+DEFAULT_FALLBACK = "O sistema de chamados está lento no momento. Vou continuar o atendimento enquanto isso."
+
+# Margem descontada do timeout do VAPI para a resposta ainda chegar a tempo
+VAPI_MARGIN = 0.5
+
+
+def default_budget(endpoint):
+    """
+    Prazo configurado para o endpoint: DEADLINE_<ENDPOINT> ou DEADLINE_DEFAULT (segundos).
+    """
+    name = endpoint.upper().replace("-", "_")
+    value = os.getenv(f"DEADLINE_{name}") or os.getenv("DEADLINE_DEFAULT", "4")
+    return float(value)
+
+
+def vapi_timeout(payload):
+    """
+    `timeoutSeconds` da ferramenta no payload do VAPI, se houver.
+    """
+    if not isinstance(payload, dict):
+        return None
+    message = payload.get("message") or {}
+    tools = message.get("toolWithToolCallList") or []
+    server = (tools[0].get("server") or {}) if tools and isinstance(tools[0], dict) else {}
+    return server.get("timeoutSeconds")
+
+
+def budget_from_request(endpoint, payload=None, headers=None, timeout_seconds=None):
+    """
+    Calcula o prazo da requisição: o configurado, reduzido pelo header
+    X-Deadline-Ms ou pelo `timeoutSeconds` da ferramenta no payload do VAPI
+    (ou informado diretamente em `timeout_seconds`).
+    """
+    budget = default_budget(endpoint)
+    if headers is not None and headers.get("x-deadline-ms"):
+        try:
+            budget = min(budget, float(headers["x-deadline-ms"]) / 1000)
+        except ValueError:
+            pass
+    timeout = timeout_seconds if timeout_seconds is not None else vapi_timeout(payload)
+    if isinstance(timeout, (int, float)) and timeout > VAPI_MARGIN:
+        budget = min(budget, timeout - VAPI_MARGIN)
+    return budget
+
+
+class DeadlineStats:
+    """
+    Quantas requisições de cada endpoint estouraram o prazo e quanto tempo levaram.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self._data = {}
+
+    def record(self, endpoint, elapsed, fired):
+        item = self._data.setdefault(endpoint, {"requests": 0, "fired": 0, "recent": deque(maxlen=self.window)})
+        item["requests"] += 1
+        item["fired"] += int(fired)
+        item["recent"].append(elapsed)
+
+    def snapshot(self):
+        result = {}
+        for endpoint, item in self._data.items():
+            recent = sorted(item["recent"])
+            pick = lambda q: round(recent[min(len(recent) - 1, int(q * len(recent)))], 4) if recent else None
+            result[endpoint] = {
+                "requests": item["requests"],
+                "fired": item["fired"],
+                "fired_ratio": round(item["fired"] / item["requests"], 4) if item["requests"] else 0.0,
+                "p50": pick(0.50),
+                "p95": pick(0.95),
+                "p99": pick(0.99),
+            }
+        return result
+
+
+stats = DeadlineStats()
+_background = set()
+
+
+def _log_background(task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Tarefa em segundo plano falhou após o prazo: {task.exception()}")
+
+
+async def run_with_deadline(endpoint, coro, budget, fallback=None, continue_in_background=False):
+    """
+    Executa `coro` com prazo de `budget` segundos.
+
+    Se o prazo estourar, retorna a resposta falada de fallback. Operações de
+    leitura são canceladas (liberando o GLPI); escritas idempotentes podem
+    seguir em segundo plano (`continue_in_background=True`) para que a
+    próxima retentativa receba o resultado.
+    """
+    started = time.monotonic()
+    task = asyncio.ensure_future(coro)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=budget)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    elapsed = time.monotonic() - started
+    if done:
+        stats.record(endpoint, elapsed, fired=False)
+        return task.result()
+
+    stats.record(endpoint, elapsed, fired=True)
+    current_span().set("deadline.exceeded", budget)
+    if continue_in_background:
+        _background.add(task)
+        task.add_done_callback(_log_background)
+        logger.warning(f"Prazo de {budget:.2f}s estourado em /{endpoint}; operação continua em segundo plano.")
+    else:
+        task.cancel()
+        logger.warning(f"Prazo de {budget:.2f}s estourado em /{endpoint}; operação cancelada.")
+    return fallback if fallback is not None else FALLBACKS.get(endpoint, DEFAULT_FALLBACK)
@@ -0,0 +1,249 @@
+import os
+import time
+import asyncio
+import logging
+import sqlite3
+import threading
+
+from ticket_batcher import post_batch
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY,
+    ticket_id TEXT,
+    nota INTEGER NOT NULL,
+    comentario TEXT,
+    status TEXT NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL
+);
+"""
+
+# Falhas que não adianta repetir
+_PERMANENT_STATUS = {400, 403, 404, 422}
+
+
+def followup_content(nota, comentario):
+    return f"Feedback: Nota {nota}/5. Comentário: {comentario or 'Nenhum'}"
+
+
+class FeedbackBuffer:
+    """
+    Buffer em memória de feedbacks, descarregado no GLPI em lotes.
+
+    Feedbacks com ticket viram TicketFollowup enviados em um único POST por
+    lote, quando o buffer atinge `max_batch` itens ou a cada `flush_interval`
+    segundos. Só um lote fica em voo por vez, para não disputar o GLPI com a
+    criação de tickets. Falhas temporárias (e um envio cancelado) voltam ao
+    buffer; feedbacks sem ticket, ou que esgotaram as tentativas, ficam
+    gravados no SQLite local para análise. `on_sent(ticket_id)` (corrotina)
+    é aguardada para cada acompanhamento criado no GLPI.
+
+    O buffer em memória guarda até `max_buffer` feedbacks; o excesso, e o
+    que não foi enviado em até `drain_timeout` segundos no encerramento,
+    fica no SQLite como "pendente" e volta ao buffer (neste ou no próximo
+    processo) quando houver espaço.
+    """
+
+    def __init__(self, client_getter, path, max_batch=50, flush_interval=2.0, max_attempts=5, on_sent=None,
+                 max_buffer=5000, drain_timeout=10.0):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.client_getter = client_getter
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.on_sent = on_sent
+        self.max_buffer = max(max_batch, max_buffer)
+        self.drain_timeout = drain_timeout
+        self._buffer = []
+        # Há feedbacks "pendente" no SQLite (excesso do buffer ou sobras de um encerramento)
+        self._pending = True
+        self._lock = threading.Lock()
+        self._task = None
+        self._wakeup = None
+        self.sent = 0
+        self.failed = 0
+        self.stored = 0
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def _store(self, rows):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO feedback (ticket_id, nota, comentario, status, last_error, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        self.stored += len(rows)
+
+    def _spill(self, items):
+        self._store([(i["ticket_id"], i["nota"], i["comentario"], "pendente", None, time.time()) for i in items])
+        self._pending = True
+
+    def _restore(self, limit):
+        """
+        Tira até `limit` feedbacks "pendente" do SQLite (numa transação, para
+        que dois workers não peguem os mesmos) e os devolve como itens do buffer.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, ticket_id, nota, comentario FROM feedback WHERE status = 'pendente' "
+                    "ORDER BY id LIMIT ?", (limit,)).fetchall()
+                self._conn.executemany("DELETE FROM feedback WHERE id = ?", [(row[0],) for row in rows])
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [{"ticket_id": row[1], "nota": row[2], "comentario": row[3], "attempts": 0} for row in rows]
+
+    async def refill(self):
+        """
+        Traz de volta ao buffer os feedbacks pendentes no SQLite, até o limite do buffer.
+        """
+        room = self.max_buffer - len(self._buffer)
+        if not self._pending or room <= 0:
+            return 0
+        items = await asyncio.to_thread(self._restore, room)
+        self._buffer.extend(items)
+        self._pending = len(items) == room
+        return len(items)
+
+    async def add(self, nota, comentario=None, ticket_id=None):
+        """
+        Registra um feedback. Retorna imediatamente; o envio ao GLPI é feito em lote.
+        """
+        if not ticket_id:
+            await asyncio.to_thread(self._store, [(None, nota, comentario, "sem_ticket", None, time.time())])
+            return
+        item = {"ticket_id": ticket_id, "nota": nota, "comentario": comentario, "attempts": 0}
+        if len(self._buffer) >= self.max_buffer:
+            # GLPI lento ou fora: o excesso espera no disco, não na memória
+            await asyncio.to_thread(self._spill, [item])
+            return
+        self._buffer.append(item)
+        if len(self._buffer) >= self.max_batch and self._wakeup is not None:
+            self._wakeup.set()
+
+    async def flush(self):
+        """
+        Envia ao GLPI até `max_batch` feedbacks do buffer.
+        """
+        batch, self._buffer = self._buffer[:self.max_batch], self._buffer[self.max_batch:]
+        if not batch:
+            return 0
+        inputs = [
+            {"tickets_id": item["ticket_id"], "content": followup_content(item["nota"], item["comentario"])}
+            for item in batch
+        ]
+        try:
+            results = await post_batch(self.client_getter(), inputs, itemtype="TicketFollowup")
+        except BaseException:
+            # Envio cancelado (encerramento) ou erro inesperado: o lote volta para o início do buffer
+            self._buffer[:0] = batch
+            raise
+        retry, dead = [], []
+        for item, result in zip(batch, results):
+            if result["id"]:
+                self.sent += 1
+                if self.on_sent is not None:
+                    await self.on_sent(item["ticket_id"])
+                continue
+            item["attempts"] += 1
+            # Lote recusado por inteiro já foi reenviado item a item por post_batch:
+            # um status permanente aqui é do próprio item
+            if result["status"] in _PERMANENT_STATUS or item["attempts"] >= self.max_attempts:
+                self.failed += 1
+                dead.append((item["ticket_id"], item["nota"], item["comentario"], "falha_glpi",
+                             f"Status {result['status']}: {result['message']}"[:500], time.time()))
+            else:
+                retry.append(item)
+        # Itens com falha temporária voltam para o início do buffer
+        self._buffer[:0] = retry
+        if dead:
+            logger.warning(f"{len(dead)} feedback(s) não enviados ao GLPI; gravados localmente.")
+            await asyncio.to_thread(self._store, dead)
+        return len(batch) - len(retry) - len(dead)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.refill()
+                while self._buffer:
+                    before = len(self._buffer)
+                    await self.flush()
+                    if len(self._buffer) >= before:
+                        break  # Nada avançou (GLPI indisponível); tenta no próximo ciclo
+            except Exception as e:
+                logger.error(f"Erro ao enviar feedbacks ao GLPI: {str(e)}")
+
+    def start(self):
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def drain(self, timeout):
+        """
+        Envia o buffer inteiro, lote a lote, por até `timeout` segundos ou até o GLPI parar de aceitar.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._buffer:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            before = len(self._buffer)
+            try:
+                await asyncio.wait_for(self.flush(), remaining)
+            except asyncio.TimeoutError:
+                break
+            except Exception as e:
+                logger.error(f"Erro no envio final de feedbacks: {str(e)}")
+                break
+            if len(self._buffer) >= before:
+                break
+
+    async def stop(self):
+        """
+        Para o envio periódico, envia o que der em `drain_timeout` segundos e
+        grava o resto como pendente (reenviado no próximo início).
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.drain(self.drain_timeout)
+        if self._buffer:
+            items, self._buffer = self._buffer, []
+            logger.warning(f"{len(items)} feedback(s) não enviados no encerramento; reenviados no próximo início.")
+            await asyncio.to_thread(self._spill, items)
+
+    def stats(self):
+        return {"buffer": len(self._buffer), "max_buffer": self.max_buffer, "pending_on_disk": self._pending,
+                "sent": self.sent, "failed": self.failed, "stored": self.stored}
+
+
+def buffer_from_env(client_getter, on_sent=None):
+    return FeedbackBuffer(
+        client_getter,
+        os.getenv("FEEDBACK_DB_PATH", "data/feedback.db"),
+        max_batch=int(os.getenv("FEEDBACK_BATCH_SIZE", "50")),
+        flush_interval=float(os.getenv("FEEDBACK_FLUSH_INTERVAL", "2")),
+        on_sent=on_sent,
+        max_buffer=int(os.getenv("FEEDBACK_MAX_BUFFER", "5000")),
+        drain_timeout=float(os.getenv("FEEDBACK_DRAIN_TIMEOUT", "10")),
+    )
@@ -0,0 +1,224 @@
+import os
+import time
+import asyncio
+import logging
+
+import httpx
+from dotenv import load_dotenv
+
+from glpi_session import GLPISessionPool, is_session_invalid
+from store import shared_store_from_env
+from metrics import GLPI_ERRORS, GLPI_IN_FLIGHT, GLPI_LATENCY, GLPI_REQUESTS
+from resilience import BreakerRegistry, BreakerTransport, backoff_delay, is_retryable, parse_timeouts
+from tracing import KIND_CLIENT, span
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+
+def glpi_operation(path):
+    """
+    Nome da operação GLPI a partir do caminho da URL
+    (ex.: /apirest.php/Ticket/42 -> Ticket, /apirest.php/search/Solution -> search/Solution).
+    """
+    _, _, rest = path.partition("apirest.php/")
+    parts = (rest or path.lstrip("/")).split("/")
+    if parts[0] == "search" and len(parts) > 1:
+        return f"search/{parts[1]}"
+    return parts[0] or "raiz"
+
+
+class _InstrumentedTransport(httpx.AsyncBaseTransport):
+    """
+    Mede todas as chamadas ao GLPI (inclusive initSession/killSession do pool):
+    contagem, erros, latência até a resposta e chamadas em andamento, e abre
+    um span por chamada HTTP quando a requisição está sendo rastreada.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        operation = glpi_operation(request.url.path)
+        GLPI_IN_FLIGHT.inc(operation)
+        started = time.perf_counter()
+        with span(f"HTTP {request.method} {operation}", KIND_CLIENT, **{"glpi.operation": operation}) as http_span:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except Exception:
+                GLPI_ERRORS.inc(operation)
+                GLPI_REQUESTS.inc(operation, request.method, "erro")
+                raise
+            finally:
+                GLPI_LATENCY.observe(time.perf_counter() - started, operation)
+                GLPI_IN_FLIGHT.dec(operation)
+            http_span.set("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                http_span.fail(f"HTTP {response.status_code}")
+        GLPI_REQUESTS.inc(operation, request.method, response.status_code)
+        if response.status_code >= 500:
+            GLPI_ERRORS.inc(operation)
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class AsyncGLPIClient:
+    """
+    Cliente assíncrono para a API REST do GLPI.
+
+    Usa um único `httpx.AsyncClient` com pool de conexões keep-alive limitado,
+    timeout por chamada e um semáforo que limita quantas requisições ficam
+    em voo no GLPI ao mesmo tempo. As sessões vêm do GLPISessionPool.
+    Todas as chamadas são medidas para o endpoint /metrics.
+
+    Resiliência (resilience.py): timeout por operação (`timeouts`, ex.:
+    {"Ticket": 8, "search": 3}), um disjuntor por operação que falha na hora
+    enquanto o GLPI está fora e até `max_retries` retentativas com backoff
+    exponencial e jitter, apenas para chamadas idempotentes (GET, ou
+    `idempotent=True` em buscas feitas via POST).
+    """
+
+    def __init__(self, glpi_url, app_token, user_token=None, user=None, password=None,
+                 session_pool_size=2, timeout=10.0, max_connections=100,
+                 max_keepalive=20, max_concurrency=100, transport=None, session_store=None,
+                 timeouts=None, max_retries=2, breaker_threshold=5, breaker_reset=30.0):
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.max_retries = max_retries
+        self.breakers = BreakerRegistry(breaker_threshold, breaker_reset)
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(max_connections=max_connections,
+                                                                     max_keepalive_connections=max_keepalive,
+                                                                     keepalive_expiry=30.0))
+        self.http = httpx.AsyncClient(
+            # O disjuntor fica por fora: chamadas recusadas na hora não contam como chamadas ao GLPI
+            transport=BreakerTransport(_InstrumentedTransport(transport), self.breakers, glpi_operation),
+            timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)),
+        )
+        self.sessions = GLPISessionPool(self.http, glpi_url, app_token, user_token=user_token,
+                                        user=user, password=password,
+                                        size=session_pool_size, store=session_store,
+                                        timeout=self.timeouts.get("initSession", timeout))
+        self.base_url = self.sessions.base_url
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    def timeout_for(self, path):
+        operation = glpi_operation(f"/{path.lstrip('/')}")
+        if operation in self.timeouts:
+            return self.timeouts[operation]
+        return self.timeouts.get(operation.split("/")[0], self.timeout)
+
+    async def _send(self, method, url, timeout, headers, kwargs):
+        """
+        Uma chamada autenticada. Se o token estiver expirado, renova a sessão e repete uma vez.
+        """
+        for attempt in range(2):
+            async with self.sessions.session() as token:
+                request_headers = {**self.sessions.headers(token), **(headers or {})}
+                response = await self.http.request(method, url, headers=request_headers,
+                                                   timeout=timeout, **kwargs)
+            if attempt == 0 and is_session_invalid(response):
+                logger.info("Sessão GLPI expirada, renovando token.")
+                await self.sessions.invalidate(token)
+                continue
+            return response
+        return response
+
+    async def request(self, method, path, *, timeout=None, headers=None, idempotent=False, **kwargs):
+        """
+        Executa uma requisição autenticada no GLPI.
+        Chamadas idempotentes são repetidas em falha de conexão, timeout ou 502/503/504.
+        """
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        timeout = self.timeout_for(path) if timeout is None else timeout
+        operation = glpi_operation(f"/{path.lstrip('/')}")
+        # Um span pela operação inteira (espera no semáforo, sessão e retentativas); as chamadas HTTP são filhas
+        with span(f"GLPI {method} {operation}", **{"glpi.operation": operation}) as request_span:
+            async with self._semaphore:
+                for attempt in range(self.max_retries + 1):
+                    last = attempt == self.max_retries
+                    request_span.set("glpi.attempts", attempt + 1)
+                    try:
+                        response = await self._send(method, url, timeout, headers, kwargs)
+                    except httpx.HTTPError as e:
+                        if last or not is_retryable(method, idempotent, error=e):
+                            raise
+                        logger.warning(f"Falha ao chamar o GLPI ({method} {path}), tentativa {attempt + 1}: {str(e)}")
+                    else:
+                        if last or not is_retryable(method, idempotent, response=response):
+                            request_span.set("http.status_code", response.status_code)
+                            return response
+                        logger.warning(f"GLPI respondeu {response.status_code} ({method} {path}), "
+                                       f"tentativa {attempt + 1}")
+                    await asyncio.sleep(backoff_delay(attempt))
+
+    # -- atalhos para os itens usados pela aplicação ---------------------------
+    async def create_item(self, itemtype, data, **kwargs):
+        return await self.request("POST", itemtype, json={"input": data}, **kwargs)
+
+    async def create_ticket(self, data, **kwargs):
+        return await self.create_item("Ticket", data, **kwargs)
+
+    async def add_followup(self, data, **kwargs):
+        return await self.create_item("TicketFollowup", data, **kwargs)
+
+    async def get_item(self, itemtype, item_id, params=None, **kwargs):
+        return await self.request("GET", f"{itemtype}/{item_id}", params=params, **kwargs)
+
+    async def search(self, itemtype, params, **kwargs):
+        return await self.request("GET", f"search/{itemtype}", params=params, **kwargs)
+
+    async def close(self):
+        """
+        Encerra as sessões GLPI e fecha as conexões keep-alive.
+        """
+        await self.sessions.shutdown()
+        await self.http.aclose()
+
+
+def client_from_env(**overrides):
+    """
+    Cria um AsyncGLPIClient a partir das variáveis de ambiente.
+    """
+    options = dict(
+        glpi_url=os.getenv("GLPI_URL"),
+        app_token=os.getenv("GLPI_APP_TOKEN"),
+        user_token=os.getenv("GLPI_USER_TOKEN"),
+        user=os.getenv("GLPI_USER"),
+        password=os.getenv("GLPI_PASSWORD"),
+        session_pool_size=int(os.getenv("GLPI_SESSION_POOL_SIZE", "2")),
+        timeout=float(os.getenv("GLPI_TIMEOUT", "10")),
+        max_connections=int(os.getenv("GLPI_MAX_CONNECTIONS", "100")),
+        max_keepalive=int(os.getenv("GLPI_MAX_KEEPALIVE", "20")),
+        max_concurrency=int(os.getenv("GLPI_MAX_CONCURRENCY", "100")),
+        # Com SHARED_STORE_PATH, os workers compartilham os session_tokens
+        session_store=shared_store_from_env("glpi_sessions"),
+        timeouts=parse_timeouts(os.getenv("GLPI_TIMEOUTS")),
+        max_retries=int(os.getenv("GLPI_MAX_RETRIES", "2")),
+        breaker_threshold=int(os.getenv("GLPI_BREAKER_THRESHOLD", "5")),
+        breaker_reset=float(os.getenv("GLPI_BREAKER_RESET", "30")),
+    )
+    options.update(overrides)
+    return AsyncGLPIClient(**options)
+
+
+_client = None
+
+
+def get_glpi_client():
+    """
+    Retorna o cliente GLPI do processo (criado na primeira chamada).
+    """
+    global _client
+    if _client is None:
+        _client = client_from_env()
+    return _client
+
+
+async def close_glpi_client():
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
@@ -0,0 +1,223 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Erro devolvido pelo GLPI quando o Session-Token expirou ou foi encerrado
+SESSION_INVALID_ERRORS = ("ERROR_SESSION_TOKEN_INVALID", "ERROR_SESSION_TOKEN_MISSING")
+
+
+def api_base_url(url):
+    """
+    Normaliza a URL do GLPI para terminar em /apirest.php.
+    Aceita tanto "http://host" quanto "http://host/apirest.php" no .env.
+    """
+    url = (url or "").rstrip("/")
+    if not url.endswith("apirest.php"):
+        url = f"{url}/apirest.php"
+    return url
+
+
+def is_session_invalid(response):
+    """
+    Indica se a resposta do GLPI sinaliza sessão inválida/expirada.
+    """
+    if response.status_code != 401:
+        return False
+    text = response.text or ""
+    return not text or any(err in text for err in SESSION_INVALID_ERRORS)
+
+
+class GLPIAuthError(Exception):
+    """
+    Falha ao abrir sessão no GLPI (credenciais inválidas ou GLPI indisponível).
+    """
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class _Slot:
+    """
+    Uma posição do pool: guarda um session_token e quantas requisições o usam.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.key = f"slot:{index}"
+        self.token = None
+        self.in_use = 0
+        self.lock = asyncio.Lock()
+
+
+class GLPISessionPool:
+    """
+    Pool de sessões GLPI compartilhado pelo processo.
+
+    Mantém até `size` session_tokens vivos e distribui as requisições para o
+    slot menos ocupado. Tokens são criados sob demanda (initSession) e
+    renovados apenas quando o GLPI responde 401/ERROR_SESSION_TOKEN_INVALID.
+    Requisições concorrentes que precisam renovar o mesmo slot aguardam uma
+    única chamada de initSession. As sessões são encerradas em shutdown().
+
+    As chamadas de initSession/killSession usam o `httpx.AsyncClient` do
+    cliente GLPI, aproveitando as mesmas conexões keep-alive.
+
+    Com um `store` compartilhado (store.SQLiteStore) os tokens de cada slot
+    ficam no store: N workers usam as mesmas `size` sessões em vez de N×size,
+    e só um worker faz o initSession de cada slot. Nesse modo o shutdown não
+    encerra as sessões, que continuam em uso pelos outros workers.
+    """
+
+    def __init__(self, http, base_url, app_token, user_token=None, user=None, password=None,
+                 size=2, timeout=10, store=None):
+        if not app_token:
+            raise ValueError("ERROR_APP_TOKEN_MISSING: É necessário fornecer o app_token")
+        if not user_token and not (user and password):
+            raise ValueError("ERROR_LOGIN_PARAMETERS_MISSING: É necessário fornecer user_token ou usuário e senha")
+        self.http = http
+        self.base_url = api_base_url(base_url)
+        self.app_token = app_token
+        self.user_token = user_token
+        self.user = user
+        self.password = password
+        self.timeout = timeout
+        self.store = store
+        self._slots = [_Slot(i) for i in range(max(1, size))]
+        self._closed = False
+
+    # -- autenticação ---------------------------------------------------------
+    async def _init_session(self):
+        headers = {"Content-Type": "application/json", "App-Token": self.app_token}
+        if self.user_token:
+            payload = {"user_token": self.user_token}
+        else:
+            payload = {"login": self.user, "password": self.password}
+        try:
+            response = await self.http.post(f"{self.base_url}/initSession", json=payload,
+                                            headers=headers, timeout=self.timeout)
+        except httpx.HTTPError as e:
+            raise GLPIAuthError(503, f"Erro ao iniciar sessão: {str(e)}")
+        if response.status_code != 200:
+            raise GLPIAuthError(response.status_code, f"Erro ao iniciar sessão: {response.text}")
+        token = response.json().get("session_token")
+        if not token:
+            raise GLPIAuthError(400, "Session_token não encontrado na resposta do GLPI.")
+        logger.info("Sessão GLPI iniciada.")
+        return token
+
+    async def _kill_session(self, token):
+        headers = {"App-Token": self.app_token, "Session-Token": token}
+        try:
+            await self.http.get(f"{self.base_url}/killSession", headers=headers, timeout=self.timeout)
+        except httpx.HTTPError as e:
+            logger.warning(f"Falha ao encerrar sessão GLPI: {str(e)}")
+
+    async def _ensure_token(self, slot):
+        token = slot.token
+        if token:
+            return token
+        # Quem chegar primeiro faz o initSession; os demais aguardam no lock
+        async with slot.lock:
+            if slot.token is None:
+                if self.store is None:
+                    slot.token = await self._init_session()
+                else:
+                    slot.token = await self._shared_token(slot)
+            return slot.token
+
+    async def _shared_token(self, slot):
+        """
+        Token do slot no store compartilhado; se não houver, um único worker
+        abre a sessão enquanto os demais aguardam o token ser gravado. O
+        store (SQLite) é acessado fora do event loop.
+        """
+        lock_key = f"init:{slot.index}"
+        deadline = time.monotonic() + self.timeout
+        delay = 0.05
+        while True:
+            token = await asyncio.to_thread(self.store.get, slot.key)
+            if token:
+                return token
+            if await asyncio.to_thread(self.store.add, lock_key, os.getpid(), self.timeout):
+                try:
+                    # Outro worker pode ter gravado o token e liberado a reserva logo antes
+                    token = await asyncio.to_thread(self.store.get, slot.key)
+                    if token:
+                        return token
+                    token = await self._init_session()
+                    await asyncio.to_thread(self.store.set, slot.key, token)
+                    return token
+                finally:
+                    await asyncio.to_thread(self.store.delete, lock_key)
+            if time.monotonic() >= deadline:
+                # O worker que reservou o slot não respondeu a tempo: abre a própria
+                # sessão e a publica no store; se outro worker publicou antes, usa a
+                # dele e encerra a nova para não deixar sessão órfã no GLPI
+                token = await self._init_session()
+                if await asyncio.to_thread(self.store.add, slot.key, token):
+                    return token
+                await self._kill_session(token)
+                deadline = time.monotonic() + self.timeout
+                continue
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    # -- API pública ----------------------------------------------------------
+    @asynccontextmanager
+    async def session(self):
+        """
+        Empresta um session_token do slot menos ocupado.
+        Uso: `async with pool.session() as token: ...`
+        """
+        if self._closed:
+            raise RuntimeError("Pool de sessões GLPI encerrado.")
+        slot = min(self._slots, key=lambda s: s.in_use)
+        slot.in_use += 1
+        try:
+            yield await self._ensure_token(slot)
+        finally:
+            slot.in_use -= 1
+
+    async def invalidate(self, token):
+        """
+        Descarta um token rejeitado pelo GLPI. Só limpa o slot se ele ainda
+        guarda esse token, para não derrubar um token já renovado por outra
+        requisição. O store (SQLite) é acessado fora do event loop.
+        """
+        for slot in self._slots:
+            if slot.token == token:
+                slot.token = None
+                if self.store is not None:
+                    await asyncio.to_thread(self.store.delete_if, slot.key, token)
+
+    def stats(self):
+        return {
+            "size": len(self._slots),
+            "tokens": sum(1 for slot in self._slots if slot.token),
+            "in_use": sum(slot.in_use for slot in self._slots),
+        }
+
+    def headers(self, token):
+        return {"Content-Type": "application/json", "App-Token": self.app_token, "Session-Token": token}
+
+    async def shutdown(self):
+        """
+        Encerra (killSession) todas as sessões abertas pelo pool.
+        """
+        self._closed = True
+        if self.store is not None:
+            for slot in self._slots:
+                slot.token = None
+            return
+        for slot in self._slots:
+            token, slot.token = slot.token, None
+            if token:
+                await self._kill_session(token)
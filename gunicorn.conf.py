@@ -0,0 +1,32 @@
+"""
+Configuração do gunicorn para rodar a API com vários workers uvicorn.
+
+Uso:
+    gunicorn main:app -c gunicorn.conf.py
+
+WEB_CONCURRENCY define o número de workers (padrão: núcleos disponíveis).
+Os workers compartilham pelo SQLite em SHARED_STORE_PATH as sessões GLPI,
+os caches e as chaves de idempotência; sem isso cada worker abriria suas
+próprias sessões e repetiria o trabalho dos outros.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Tool calls do VAPI têm prazo curto; um worker travado é reciclado rápido
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "20"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+
+# Cada worker cria seu próprio event loop e cliente GLPI depois do fork
+preload_app = False
+
+# Herdado pelos workers: estado compartilhado em um arquivo SQLite local
+os.environ.setdefault("SHARED_STORE_PATH", "data/shared_state.db")
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
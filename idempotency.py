@@ -0,0 +1,111 @@
+import os
+import time
+import asyncio
+import logging
+
+from store import store_from_env
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyStore:
+    """
+    Evita processar duas vezes a mesma tool call do VAPI (ou Idempotency-Key).
+
+    A primeira requisição com uma chave reserva a chave no backend e executa a
+    operação; repetições concorrentes aguardam esse resultado (no mesmo
+    processo, pela mesma future; em outros workers, consultando o backend).
+    Repetições posteriores recebem o resultado guardado por `ttl` segundos.
+    Se a operação falhar a reserva é liberada, permitindo nova tentativa.
+    O backend (SQLite) é acessado fora do event loop; a consulta ao resultado
+    de outro worker começa a cada `poll_interval` segundos e dobra até
+    `max_poll_interval`.
+    """
+
+    def __init__(self, backend, ttl=600.0, lease=60.0, poll_interval=0.05, max_poll_interval=1.0):
+        self.backend = backend
+        self.ttl = ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self._inflight = {}
+        self.replays = 0
+
+    async def _wait_other_worker(self, key):
+        deadline = time.monotonic() + self.lease
+        delay = self.poll_interval
+        while time.monotonic() < deadline:
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_poll_interval)
+            stored = await asyncio.to_thread(self.backend.get, key)
+            if stored is None:
+                return None  # O outro worker falhou; esta requisição assume
+            if stored.get("state") == "done":
+                return stored
+        return None
+
+    async def run(self, key, operation):
+        """
+        Executa `operation()` (corrotina) uma única vez por chave.
+        Sem chave, apenas executa.
+        """
+        if not key:
+            return await operation()
+        while True:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.replays += 1
+                return await asyncio.shield(future)
+
+            stored = await asyncio.to_thread(self.backend.get, key)
+            if stored is not None and stored.get("state") == "done":
+                self.replays += 1
+                logger.info(f"Requisição repetida ({key}); devolvendo resultado anterior.")
+                return stored["result"]
+            if stored is None and await asyncio.to_thread(self.backend.add, key, {"state": "pending"}, self.lease):
+                break
+            if key in self._inflight:
+                continue  # Outra requisição deste processo reservou a chave durante a consulta
+            # Outro worker está processando a mesma chave
+            stored = await self._wait_other_worker(key)
+            if stored is not None:
+                self.replays += 1
+                return stored["result"]
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            try:
+                result = await operation()
+            except BaseException as e:
+                if isinstance(e, asyncio.CancelledError):
+                    # Quem aguarda a mesma chave recebe um erro comum, não o cancelamento desta tarefa
+                    e = RuntimeError("Operação cancelada antes de concluir.")
+                future.set_exception(e)
+                # Evita o aviso "exception was never retrieved" quando não há ninguém aguardando
+                future.exception()
+                # A thread conclui a liberação mesmo se esta tarefa for cancelada de novo
+                await asyncio.to_thread(self.backend.delete, key)
+                raise
+            future.set_result(result)
+            await asyncio.to_thread(self.backend.set, key, {"state": "done", "result": result}, self.ttl)
+            return result
+        finally:
+            del self._inflight[key]
+
+
+def tool_call_id(payload):
+    """
+    Extrai o ID da primeira tool call de um payload do VAPI, se houver.
+    """
+    try:
+        return payload.get("message", {}).get("toolCalls", [{}])[0].get("id")
+    except (AttributeError, IndexError):
+        return None
+
+
+def idempotency_from_env():
+    return IdempotencyStore(
+        store_from_env("idempotency"),
+        ttl=float(os.getenv("IDEMPOTENCY_TTL", "600")),
+    )
@@ -0,0 +1,245 @@
+import os
+import time
+import zlib
+import asyncio
+import logging
+
+import numpy as np
+
+from metrics import REGISTRY
+from classifier import terms
+from ticket_batcher import TicketBatcher, post_batch
+
+logger = logging.getLogger(__name__)
+
+INCIDENT_REPORTS = REGISTRY.counter("incident_reports_total", "Relatos recebidos pelo agregador de incidentes.",
+                                    ("action",))
+
+# Primo de Mersenne 2^31 - 1: (a * x + b) cabe em 64 bits para x de 32 bits
+_PRIME = (1 << 31) - 1
+# Ticket_Ticket.link: 1 = relacionado a
+LINK_RELATED = 1
+
+
+def shingles(texto):
+    """
+    Conjunto de termos do relato, sem stopwords. Relatos falados mudam muito a
+    ordem das palavras ("sem rede" / "a rede caiu"), então pares de termos
+    vizinhos mais atrapalham do que ajudam.
+    """
+    return set(terms(texto))
+
+
+class MinHasher:
+    """
+    Assinatura MinHash de um conjunto de shingles: a fração de posições
+    iguais entre duas assinaturas estima a similaridade de Jaccard.
+    """
+
+    def __init__(self, num_perm=64, seed=1):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, items):
+        if not items:
+            return None
+        x = np.fromiter((zlib.crc32(item.encode()) for item in items), dtype=np.uint64, count=len(items))
+        return ((np.outer(x, self.a) + self.b) % _PRIME).min(axis=0)
+
+
+def similarity(signatures, signature):
+    """
+    Similaridade estimada entre `signature` e cada linha de `signatures`.
+    """
+    return (signatures == signature).mean(axis=1)
+
+
+class Incident:
+    """
+    Relatos semelhantes (mesma categoria e entidade) dentro da janela.
+    """
+
+    def __init__(self, key, signature, title, now):
+        self.key = key
+        self.signature = signature
+        self.title = title
+        self.first_seen = now
+        self.last_seen = now
+        self.reports = 0
+        self.tickets = []
+        self.linked = set()
+        self.master = None
+        self.master_id = None
+
+    def snapshot(self):
+        return {
+            "category_id": self.key[0],
+            "entities_id": self.key[1],
+            "title": self.title,
+            "reports": self.reports,
+            "tickets": list(self.tickets),
+            "master_id": self.master_id,
+            "first_seen": round(self.first_seen),
+            "last_seen": round(self.last_seen),
+        }
+
+
+class IncidentAggregator:
+    """
+    Agrega relatos de um mesmo incidente (ex.: queda de rede com dezenas de
+    ligações em poucos minutos).
+
+    Relatos com a mesma categoria e entidade cuja similaridade de texto
+    (MinHash sobre os termos) passa de `similarity` entram no
+    mesmo incidente, que fica ativo enquanto chegarem relatos a menos de
+    `window` segundos do anterior. Até `threshold - 1` relatos viram tickets
+    comuns; o relato que atinge `threshold` cria um ticket mestre, ao qual os
+    tickets anteriores são relacionados (Ticket_Ticket). Os relatos
+    seguintes viram acompanhamentos do mestre, enviados em lote, e quem
+    ligou é avisado de que o problema já é conhecido.
+
+    O estado é local ao worker. Se o mestre ou o acompanhamento falhar, o
+    relato vira um ticket comum: nenhum relato é perdido.
+    """
+
+    def __init__(self, client_getter, window=900.0, threshold=3, similarity=0.4, num_perm=64,
+                 max_incidents=50, followup_batch=50, followup_wait=1.0):
+        self.client_getter = client_getter
+        self.window = window
+        self.threshold = max(2, threshold)
+        self.similarity = similarity
+        self.max_incidents = max_incidents
+        self.hasher = MinHasher(num_perm)
+        self.followups = TicketBatcher(client_getter, max_batch=followup_batch, max_wait=followup_wait,
+                                       itemtype="TicketFollowup")
+        self._incidents = {}
+
+    def _active(self, key, now):
+        incidents = [i for i in self._incidents.get(key, []) if now - i.last_seen <= self.window]
+        if incidents:
+            self._incidents[key] = incidents
+        else:
+            self._incidents.pop(key, None)
+        return incidents
+
+    def _match(self, key, signature, title, now):
+        incidents = self._active(key, now)
+        if incidents:
+            scores = similarity(np.stack([i.signature for i in incidents]), signature)
+            best = int(scores.argmax())
+            if scores[best] >= self.similarity:
+                return incidents[best]
+        incident = Incident(key, signature, title, now)
+        incidents.append(incident)
+        # Muitos incidentes distintos na mesma categoria: descarta os mais antigos
+        self._incidents[key] = incidents[-self.max_incidents:]
+        return incident
+
+    async def _create_master(self, incident, ticket_input, create_ticket):
+        relacionados = ", ".join(f"#{t}" for t in incident.tickets) or "nenhum"
+        master_input = {
+            **ticket_input,
+            "name": f"[Incidente] {ticket_input.get('name', '')}".strip(),
+            "content": f"Incidente com {incident.reports} relatos semelhantes "
+                       f"em {max(1, round((incident.last_seen - incident.first_seen) / 60))} min.\n"
+                       f"Chamados relacionados: {relacionados}\n\n"
+                       f"Relato mais recente:\n{ticket_input.get('content', '')}",
+        }
+        master_id = await create_ticket(master_input)
+        logger.warning(f"Incidente detectado: {incident.reports} relatos semelhantes; ticket mestre {master_id}.")
+        await self._link(incident, master_id, list(incident.tickets))
+        return master_id
+
+    async def _link(self, incident, master_id, tickets):
+        """
+        Relaciona os tickets ao mestre (Ticket_Ticket).
+        """
+        tickets = [t for t in tickets if t not in incident.linked]
+        if not tickets:
+            return
+        incident.linked.update(tickets)
+        links = [{"tickets_id_1": t, "tickets_id_2": master_id, "link": LINK_RELATED} for t in tickets]
+        results = await post_batch(self.client_getter(), links, "Ticket_Ticket")
+        failed = sum(1 for result in results if not result["id"])
+        if failed:
+            logger.warning(f"{failed} ticket(s) não relacionados ao mestre {master_id}.")
+
+    async def _add_followup(self, master_id, ticket_input):
+        result = await self.followups.submit({
+            "tickets_id": master_id,
+            "content": f"Novo relato do mesmo incidente:\n{ticket_input.get('content', '')}",
+        })
+        if not result["id"]:
+            raise RuntimeError(f"Status {result['status']}: {result['message']}")
+
+    async def report(self, ticket_input, texto, create_ticket):
+        """
+        Registra um relato. `create_ticket(input)` (corrotina) cria um ticket e retorna o ID.
+        Retorna {"ticket_id", "action": "ticket" | "master" | "followup", "reports", "known"}.
+        """
+        signature = self.hasher.signature(shingles(texto))
+        if signature is None:
+            INCIDENT_REPORTS.inc("ticket")
+            return {"ticket_id": await create_ticket(ticket_input), "action": "ticket", "reports": 1, "known": False}
+
+        now = time.time()
+        key = (ticket_input.get("itilcategories_id"), ticket_input.get("entities_id"))
+        incident = self._match(key, signature, ticket_input.get("name"), now)
+        incident.reports += 1
+        incident.last_seen = now
+        reports = incident.reports
+
+        if incident.master is not None:
+            try:
+                master_id = await asyncio.shield(incident.master)
+                await self._add_followup(master_id, ticket_input)
+                INCIDENT_REPORTS.inc("followup")
+                return {"ticket_id": master_id, "action": "followup", "reports": reports, "known": True}
+            except Exception as e:
+                logger.warning(f"Relato não anexado ao incidente; criando ticket próprio: {str(e)}")
+        elif reports >= self.threshold:
+            incident.master = asyncio.get_running_loop().create_future()
+            try:
+                master_id = await self._create_master(incident, ticket_input, create_ticket)
+            except BaseException as e:
+                # Quem aguarda o mestre cria o próprio ticket; o próximo relato tenta de novo
+                incident.master.set_exception(RuntimeError(f"Ticket mestre não criado: {str(e)}"))
+                incident.master.exception()
+                incident.master = None
+                raise
+            incident.master_id = master_id
+            incident.master.set_result(master_id)
+            INCIDENT_REPORTS.inc("master")
+            return {"ticket_id": master_id, "action": "master", "reports": reports, "known": True}
+
+        ticket_id = await create_ticket(ticket_input)
+        incident.tickets.append(ticket_id)
+        if incident.master is not None and ticket_id not in incident.linked:
+            # O mestre foi criado enquanto este ticket estava em envio e não o incluiu
+            try:
+                await self._link(incident, await asyncio.shield(incident.master), [ticket_id])
+            except Exception as e:
+                logger.warning(f"Ticket {ticket_id} não relacionado ao incidente: {str(e)}")
+        INCIDENT_REPORTS.inc("ticket")
+        return {"ticket_id": ticket_id, "action": "ticket", "reports": reports, "known": False}
+
+    def snapshot(self):
+        now = time.time()
+        incidents = [i for key in list(self._incidents) for i in self._active(key, now)]
+        return sorted((i.snapshot() for i in incidents if i.reports > 1), key=lambda s: -s["reports"])
+
+
+def aggregator_from_env(client_getter):
+    """
+    Agregador de incidentes com INCIDENT_AGGREGATION=1 (desligado por padrão).
+    """
+    if os.getenv("INCIDENT_AGGREGATION", "0") != "1":
+        return None
+    return IncidentAggregator(
+        client_getter,
+        window=float(os.getenv("INCIDENT_WINDOW", "900")),
+        threshold=int(os.getenv("INCIDENT_THRESHOLD", "3")),
+        similarity=float(os.getenv("INCIDENT_SIMILARITY", "0.4")),
+        followup_wait=float(os.getenv("INCIDENT_FOLLOWUP_WAIT", "1")),
+    )
@@ -0,0 +1,302 @@
+import os
+import re
+import html
+import asyncio
+import logging
+import sqlite3
+import threading
+
+from classifier import terms, tokenize
+from store import shared_store_from_env
+
+logger = logging.getLogger(__name__)
+
+# Itens do GLPI espelhados localmente. Os números são os IDs de "search option"
+# usados pela API /search do GLPI (2 = ID, 19 = última modificação).
+SOURCES = {
+    "ITILSolution": {"id": 2, "title": None, "content": 1, "date_mod": 19},
+    "KnowbaseItem": {"id": 2, "title": 6, "content": 7, "date_mod": 19},
+}
+
+_TAG_RE = re.compile(r"<[^>]+>")
+
+# Candidatos do BM25 avaliados por resultado pedido, antes do filtro de cobertura
+CANDIDATES_PER_RESULT = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    rowid INTEGER PRIMARY KEY,
+    itemtype TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    title TEXT,
+    content TEXT,
+    date_mod TEXT,
+    UNIQUE (itemtype, item_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS docs_fts USING fts5(
+    title, content, content='docs', content_rowid='rowid',
+    tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS docs_ai AFTER INSERT ON docs BEGIN
+    INSERT INTO docs_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_ad AFTER DELETE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+END;
+CREATE TRIGGER IF NOT EXISTS docs_au AFTER UPDATE ON docs BEGIN
+    INSERT INTO docs_fts(docs_fts, rowid, title, content) VALUES ('delete', old.rowid, old.title, old.content);
+    INSERT INTO docs_fts(rowid, title, content) VALUES (new.rowid, new.title, new.content);
+END;
+CREATE TABLE IF NOT EXISTS sync_state (
+    itemtype TEXT PRIMARY KEY,
+    watermark TEXT
+);
+"""
+
+
+def clean_html(texto):
+    """
+    Texto puro a partir do HTML do GLPI (que chega com as tags escapadas, ex.: &lt;p&gt;).
+    """
+    return _TAG_RE.sub(" ", html.unescape(texto or "")).strip()
+
+
+class KnowledgeMirror:
+    """
+    Espelho local (SQLite FTS5) das soluções e da base de conhecimento do GLPI.
+
+    O próprio arquivo SQLite é o snapshot em disco: ao reiniciar, as buscas já
+    são respondidas com o conteúdo da última sincronização. A sincronização
+    traz do GLPI apenas os registros com date_mod maior que a marca d'água
+    salva para cada tipo de item. A cada `full_sync_every` rodadas a
+    sincronização é completa: os registros que sumiram do GLPI (artigos
+    apagados) são removidos do espelho.
+
+    Um resultado só vale se cobrir ao menos `min_coverage` dos termos da
+    pergunta (sem stopwords); senão a busca volta vazia e quem chama recorre
+    ao GLPI. As consultas usam conexões próprias de leitura (uma por
+    thread): com o WAL elas não esperam a gravação da sincronização.
+    """
+
+    def __init__(self, path, page_size=200, interval=300, lock_store=None, min_coverage=0.6,
+                 full_sync_every=12):
+        self.path = path
+        self.page_size = page_size
+        self.interval = interval
+        self.min_coverage = min_coverage
+        self.full_sync_every = full_sync_every
+        self._runs = 0
+        # Com vários workers, só quem reservar a rodada no store sincroniza
+        self.lock_store = lock_store
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._readers = []
+        self._task = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _reader(self):
+        """
+        Conexão somente leitura da thread atual (sem o lock do escritor).
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA query_only=1")
+            self._readers.append(conn)
+        return conn
+
+    def __len__(self):
+        return self._reader().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    # -- consulta -------------------------------------------------------------
+    def search(self, texto, limit=3):
+        """
+        Busca textual (BM25 do FTS5) no espelho local.
+        Retorna uma lista de dicts com itemtype, item_id, title, content, score e
+        coverage (fração dos termos da pergunta presentes no documento).
+        """
+        tokens = [t for t in dict.fromkeys(terms(texto)) if len(t) > 2]
+        if not tokens:
+            return []
+        query = " OR ".join(f'"{t}"' for t in tokens)
+        rows = self._reader().execute(
+            "SELECT d.itemtype, d.item_id, d.title, d.content, bm25(docs_fts) AS score "
+            "FROM docs_fts JOIN docs d ON d.rowid = docs_fts.rowid "
+            "WHERE docs_fts MATCH ? ORDER BY score LIMIT ?",
+            (query, limit * CANDIDATES_PER_RESULT),
+        ).fetchall()
+        results = []
+        for r in rows:
+            found = set(tokenize(f"{r[2] or ''} {r[3] or ''}"))
+            coverage = sum(1 for t in tokens if t in found) / len(tokens)
+            if coverage >= self.min_coverage:
+                results.append({"itemtype": r[0], "item_id": r[1], "title": r[2], "content": r[3],
+                                "score": -r[4], "coverage": round(coverage, 2)})
+                if len(results) == limit:
+                    break
+        return results
+
+    def contents(self):
+        """
+        Título e conteúdo de todos os documentos (para estatísticas de termos).
+        """
+        rows = self._reader().execute("SELECT title, content FROM docs").fetchall()
+        return [f"{title or ''} {content or ''}" for title, content in rows]
+
+    # -- sincronização --------------------------------------------------------
+    def watermark(self, itemtype):
+        row = self._reader().execute(
+            "SELECT watermark FROM sync_state WHERE itemtype = ?", (itemtype,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _apply(self, itemtype, rows, watermark):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO docs (itemtype, item_id, title, content, date_mod) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (itemtype, item_id) DO UPDATE SET "
+                "title = excluded.title, content = excluded.content, date_mod = excluded.date_mod",
+                [(itemtype, *row) for row in rows],
+            )
+            if watermark:
+                self._conn.execute(
+                    "INSERT INTO sync_state (itemtype, watermark) VALUES (?, ?) "
+                    "ON CONFLICT (itemtype) DO UPDATE SET watermark = excluded.watermark",
+                    (itemtype, watermark),
+                )
+
+    def _prune(self, itemtype, seen):
+        """
+        Remove do espelho os registros do tipo que não vieram na sincronização completa.
+        """
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS seen (item_id INTEGER PRIMARY KEY)")
+            self._conn.execute("DELETE FROM seen")
+            self._conn.executemany("INSERT OR IGNORE INTO seen (item_id) VALUES (?)", [(i,) for i in seen])
+            return self._conn.execute(
+                "DELETE FROM docs WHERE itemtype = ? AND item_id NOT IN (SELECT item_id FROM seen)", (itemtype,)
+            ).rowcount
+
+    async def _sync_itemtype(self, client, itemtype, fields, full=False):
+        since = self.watermark(itemtype)
+        display = [f for f in (fields["id"], fields["title"], fields["content"], fields["date_mod"]) if f]
+        params = {f"forcedisplay[{i}]": f for i, f in enumerate(display)}
+        # Completa: tudo, ordenado pelo ID (estável enquanto os registros mudam durante a paginação)
+        params.update({"sort": fields["id" if full else "date_mod"], "order": "ASC"})
+        if since and not full:
+            params.update({
+                "criteria[0][field]": fields["date_mod"],
+                "criteria[0][searchtype]": "morethan",
+                "criteria[0][value]": since,
+            })
+        start, total, seen = 0, 0, set()
+        while True:
+            params["range"] = f"{start}-{start + self.page_size - 1}"
+            response = await client.search(itemtype, params)
+            if response.status_code not in (200, 206):
+                logger.warning(f"Sincronização de {itemtype} falhou: Status {response.status_code}")
+                # Listagem incompleta: nada é removido
+                full = False
+                break
+            data = response.json().get("data") or []
+            rows = []
+            for item in data:
+                date_mod = item.get(str(fields["date_mod"]))
+                rows.append((
+                    int(item.get(str(fields["id"]))),
+                    clean_html(item.get(str(fields["title"]))) if fields["title"] else "",
+                    clean_html(item.get(str(fields["content"]))),
+                    date_mod,
+                ))
+            if rows:
+                watermark = max((r[3] for r in rows if r[3]), default=since)
+                if since and watermark and watermark < since:
+                    watermark = since
+                await asyncio.to_thread(self._apply, itemtype, rows, watermark)
+                total += len(rows)
+                seen.update(r[0] for r in rows)
+            if len(data) < self.page_size:
+                break
+            start += self.page_size
+        if full:
+            removed = await asyncio.to_thread(self._prune, itemtype, seen)
+            if removed:
+                logger.info(f"{removed} registro(s) de {itemtype} removidos do GLPI saíram do espelho.")
+                total += removed
+        return total
+
+    async def sync_once(self, client, full=False):
+        """
+        Traz do GLPI os registros alterados desde a última sincronização
+        (com `full`, todos, removendo do espelho os que não existem mais).
+        """
+        synced = {}
+        for itemtype, fields in SOURCES.items():
+            synced[itemtype] = await self._sync_itemtype(client, itemtype, fields, full)
+        if any(synced.values()):
+            logger.info(f"Espelho da base de conhecimento atualizado: {synced}")
+        return synced
+
+    async def _run(self, client_getter, on_change):
+        first = True
+        while True:
+            try:
+                synced = {}
+                if self.lock_store is None or await asyncio.to_thread(self.lock_store.add, "sync", os.getpid(),
+                                                                      self.interval * 0.9):
+                    self._runs += 1
+                    full = self.full_sync_every > 0 and self._runs % self.full_sync_every == 0
+                    synced = await self.sync_once(client_getter(), full)
+                if on_change is not None and (first or any(synced.values())):
+                    await on_change()
+                first = False
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Falha na sincronização da base de conhecimento: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self, client_getter, on_change=None):
+        """
+        Inicia a sincronização periódica em segundo plano.
+        `on_change` (corrotina) é chamada no início e sempre que a sincronização trouxer novidades.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(client_getter, on_change))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def close(self):
+        with self._lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers = []
+            self._conn.close()
+
+
+def mirror_from_env():
+    """
+    Cria o espelho a partir das variáveis de ambiente (None se desabilitado).
+    """
+    if os.getenv("KB_MIRROR_ENABLED", "1") != "1":
+        return None
+    return KnowledgeMirror(
+        os.getenv("KB_MIRROR_PATH", "data/kb_mirror.db"),
+        page_size=int(os.getenv("KB_SYNC_PAGE_SIZE", "200")),
+        interval=float(os.getenv("KB_SYNC_INTERVAL", "300")),
+        min_coverage=float(os.getenv("KB_MIN_COVERAGE", "0.6")),
+        lock_store=shared_store_from_env("kb_mirror"),
+        full_sync_every=int(os.getenv("KB_FULL_SYNC_EVERY", "12")),
+    )
@@ -0,0 +1,168 @@
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+
+# Valores sensíveis em textos de log: tokens, senhas, chaves e e-mails
+_SECRET_RE = re.compile(
+    r"(?i)(session[_-]?token|app[_-]?token|user[_-]?token|authorization|password|senha|api[_-]?key)"
+    r"([\"']?\s*[:=]\s*[\"']?)(bearer\s+|user_token\s+)?([^\s\"',}&]+)"
+)
+_EMAIL_RE = re.compile(r"[\w.+-]+@([\w-]+(?:\.[\w-]+)+)")
+
+# Atributos padrão do LogRecord; o resto veio de `extra=` e vai para o JSON
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def redact(texto):
+    """
+    Mascara tokens, senhas e e-mails ("joao@empresa.com" -> "***@empresa.com").
+    """
+    texto = _SECRET_RE.sub(lambda m: f"{m.group(1)}{m.group(2)}{m.group(3) or ''}***", texto)
+    return _EMAIL_RE.sub(r"***@\1", texto)
+
+
+def truncate(texto, limit):
+    if limit and len(texto) > limit:
+        return f"{texto[:limit]}... [+{len(texto) - limit} caracteres]"
+    return texto
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    Uma linha JSON por registro, com os campos de `extra=`, já mascarada.
+    Campos longos (ex.: `payload`) são truncados em `max_field` caracteres.
+    """
+
+    def __init__(self, max_field=2000):
+        super().__init__()
+        self.max_field = max_field
+
+    def _clean(self, value):
+        if not isinstance(value, str):
+            value = json.dumps(value, ensure_ascii=False, default=str)
+        return truncate(redact(value), self.max_field)
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": self._clean(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value if isinstance(value, (int, float, bool)) or value is None else self._clean(value)
+        if record.exc_info:
+            entry["exception"] = self._clean(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Formato legível para desenvolvimento local, com a mesma máscara do JSON.
+    """
+
+    def __init__(self, max_field=2000):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        self.max_field = max_field
+
+    def format(self, record):
+        return truncate(redact(super().format(record)), self.max_field)
+
+
+class PayloadSampler(logging.Filter):
+    """
+    Mantém só uma fração (`rate`) dos registros que carregam corpo de
+    requisição/resposta (`extra={"payload": ...}`). Avisos e erros passam sempre.
+    """
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if "payload" not in record.__dict__ or record.levelno >= logging.WARNING:
+            return True
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Entrega o registro à fila sem formatar (a formatação e a máscara rodam na
+    thread de escrita). Com a fila cheia o registro é descartado e contado,
+    em vez de segurar a requisição.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Mesmo processo: basta fixar a mensagem para que os argumentos não mudem depois
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_levels(spec):
+    """
+    "glpi_session=WARNING,kb_mirror=DEBUG" -> {"glpi_session": "WARNING", "kb_mirror": "DEBUG"}
+    """
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+_listener = None
+
+
+def setup_logging():
+    """
+    Configura o logging do processo a partir do ambiente:
+    LOG_LEVEL (raiz), LOG_LEVELS (por módulo), LOG_FORMAT (json|text),
+    LOG_MAX_FIELD, LOG_PAYLOAD_SAMPLE_RATE e LOG_QUEUE_SIZE.
+
+    Os módulos só colocam o registro em uma fila; uma thread separada
+    formata, mascara e escreve no stdout.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    max_field = int(os.getenv("LOG_MAX_FIELD", "2000"))
+    stream = logging.StreamHandler(sys.stdout)
+    if os.getenv("LOG_FORMAT", "json") == "json":
+        stream.setFormatter(JSONFormatter(max_field))
+    else:
+        stream.setFormatter(TextFormatter(max_field))
+
+    handler = _NonBlockingQueueHandler(queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+    handler.addFilter(PayloadSampler(float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+    # Logs do uvicorn/gunicorn seguem pelo mesmo caminho
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access", "gunicorn.error", "gunicorn.access"):
+        logging.getLogger(name).handlers = []
+        logging.getLogger(name).propagate = True
+    for name, level in parse_levels(os.getenv("LOG_LEVELS")).items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,24 +1,58 @@
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Response
 from pydantic import BaseModel
+from typing import List
+from category_catalog import catalog_from_env
 from glpi_api import GLPIClient  # Mantém o cliente GLPI
+from glpi_client import close_glpi_client, get_glpi_client
+from glpi_session import GLPIAuthError
+from kb_mirror import mirror_from_env
+from cache import TTLCache, normalize_key
+from store import shared_store_from_env
+from ticket_batcher import TicketCreationError, get_ticket_batcher
+from ticket_queue import queue_from_env
+from feedback_buffer import buffer_from_env
+from idempotency import idempotency_from_env, tool_call_id
+from deadline import budget_from_request, run_with_deadline, stats as deadline_stats
+from metrics import REGISTRY, MetricsMiddleware
+from tool_calls import ToolDispatcher, current_message, decode_envelope
+from resilience import CircuitOpenError
+from solution_search import search_from_env
+from ticket_status import describe, status_from_env
+from requester import get_requester_resolver, normalize_email, requester_fields
+from incidents import aggregator_from_env
+from admission import admission_from_env
+from attachments import attachments_from_env
 from urllib.parse import urljoin
 from time import time
-import requests
+import re
+import asyncio
+import httpx
 import json
 from fastapi import Request
 from dotenv import load_dotenv
 import os
 import logging
+from logging_config import setup_logging
+from tracing import TracingMiddleware, call_id as vapi_call_id, setup_tracing, span, use_call_id
+from capture import CaptureMiddleware, capture_from_env
 
 
 # Configuração inicial
 load_dotenv()
 app = FastAPI(title="TechVoiceSuportIA API")
-
-# Logging
-logging.basicConfig(level=logging.INFO)
+# Contagem, erros e latência por endpoint (exportados em /metrics)
+app.add_middleware(MetricsMiddleware, routes=lambda: app.routes)
+# Um trace por requisição (amostrado), com spans de classificação, cache e chamadas ao GLPI
+app.add_middleware(TracingMiddleware, routes=lambda: app.routes)
+setup_tracing()
+
+# Logging estruturado (JSON), mascarado e escrito fora do caminho da requisição
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Captura opcional (CAPTURE_FILE) das requisições do VAPI, redigidas, para benchmarks/replay.py
+app.add_middleware(CaptureMiddleware, **capture_from_env())
+
 # Variáveis de ambiente
 GLPI_URL = os.getenv("GLPI_URL")
 GLPI_APP_TOKEN = os.getenv("GLPI_APP_TOKEN")
@@ -32,56 +66,6 @@ if not all([GLPI_APP_TOKEN, GLPI_USER_TOKEN, VAPI_API_KEY]):
 if not all([GLPI_APP_TOKEN, GLPI_USER_TOKEN, VAPI_API_KEY]):
     raise RuntimeError("GLPI_APP_TOKEN, GLPI_USER_TOKEN e VAPI_API_KEY são obrigatórios no .env")
 
-# Mapeamento de categorias do GLPI
-CATEGORIAS = {
-    "infraestrutura": {"category_id": 1, "title": "Infraestrutura"},
-    "infraestrutura backup": {"category_id": 2, "title": "Infraestrutura > Backup"},
-    "infraestrutura backup agendamento": {"category_id": 3, "title": "Infraestrutura > Backup > Agendamento"},
-    "infraestrutura backup falha de backup": {"category_id": 4, "title": "Infraestrutura > Backup > Falha de Backup"},
-    "infraestrutura backup restauração": {"category_id": 5, "title": "Infraestrutura > Backup > Restauração"},
-    "infraestrutura computadores": {"category_id": 6, "title": "Infraestrutura > Computadores"},
-    "infraestrutura computadores desktops": {"category_id": 7, "title": "Infraestrutura > Computadores > Desktops"},
-    "infraestrutura computadores formatação reinstalação": {"category_id": 8, "title": "Infraestrutura > Computadores > Formatação/Reinstalação"},
-    "infraestrutura computadores notebooks": {"category_id": 9, "title": "Infraestrutura > Computadores > Notebooks"},
-    "infraestrutura computadores upgrade manutenção": {"category_id": 10, "title": "Infraestrutura > Computadores > Upgrade/Manutenção"},
-    "infraestrutura data center": {"category_id": 11, "title": "Infraestrutura > Data Center"},
-    "infraestrutura data center climatização": {"category_id": 12, "title": "Infraestrutura > Data Center > Climatização"},
-    "infraestrutura data center energia": {"category_id": 13, "title": "Infraestrutura > Data Center > Energia"},
-    "infraestrutura data center racks": {"category_id": 14, "title": "Infraestrutura > Data Center > Racks"},
-    "infraestrutura firewall security": {"category_id": 15, "title": "Infraestrutura > Firewall/Security"},
-    "infraestrutura firewall security bloqueio de sites": {"category_id": 16, "title": "Infraestrutura > Firewall/Security > Bloqueio de Sites"},
-    "infraestrutura firewall security regras de acesso": {"category_id": 17, "title": "Infraestrutura > Firewall/Security > Regras de Acesso"},
-    "infraestrutura impressoras": {"category_id": 18, "title": "Infraestrutura > Impressoras"},
-    "infraestrutura impressoras compartilhamento": {"category_id": 19, "title": "Infraestrutura > Impressoras > Compartilhamento"},
-    "infraestrutura impressoras configuração": {"category_id": 20, "title": "Infraestrutura > Impressoras > Configuração"},
-    "infraestrutura impressoras erro físico": {"category_id": 21, "title": "Infraestrutura > Impressoras > Erro Físico"},
-    "infraestrutura impressoras falta de tinta toner": {"category_id": 22, "title": "Infraestrutura > Impressoras > Falta de Tinta/Toner"},
-    "infraestrutura periféricos": {"category_id": 23, "title": "Infraestrutura > Periféricos"},
-    "infraestrutura periféricos monitor": {"category_id": 24, "title": "Infraestrutura > Periféricos > Monitor"},
-    "infraestrutura periféricos outros": {"category_id": 25, "title": "Infraestrutura > Periféricos > Outros"},
-    "infraestrutura periféricos outros dúvidas gerais": {"category_id": 26, "title": "Infraestrutura > Periféricos > Outros > Dúvidas Gerais"},
-    "infraestrutura periféricos outros solicitações diversas": {"category_id": 27, "title": "Infraestrutura > Periféricos > Outros > Solicitações Diversas"},
-    "infraestrutura periféricos teclado mouse": {"category_id": 28, "title": "Infraestrutura > Periféricos > Teclado/Mouse"},
-    "infraestrutura rede": {"category_id": 29, "title": "Infraestrutura > Rede"},
-    "infraestrutura rede cabeada": {"category_id": 30, "title": "Infraestrutura > Rede > Cabeada"},
-    "infraestrutura rede lentidão": {"category_id": 31, "title": "Infraestrutura > Rede > Lentidão"},
-    "infraestrutura rede sem conexão": {"category_id": 32, "title": "Infraestrutura > Rede > Sem Conexão"},
-    "infraestrutura rede vpn": {"category_id": 33, "title": "Infraestrutura > Rede > VPN"},
-    "infraestrutura rede wi-fi": {"category_id": 34, "title": "Infraestrutura > Rede > Wi-Fi"},
-    "infraestrutura servidores": {"category_id": 35, "title": "Infraestrutura > Servidores"},
-    "infraestrutura servidores backup de servidor": {"category_id": 36, "title": "Infraestrutura > Servidores > Backup de Servidor"},
-    "infraestrutura servidores linux": {"category_id": 37, "title": "Infraestrutura > Servidores > Linux"},
-    "infraestrutura servidores virtualização": {"category_id": 38, "title": "Infraestrutura > Servidores > Virtualização"},
-    "infraestrutura servidores windows": {"category_id": 39, "title": "Infraestrutura > Servidores > Windows"},
-    "infraestrutura software de infraestrutura": {"category_id": 40, "title": "Infraestrutura > Software de Infraestrutura"},
-    "infraestrutura software de infraestrutura antivírus": {"category_id": 41, "title": "Infraestrutura > Software de Infraestrutura > Antivírus"},
-    "infraestrutura software de infraestrutura ferramentas de monitoramento": {"category_id": 42, "title": "Infraestrutura > Software de Infraestrutura > Ferramentas de Monitoramento"},
-    "infraestrutura software de infraestrutura licenciamento": {"category_id": 43, "title": "Infraestrutura > Software de Infraestrutura > Licenciamento"},
-    "infraestrutura telefonia": {"category_id": 44, "title": "Infraestrutura > Telefonia"},
-    "infraestrutura telefonia convencional": {"category_id": 45, "title": "Infraestrutura > Telefonia > Convencional"},
-    "infraestrutura telefonia ip": {"category_id": 46, "title": "Infraestrutura > Telefonia > IP"},
-    "infraestrutura telefonia pabx": {"category_id": 47, "title": "Infraestrutura > Telefonia > PABX"}
-}
 
 # Modelos Pydantic
 class Consulta(BaseModel):
@@ -105,107 +89,244 @@ class TicketRequest(BaseModel):
     description: str
     requester_email: str
 
+class TicketBatchRequest(BaseModel):
+    tickets: List[TicketRequest]
+
+class ClassifyRequest(BaseModel):
+    textos: List[str]
+
+# Controle de admissão: limite por chamador em cada endpoint e teto de chamadas simultâneas por
+# operação do GLPI (glpi_search, glpi_ticket). O excesso recebe 429 com Retry-After.
+admission = admission_from_env()
+admission.operation("glpi_search", concurrency=20)
+admission.operation("glpi_ticket", concurrency=10)
+
+# Árvore de categorias ITIL do GLPI (snapshot em disco, atualizada em segundo plano) e classificador
+category_catalog = catalog_from_env(match="all")
+
+# Busca de soluções no GLPI com ranqueamento BM25 local
+solution_search = search_from_env()
+
+async def atualizar_estatisticas_busca():
+    # Estatísticas de termos (BM25) calculadas sobre o espelho, fora do event loop
+    texts = await asyncio.to_thread(kb_mirror.contents)
+    await asyncio.to_thread(solution_search.ranker.update_stats, texts)
+
+# Espelho local das soluções/base de conhecimento (SQLite FTS5), sincronizado em segundo plano
+kb_mirror = mirror_from_env()
+
+# Fila durável de criação de tickets (opcional, TICKET_WRITE_BEHIND=1)
+ticket_queue = queue_from_env()
+
+# Idempotência por ID da tool call do VAPI (ou header Idempotency-Key): evita tickets duplicados
+idempotency = idempotency_from_env()
+
+# Status de tickets (cache curto, revalidado pela data de modificação); invalidado quando a
+# própria API cria o ticket ou envia um acompanhamento
+ticket_status = status_from_env()
+
+# Relatos semelhantes em sequência (queda de rede, sistema fora do ar) viram um ticket mestre
+# com acompanhamentos, em vez de um ticket por ligação
+incidents = aggregator_from_env(get_glpi_client)
+
+# Transcrição (e gravação, opcional) da ligação anexadas ao ticket depois da resposta ao VAPI
+call_attachments = attachments_from_env(get_glpi_client)
+
+# Buffer de feedbacks enviados ao GLPI em lote (TicketFollowup)
+feedback_buffer = buffer_from_env(get_glpi_client, on_sent=ticket_status.invalidate)
+
+@app.on_event("startup")
+async def iniciar_sincronizacao():
+    category_catalog.start(get_glpi_client)
+    get_requester_resolver().start()
+    if kb_mirror is not None:
+        kb_mirror.start(get_glpi_client, on_change=atualizar_estatisticas_busca)
+    if ticket_queue is not None:
+        ticket_queue.start(get_glpi_client)
+    feedback_buffer.start()
+
+# Cache TTL+LRU das respostas de /consultar_solucao (opcionalmente compartilhado entre workers)
+solution_cache = TTLCache(
+    maxsize=int(os.getenv("SOLUTION_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SOLUTION_CACHE_TTL", "60")),
+    backend=shared_store_from_env("consultar_solucao"),
+)
+
+@app.on_event("shutdown")
+async def encerrar_sessoes():
+    await category_catalog.stop()
+    await get_requester_resolver().stop()
+    if kb_mirror is not None:
+        await kb_mirror.stop()
+    if ticket_queue is not None:
+        await ticket_queue.stop()
+    await feedback_buffer.stop()
+    if call_attachments is not None:
+        await call_attachments.stop()
+    await close_glpi_client()
+
 # Funções auxiliares
-def iniciar_sessao():
-    url = f"{GLPI_URL}/initSession"
-    headers = {
-        "Content-Type": "application/json",
-        "App-Token": GLPI_APP_TOKEN
-    }
-    payload = {"user_token": GLPI_USER_TOKEN}
-    logger.info(f"Tentando iniciar sessão com URL: {url}, Headers: {headers}, Payload: {payload}")
-    response = requests.post(url, json=payload, headers=headers, timeout=10)
-    logger.info(f"Resposta do GLPI: Status {response.status_code}, Texto: {response.text}")
-    if response.status_code == 200:
-        session_data = response.json()
-        session_token = session_data.get("session_token")
-        if session_token:
-            logger.info(f"Sessão iniciada com sucesso. Token: {session_token[:8]}****")
+async def iniciar_sessao():
+    """
+    Retorna um session_token válido do pool (sem abrir uma sessão nova a cada chamada).
+    """
+    try:
+        async with get_glpi_client().sessions.session() as session_token:
             return session_token
-        else:
-            raise HTTPException(status_code=400, detail="Session_token não encontrado na resposta do GLPI.")
-    raise HTTPException(status_code=response.status_code, detail=f"Erro ao iniciar sessão: {response.text}")
-
-def close_glpi_session(session_token: str):
-    headers = {"App-Token": GLPI_APP_TOKEN, "Session-Token": session_token}
-    requests.get(f"{GLPI_URL}/killSession", headers=headers, timeout=10)
+    except GLPIAuthError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
 
 def classify_intent(texto: str):
-    texto = texto.lower()
-    for key, value in sorted(CATEGORIAS.items(), key=lambda x: x[0].count(' '), reverse=True):
-        if all(word in texto for word in key.split()):
-            return value
-    return CATEGORIAS.get("infraestrutura", {"category_id": 1, "title": "Infraestrutura"})
+    with span("classify") as classify_span:
+        intent = category_catalog.classify(texto)
+        classify_span.set("category_id", intent["category_id"])
+        return intent
 
 # Endpoints para Tools do VAPI (sem workflow)
 from fastapi import Request
 import json
 
-@app.post("/consultar_solucao")
-async def consultar_solucao(request: Request):
+async def buscar_solucao(problema: str):
+    """
+    Busca a solução no espelho local e, se não houver resultado, no GLPI.
+    """
+    # Primeiro consulta o espelho local; o GLPI só é consultado se não houver resultado
+    if kb_mirror is not None:
+        with span("kb_mirror.search") as mirror_span:
+            encontrados = await asyncio.to_thread(kb_mirror.search, problema, 1)
+            mirror_span.set("results", len(encontrados))
+        if encontrados:
+            return f"Solução encontrada: {encontrados[0]['content']}"
+
+    # Uma consulta ao GLPI traz um conjunto limitado de candidatos; o BM25 local escolhe o melhor.
+    # Busca é uma leitura: o cliente aplica o timeout da operação e repete com backoff se o GLPI falhar;
+    # com o circuito aberto a chamada falha na hora
+    encontrados = await buscar_solucoes_glpi(problema, k=1)
+    if encontrados:
+        return f"Solução encontrada: {encontrados[0]['content']}"
+    return "Nenhuma solução encontrada"
+
+async def buscar_solucoes_glpi(problema: str, k: int = 3):
     try:
-        # Recebe os dados do VAPI como formulário
-        form_data = await request.form()
-        problema = form_data.get("problema", "")
-
-        if not problema:
-            raise HTTPException(status_code=400, detail="O parâmetro 'problema' é obrigatório.")
-
-        # Inicia sessão no GLPI
-        session_token = iniciar_sessao()
-        if not session_token:
-            raise HTTPException(status_code=500, detail="Sessão GLPI não iniciada.")
-
-        # Configura headers para a requisição ao GLPI
-        headers = {
-            "Content-Type": "application/json",
-            "Session-Token": session_token,
-            "App-Token": GLPI_APP_TOKEN
-        }
-
-        # Parâmetros da busca no GLPI (exemplo: busca por soluções com base no problema)
-        params = {
-            "criteria": [{"field": "12", "searchtype": "contains", "value": problema}]  # Campo 12 = conteúdo da solução
-        }
+        return await solution_search.search(get_glpi_client(), problema, k=k)
+    except CircuitOpenError as e:
+        logger.warning(f"Consulta de solução recusada: {str(e)}")
+        raise HTTPException(status_code=503, detail="GLPI indisponível no momento.")
+    except httpx.HTTPError as e:
+        logger.error(f"Falha ao consultar solução: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar solução no GLPI: {str(e)}")
+
+async def consultar(problema: str):
+    # Perguntas iguais (mesmo texto normalizado) compartilham o resultado e a busca em andamento
+    return await solution_cache.get_or_load(normalize_key(problema), lambda: buscar_solucao(problema))
+
+@app.get("/solucoes", dependencies=[admission.limit("solucoes", rate="10/20", operation="glpi_search")])
+async def listar_solucoes(problema: str, k: int = 3):
+    """
+    As `k` soluções mais relevantes para o problema (espelho local e GLPI), com score BM25.
+    """
+    encontrados = await asyncio.to_thread(kb_mirror.search, problema, k) if kb_mirror is not None else []
+    if not encontrados:
+        encontrados = await buscar_solucoes_glpi(problema, k=k)
+    return {"problema": problema, "resultados": encontrados}
+
+@app.post("/consultar_solucao", dependencies=[admission.limit("consultar_solucao", rate="10/20", operation="glpi_search")])
+async def consultar_solucao(request: Request):
+    # Recebe os dados do VAPI como formulário
+    form_data = await request.form()
+    problema = form_data.get("problema", "")
 
-        # Faz a requisição ao GLPI com timeout de 10 segundos e limite de 2 tentativas
-        max_attempts = 2
-        for attempt in range(max_attempts):
-            try:
-                response = requests.post(
-                    f"{GLPI_URL}/Solution",
-                    json=params,
-                    headers=headers,
-                    timeout=10
-                )
-                response.raise_for_status()  # Levanta exceção para códigos de erro HTTP
-                break  # Sai do loop se a requisição for bem-sucedida
-            except requests.exceptions.RequestException as e:
-                if attempt == max_attempts - 1:  # Última tentativa falhou
-                    logger.error(f"Falha ao consultar solução após {max_attempts} tentativas: {str(e)}")
-                    raise HTTPException(status_code=500, detail=f"Erro ao consultar solução no GLPI: {str(e)}")
-                logger.warning(f"Tentativa {attempt + 1} falhou, tentando novamente: {str(e)}")
-                time.sleep(2)  # Aguarda 2 segundos antes de retry
-
-        # Processa a resposta do GLPI
-        data = response.json()
-        if data and "data" in data and len(data["data"]) > 0:
-            solucao = data["data"][0].get("content", "Nenhuma solução detalhada encontrada.")
-            return f"Solução encontrada: {solucao}"
-        else:
-            return "Nenhuma solução encontrada"
+    if not problema:
+        raise HTTPException(status_code=400, detail="O parâmetro 'problema' é obrigatório.")
 
+    try:
+        # Leitura: ao estourar o prazo este pedido recebe a resposta de fallback; a busca compartilhada
+        # (single-flight do cache) segue para os outros pedidos e preenche o cache
+        return await run_with_deadline("consultar_solucao", consultar(problema),
+                                       budget_from_request("consultar_solucao", headers=request.headers))
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Erro ao consultar solução: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        close_glpi_session(session_token)
 
-@app.post("/criar_ticket")
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"consultar_solucao": solution_cache.stats(), "ticket_status": ticket_status.stats(),
+            "solicitantes": get_requester_resolver().stats(), "feedback": feedback_buffer.stats()}
+
+# Tamanho de pools, filas e buffers, lidos no momento da coleta
+POOL_GAUGE = REGISTRY.gauge("glpi_session_pool", "Sessões GLPI do pool (size, tokens, in_use).", ("kind",))
+BACKLOG_GAUGE = REGISTRY.gauge("backlog_items", "Itens aguardando envio ou em cache.", ("component",))
+
+CIRCUIT_GAUGE = REGISTRY.gauge("glpi_circuit_open", "Disjuntor da operação GLPI (0 fechado, 1 aberto, 0.5 meio-aberto).",
+                               ("operation",))
+
+@REGISTRY.on_collect
+def coletar_tamanhos():
+    for operation, state in get_glpi_client().breakers.snapshot().items():
+        CIRCUIT_GAUGE.set(operation, value={"closed": 0, "open": 1}.get(state["state"], 0.5))
+    for kind, value in get_glpi_client().sessions.stats().items():
+        POOL_GAUGE.set(kind, value=value)
+    BACKLOG_GAUGE.set("ticket_batcher", value=len(get_ticket_batcher()))
+    BACKLOG_GAUGE.set("feedback_buffer", value=len(feedback_buffer))
+    BACKLOG_GAUGE.set("solution_cache", value=len(solution_cache))
+
+@app.get("/metrics")
+async def metrics():
+    # A coleta lê estruturas do event loop e roda nele; só a contagem da fila SQLite
+    # do write-behind (leitura bloqueante) vai para uma thread
+    if ticket_queue is not None:
+        BACKLOG_GAUGE.set("ticket_queue", value=await asyncio.to_thread(ticket_queue.pending))
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/glpi/status")
+async def glpi_status():
+    """
+    Estado dos disjuntores (closed, open, half_open) de cada operação do GLPI.
+    """
+    return {"circuits": get_glpi_client().breakers.snapshot(), "sessions": get_glpi_client().sessions.stats()}
+
+@app.get("/admission/stats")
+async def admission_stats():
+    """
+    Limites de taxa por endpoint e ocupação de cada operação do GLPI.
+    """
+    return admission.snapshot()
+
+@app.get("/incidentes")
+async def incidentes_ativos():
+    """
+    Incidentes em andamento: relatos semelhantes agrupados, tickets e ticket mestre.
+    """
+    return {"incidentes": incidents.snapshot() if incidents is not None else []}
+
+@app.get("/deadlines/stats")
+async def deadlines_stats():
+    """
+    Quantas vezes cada endpoint estourou o prazo e a distribuição do tempo de resposta.
+    """
+    return deadline_stats.snapshot()
+
+def montar_ticket(ticket: Ticket):
+    """
+    Monta o `input` do Ticket no GLPI a partir dos dados coletados pelo VAPI.
+    """
+    intent = classify_intent(ticket.problema)
+    return {
+        "name": intent["title"],
+        "content": f"Usuário: {ticket.nome}\nEmail: {ticket.email}\nProblema: {ticket.problema}",
+        "itilcategories_id": intent["category_id"],
+        "type": 1,
+        "status": 1,
+        "entities_id": 1
+    }
+
+@app.post("/criar_ticket", dependencies=[admission.limit("criar_ticket", rate="5/10", operation="glpi_ticket")])
 async def criar_ticket(request: Request):
     body = await request.body()
     raw_payload = body.decode('utf-8')
-    logger.info(f"Raw payload recebido em /criar_ticket: {raw_payload}")
+    logger.debug("Payload recebido em /criar_ticket", extra={"payload": raw_payload})
     try:
         data = json.loads(raw_payload)
         arguments = data.get('message', {}).get('toolCalls', [{}])[0].get('function', {}).get('arguments', {})
@@ -217,74 +338,145 @@ async def criar_ticket(request: Request):
         logger.error(f"Erro de validação em /criar_ticket: {str(e)}")
         raise HTTPException(status_code=422, detail=str(e))
 
-    session_token = iniciar_sessao()
+    # Retentativas do VAPI reutilizam o mesmo toolCalls[].id: devolvem o resultado da primeira
+    use_call_id(vapi_call_id(data))
+    call_id = tool_call_id(data)
+    key = f"criar_ticket:{call_id}" if call_id else None
+    # Escrita: ao estourar o prazo o registro continua em segundo plano (a retentativa recebe o resultado)
+    return await run_with_deadline("criar_ticket", idempotency.run(key, lambda: registrar_ticket(ticket, data.get("message"))),
+                                   budget_from_request("criar_ticket", data, request.headers),
+                                   continue_in_background=True)
+
+async def registrar_ticket(ticket: Ticket, chamada: dict = None):
+    # Solicitante ligado ao usuário do GLPI pelo e-mail (cache; sem chamada extra quando aquecido)
+    solicitante = await get_requester_resolver().fields(ticket.email)
+    ticket_data = {"input": {**montar_ticket(ticket), **solicitante}}
+
+    # Modo write-behind: grava na fila durável e responde na hora com protocolo provisório
+    if ticket_queue is not None:
+        ref = await ticket_queue.put(ticket_data["input"])
+        logger.info(f"Ticket enfileirado para envio ao GLPI. Protocolo provisório: {ref}")
+        return f"Chamado registrado. Protocolo provisório: {ref}"
+
     try:
-        ticket_url = f"{GLPI_URL}/Ticket"
-        logger.info(f"Tentando criar ticket em: {ticket_url} com session_token: {session_token[:8]}****")
-        headers = {"Content-Type": "application/json", "Session-Token": session_token, "App-Token": GLPI_APP_TOKEN}
-        intent = classify_intent(ticket.problema)
-        ticket_data = {
-            "input": {
-                "name": intent["title"],
-                "content": f"Usuário: {ticket.nome}\nEmail: {ticket.email}\nProblema: {ticket.problema}",
-                "itilcategories_id": intent["category_id"],
-                "type": 1,
-                "status": 1,
-                "entities_id": 1
-            }
-        }
-        response = requests.post(ticket_url, json=ticket_data, headers=headers, timeout=10)
-        logger.info(f"Resposta do GLPI para criar ticket: Status {response.status_code}, Texto: {response.text}")
-        if response.status_code == 403:
-            logger.error(f"Erro 403: Permissão negada para {ticket_url} - Resposta: {response.text}")
-            raise HTTPException(status_code=403, detail=f"Permissão negada no GLPI. Resposta: {response.text}")
-        response.raise_for_status()
-        ticket_id = response.json().get("id")
+        # Tickets criados ao mesmo tempo seguem juntos em um único POST ao GLPI
+        if incidents is None:
+            ticket_id = await get_ticket_batcher().create(ticket_data["input"])
+        else:
+            resultado = await incidents.report(ticket_data["input"], ticket.problema, get_ticket_batcher().create)
+            ticket_id = resultado["ticket_id"]
+            if resultado["known"]:
+                await ticket_status.invalidate(ticket_id)
+                return (f"Este problema já é conhecido e a equipe de suporte está tratando o incidente "
+                        f"no chamado {ticket_id}, com {resultado['reports']} relatos. "
+                        f"O seu relato foi registrado nesse chamado.")
+        logger.info(f"Ticket criado no GLPI. ID: {ticket_id}")
+        await ticket_status.invalidate(ticket_id)
+        if call_attachments is not None:
+            # Só agenda: o upload roda depois que o VAPI já recebeu o ID
+            call_attachments.schedule(ticket_id, chamada)
         return f"Ticket criado com sucesso. ID: {ticket_id}"  # Retorno como string pura para VAPI passar como content
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Erro ao criar ticket: {str(e)} - Resposta: {getattr(e.response, 'text', 'Sem resposta')}")
-        raise HTTPException(status_code=500, detail=f"Erro ao conectar ao GLPI: {str(e)}")
+    except TicketCreationError as e:
+        if e.status_code == 403:
+            logger.error(f"Erro 403: Permissão negada ao criar ticket - Resposta: {e.detail}")
+            raise HTTPException(status_code=403, detail=f"Permissão negada no GLPI. Resposta: {e.detail}")
+        logger.error(f"Erro ao criar ticket: Status {e.status_code} - Resposta: {e.detail}")
+        raise HTTPException(status_code=500, detail=f"Erro ao criar ticket no GLPI: {e.detail}")
     except Exception as e:
         logger.error(f"Erro inesperado ao criar ticket: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        close_glpi_session(session_token)
 
-@app.post("/coletar_feedback")
+@app.get("/tickets/{ticket_id}/status", dependencies=[admission.limit("ticket_status", rate="10/20", operation="glpi_search")])
+async def consultar_status(ticket_id: int):
+    """
+    Status, grupo atribuído e último acompanhamento público do ticket (com cache curto).
+    """
+    try:
+        status = await ticket_status.status(get_glpi_client(), str(ticket_id))
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except httpx.HTTPError as e:
+        logger.error(f"Erro ao consultar status do ticket {ticket_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Erro ao consultar o GLPI.")
+    if not status["found"]:
+        raise HTTPException(status_code=404, detail="Chamado não encontrado.")
+    return {**status, "mensagem": describe(status)}
+
+@app.get("/tickets/provisorio/{ref}")
+async def consultar_protocolo(ref: str):
+    if ticket_queue is None:
+        raise HTTPException(status_code=404, detail="Fila de tickets desabilitada.")
+    item = await asyncio.to_thread(ticket_queue.lookup, ref)
+    if item is None:
+        raise HTTPException(status_code=404, detail="Protocolo não encontrado.")
+    return item
+
+@app.post("/coletar_feedback", dependencies=[admission.limit("coletar_feedback", rate="5/20")])
 async def coletar_feedback(feedback: Feedback):
-    session_token = iniciar_sessao()
     try:
-        headers = {"Content-Type": "application/json", "Session-Token": session_token, "App-Token": GLPI_APP_TOKEN}
-        if feedback.ticket_id:
-            followup_data = {
-                "input": {
-                    "tickets_id": feedback.ticket_id,
-                    "content": f"Feedback: Nota {feedback.nota}/5. Comentário: {feedback.comentario or 'Nenhum'}"
-                }
-            }
-            response = requests.post(f"{GLPI_URL}/TicketFollowup", json=followup_data, headers=headers, timeout=10)
-            response.raise_for_status()
+        # Enviado ao GLPI em lote; sem ticket_id fica gravado localmente para análise
+        await feedback_buffer.add(feedback.nota, feedback.comentario, feedback.ticket_id)
+        await ticket_status.invalidate(feedback.ticket_id)
         return {"message": "Feedback coletado!"}
     except Exception as e:
         logger.error(f"Erro ao coletar feedback: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        close_glpi_session(session_token)
+
+# Tool calls do VAPI em uma única requisição: cada toolCall vai para o seu handler, em paralelo
+tools = ToolDispatcher(idempotency, admission)
+
+@tools.tool("consultar_solucao", operation="glpi_search")
+async def tool_consultar_solucao(arguments: dict):
+    problema = arguments.get("problema")
+    if not problema:
+        raise HTTPException(status_code=400, detail="O parâmetro 'problema' é obrigatório.")
+    return await consultar(problema)
+
+@tools.tool("criar_ticket", write=True, operation="glpi_ticket")
+async def tool_criar_ticket(arguments: dict):
+    message = current_message.get()
+    return await registrar_ticket(Ticket(**arguments), message.model_dump(exclude_none=True) if message else None)
+
+@tools.tool("coletar_feedback", write=True)
+async def tool_coletar_feedback(arguments: dict):
+    feedback = Feedback(**arguments)
+    await feedback_buffer.add(feedback.nota, feedback.comentario, feedback.ticket_id)
+    await ticket_status.invalidate(feedback.ticket_id)
+    return "Feedback coletado!"
+
+def numero_ticket(valor):
+    # "chamado número 1.234" -> "1234"
+    digitos = re.sub(r"\D", "", str(valor or ""))
+    if not digitos:
+        raise HTTPException(status_code=400, detail="Informe o número do chamado.")
+    return digitos
+
+@tools.tool("consultar_status", operation="glpi_search")
+async def tool_consultar_status(arguments: dict):
+    status = await ticket_status.status(get_glpi_client(), numero_ticket(arguments.get("ticket_id")))
+    return describe(status)
+
+@app.post("/vapi/tool-calls", dependencies=[admission.limit("vapi_tool_calls", rate="20/40")])
+async def vapi_tool_calls(request: Request):
+    """
+    Endpoint único das ferramentas do VAPI. Retorna {"results": [{"toolCallId", "result" | "error"}]}.
+    """
+    envelope = decode_envelope(await request.body())
+    use_call_id((envelope.message.call or {}).get("id"))
+    return await tools.dispatch(envelope, request.headers)
 
 # Endpoints existentes do seu código
-@app.post("/chamado")
-async def create_chamado(request: ChamadoRequest):
+@app.post("/chamado", dependencies=[admission.limit("chamado", rate="5/10", operation="glpi_ticket")])
+async def create_chamado(request: ChamadoRequest, raw: Request, idempotency_key: str = Header(None)):
+    key = f"chamado:{idempotency_key}" if idempotency_key else None
+    resultado = await run_with_deadline("chamado", idempotency.run(key, lambda: abrir_chamado(request)),
+                                        budget_from_request("chamado", headers=raw.headers),
+                                        continue_in_background=True)
+    return resultado if isinstance(resultado, dict) else {"message": resultado, "pendente": True}
+
+async def abrir_chamado(request: ChamadoRequest):
     try:
         intent = classify_intent(request.texto)
-        session_token = iniciar_sessao()
-        
-        headers = {
-            "Content-Type": "application/json",
-            "App-Token": GLPI_APP_TOKEN,
-            "Session-Token": session_token
-        }
-
-        ticket_url = f"{GLPI_URL}/apirest.php/Ticket"
         payload = {
             "input": {
                 "name": intent["title"],
@@ -295,32 +487,48 @@ async def create_chamado(request: ChamadoRequest):
             }
         }
 
-        ticket_response = requests.post(ticket_url, json=payload, headers=headers, timeout=10)
-
-        # Encerrar sessão
-        requests.get(f"{GLPI_URL}/apirest.php/killSession", headers=headers)
-
-        try:
-            return ticket_response.json()
-        except Exception:
-            return {"status_code": ticket_response.status_code, "text": ticket_response.text}
+        result = await get_ticket_batcher().submit(payload["input"])
+        if result["id"]:
+            await ticket_status.invalidate(result["id"])
+            return {"id": result["id"], "message": result["message"]}
+        return {"status_code": result["status"], "text": result["message"]}
     except Exception as e:
         logger.error(f"Erro ao criar chamado: {str(e)}")
         return {"error": str(e)}
 
-@app.post("/create-ticket/")
-def create_ticket(request: TicketRequest):
-    glpi = GLPIClient()
-    glpi.authenticate()
-    if not glpi.session_token:
+@app.post("/create-ticket/", dependencies=[admission.limit("create-ticket", rate="5/10", operation="glpi_ticket")])
+async def create_ticket(request: TicketRequest, idempotency_key: str = Header(None)):
+    key = f"create-ticket:{idempotency_key}" if idempotency_key else None
+    return await idempotency.run(key, lambda: criar_ticket_cliente(request))
+
+async def criar_ticket_cliente(request: TicketRequest):
+    client = GLPIClient()
+    if not await client.authenticate():
         raise HTTPException(status_code=500, detail="Falha na autenticação com o GLPI.")
-    ticket_id = glpi.create_ticket(request.title, request.description, request.requester_email)
+    ticket_id = await client.create_ticket(request.title, request.description, request.requester_email)
     if not ticket_id:
-        glpi.logout()
         raise HTTPException(status_code=500, detail="Falha ao criar o chamado no GLPI.")
-    glpi.logout()
+    await ticket_status.invalidate(ticket_id)
     return {"message": "Chamado criado com sucesso!", "ticket_id": ticket_id}
 
+@app.post("/tickets/batch", dependencies=[admission.limit("tickets_batch", rate="0.2/2", operation="glpi_ticket")])
+async def create_tickets_batch(request: TicketBatchRequest):
+    """
+    Importação em massa: cria os tickets em POSTs com vários itens.
+    Retorna o ID ou o erro de cada ticket, na ordem recebida.
+    """
+    users = await get_requester_resolver().resolve_many(item.requester_email for item in request.tickets)
+    inputs = [
+        {"name": item.title, "content": f"{item.description}\nSolicitante: {item.requester_email}",
+         **requester_fields(users.get(normalize_email(item.requester_email)), item.requester_email)}
+        for item in request.tickets
+    ]
+    results = await get_ticket_batcher().submit_many(inputs)
+    for result in results:
+        await ticket_status.invalidate(result["id"])
+    criados = sum(1 for result in results if result["id"])
+    return {"criados": criados, "falhas": len(results) - criados, "resultados": results}
+
 # Endpoints de teste
 @app.get("/health")
 def health_check():
@@ -334,13 +542,19 @@ def test_env():
     }
 
 @app.get("/test-auth")
-def test_auth():
+async def test_auth():
     try:
-        session_token = iniciar_sessao()
+        session_token = await iniciar_sessao()
         return {"success": True, "session_token": session_token[:8] + "*****"}
     except Exception as e:
         return {"error": str(e)}
 
+@app.post("/classify")
+def classify(request: ClassifyRequest):
+    categorias = category_catalog.classify_many(request.textos)
+    return {"resultados": [{"texto": texto, "categoria": categoria}
+                           for texto, categoria in zip(request.textos, categorias)]}
+
 @app.get("/test-classify")
 def test_classify(texto: str):
     try:
@@ -350,18 +564,9 @@ def test_classify(texto: str):
         return {"error": str(e)}
 
 @app.get("/test-direct-ticket")
-def test_direct_ticket(texto: str):
+async def test_direct_ticket(texto: str):
     try:
         intent = classify_intent(texto)
-        session_token = iniciar_sessao()
-
-        headers = {
-            "Content-Type": "application/json",
-            "App-Token": GLPI_APP_TOKEN,
-            "Session-Token": session_token
-        }
-
-        ticket_url = f"{GLPI_URL}/apirest.php/Ticket"
         payload = {
             "input": {
                 "name": intent["title"],
@@ -372,39 +577,35 @@ def test_direct_ticket(texto: str):
             }
         }
 
-        ticket_response = requests.post(ticket_url, json=payload, headers=headers, timeout=10)
-
-        # Encerra sessão
-        requests.get(f"{GLPI_URL}/apirest.php/killSession", headers=headers)
-
-        try:
-            return ticket_response.json()
-        except Exception:
-            return {"status_code": ticket_response.status_code, "text": ticket_response.text}
+        result = await get_ticket_batcher().submit(payload["input"])
+        if result["id"]:
+            await ticket_status.invalidate(result["id"])
+            return {"id": result["id"], "message": result["message"]}
+        return {"status_code": result["status"], "text": result["message"]}
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/test-glpi-connection")
-def test_glpi_connection():
+async def test_glpi_connection():
     try:
-        response = requests.get(GLPI_URL, timeout=5)
+        response = await get_glpi_client().http.get(GLPI_URL, timeout=5)
         return {"success": response.status_code == 200, "status_code": response.status_code}
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/test-glpi-api")
-def test_glpi_api():
+async def test_glpi_api():
     try:
-        api_url = f"{GLPI_URL}/apirest.php"
-        response = requests.get(api_url, timeout=5)
+        api_url = get_glpi_client().base_url
+        response = await get_glpi_client().http.get(api_url, timeout=5)
         return {"success": response.status_code == 200, "status_code": response.status_code}
     except Exception as e:
         return {"error": str(e)}
 
 @app.get("/test-init-session")
-def test_init_session():
+async def test_init_session():
     try:
-        session_token = iniciar_sessao()
+        session_token = await iniciar_sessao()
         return {"success": True, "session_token": session_token[:8] + "*****" if session_token else None}
     except Exception as e:
         return {"error": str(e)}
\ No newline at end of file
@@ -0,0 +1,199 @@
+import time
+from bisect import bisect_left
+
+# Limites (segundos) dos histogramas de latência
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def clear(self):
+        self._values.clear()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = self.header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value):
+        self._values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) - amount
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        item = self._values.get(labels)
+        if item is None:
+            # Contagem por faixa (a última é +Inf), soma e total
+            item = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        item[0][bisect_left(self.buckets, value)] += 1
+        item[1] += value
+        item[2] += 1
+
+    def render(self):
+        lines = self.header()
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Registry:
+    """
+    Conjunto de métricas do processo, exportadas no formato texto do Prometheus.
+
+    Contadores e histogramas são atualizados no próprio event loop (sem
+    locks). Valores que só interessam na hora da coleta (tamanho de filas,
+    pools) são lidos por funções registradas com on_collect().
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+
+    def _add(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self._add(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def on_collect(self, callback):
+        self._collectors.append(callback)
+        return callback
+
+    def render(self):
+        for callback in self._collectors:
+            callback()
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Requisições recebidas pela API (rótulo = rota, ex.: /tickets/provisorio/{ref})
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "Requisições HTTP recebidas.",
+                                 ("endpoint", "method", "status"))
+HTTP_ERRORS = REGISTRY.counter("http_request_errors_total", "Requisições HTTP com erro (5xx ou exceção).",
+                               ("endpoint",))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds", "Tempo de resposta da API.", ("endpoint",))
+HTTP_IN_FLIGHT = REGISTRY.gauge("http_requests_in_flight", "Requisições HTTP em andamento.", ("endpoint",))
+
+# Chamadas ao GLPI (rótulo = operação, ex.: initSession, Ticket, search/Solution)
+GLPI_REQUESTS = REGISTRY.counter("glpi_requests_total", "Chamadas à API do GLPI.",
+                                 ("operation", "method", "status"))
+GLPI_ERRORS = REGISTRY.counter("glpi_request_errors_total", "Chamadas ao GLPI com erro (5xx ou falha de conexão).",
+                               ("operation",))
+GLPI_LATENCY = REGISTRY.histogram("glpi_request_duration_seconds", "Latência das chamadas ao GLPI.", ("operation",))
+GLPI_IN_FLIGHT = REGISTRY.gauge("glpi_requests_in_flight", "Chamadas ao GLPI em andamento.", ("operation",))
+
+UNMATCHED_ROUTE = "desconhecido"
+
+
+def route_template(routes, scope):
+    """
+    Rota (modelo do caminho) que atende a requisição; evita um rótulo por ID.
+    """
+    from starlette.routing import Match
+
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match != Match.NONE:
+            return route.path
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que mede contagem, erros, latência e requisições em
+    andamento por rota.
+    """
+
+    def __init__(self, app, routes, registry=REGISTRY):
+        self.app = app
+        self.routes = routes
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        endpoint = route_template(self.routes(), scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc(endpoint)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_LATENCY.observe(time.perf_counter() - started, endpoint)
+            HTTP_IN_FLIGHT.dec(endpoint)
+            HTTP_REQUESTS.inc(endpoint, scope["method"], status)
+            if status >= 500:
+                HTTP_ERRORS.inc(endpoint)
@@ -0,0 +1,215 @@
+import os
+import asyncio
+import logging
+
+import httpx
+
+from cache import TTLCache
+from glpi_client import get_glpi_client
+
+logger = logging.getLogger(__name__)
+
+# Campos da busca de User: 2 = ID, 5 = e-mails, 8 = ativo
+FIELD_ID = 2
+FIELD_EMAIL = 5
+FIELD_ACTIVE = 8
+
+# Valor guardado no cache para e-mails sem usuário no GLPI (IDs válidos começam em 1)
+NOT_FOUND = 0
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def requester_fields(users_id, email):
+    """
+    Campos do Ticket que ligam o solicitante: o usuário do GLPI, se houver;
+    senão o e-mail como solicitante sem cadastro (recebe as notificações).
+    """
+    if users_id:
+        return {"_users_id_requester": users_id}
+    if email:
+        return {
+            "_users_id_requester": 0,
+            "_users_id_requester_notif": {"use_notification": [1], "alternative_email": [email]},
+        }
+    return {}
+
+
+def _user_emails(item):
+    # Usuários com mais de um e-mail vêm com os valores separados por "$#$"
+    return [normalize_email(e) for e in str(item.get(str(FIELD_EMAIL)) or "").split("$#$") if e.strip()]
+
+
+class RequesterResolver:
+    """
+    Resolve o e-mail do solicitante para o users_id do GLPI.
+
+    Os resultados ficam em um cache LRU limitado (`maxsize`), inclusive os
+    e-mails sem usuário (por `negative_ttl` segundos), e consultas
+    concorrentes ao mesmo e-mail são agrupadas. Em segundo plano, a cada
+    `preload_interval` segundos, o diretório de usuários ativos é carregado
+    em páginas de `page_size`: com o cache aquecido, ligar o solicitante ao
+    ticket não custa nenhuma chamada extra ao GLPI.
+
+    Falha ou demora (`timeout`) na consulta não impede a criação do ticket:
+    o solicitante fica apenas com o e-mail.
+    """
+
+    def __init__(self, client_getter, maxsize=20000, ttl=86400.0, negative_ttl=600.0,
+                 preload_interval=3600.0, page_size=1000, timeout=1.5):
+        self.client_getter = client_getter
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self.preload_interval = preload_interval
+        self.page_size = page_size
+        self.timeout = timeout
+        self.lookups = 0
+        self.failures = 0
+        self.preloaded = 0
+        self._task = None
+
+    async def _lookup(self, email):
+        self.lookups += 1
+        response = await self.client_getter().search("User", {
+            "criteria[0][field]": FIELD_EMAIL,
+            "criteria[0][searchtype]": "contains",
+            "criteria[0][value]": f"^{email}$",
+            "criteria[1][link]": "AND",
+            "criteria[1][field]": FIELD_ACTIVE,
+            "criteria[1][searchtype]": "equals",
+            "criteria[1][value]": 1,
+            "forcedisplay[0]": FIELD_ID,
+            "forcedisplay[1]": FIELD_EMAIL,
+            "range": "0-4",
+        })
+        response.raise_for_status()
+        for item in response.json().get("data") or []:
+            if email in _user_emails(item):
+                return int(item[str(FIELD_ID)])
+        return NOT_FOUND
+
+    async def _load(self, email):
+        users_id = await self._lookup(email)
+        if users_id == NOT_FOUND:
+            self.cache.set(email, NOT_FOUND, self.negative_ttl)
+            return None
+        return users_id
+
+    async def resolve(self, email):
+        """
+        Retorna o users_id do e-mail ou None (sem usuário, e-mail vazio ou GLPI indisponível).
+        """
+        email = normalize_email(email)
+        if "@" not in email:
+            return None
+        try:
+            # Ao estourar o prazo a consulta continua (get_or_load) e o resultado fica no cache para o próximo ticket
+            users_id = await asyncio.wait_for(self.cache.get_or_load(email, lambda: self._load(email)), self.timeout)
+        except (httpx.HTTPError, asyncio.TimeoutError, RuntimeError, ValueError) as e:
+            self.failures += 1
+            logger.warning(f"Não foi possível identificar o solicitante no GLPI: {type(e).__name__} {str(e)}")
+            return None
+        return users_id or None
+
+    async def resolve_many(self, emails):
+        """
+        {e-mail normalizado: users_id ou None}, com uma consulta por e-mail distinto fora do cache.
+        """
+        distinct = list(dict.fromkeys(normalize_email(e) for e in emails if e))
+        found = await asyncio.gather(*(self.resolve(e) for e in distinct))
+        return dict(zip(distinct, found))
+
+    async def fields(self, email):
+        """
+        Campos do solicitante para o `input` do Ticket (ver requester_fields).
+        """
+        return requester_fields(await self.resolve(email), (email or "").strip() or None)
+
+    # -- carga do diretório ------------------------------------------------
+    async def preload(self):
+        """
+        Carrega no cache os e-mails de todos os usuários ativos. Retorna quantos foram carregados.
+        """
+        params = {
+            "criteria[0][field]": FIELD_ACTIVE,
+            "criteria[0][searchtype]": "equals",
+            "criteria[0][value]": 1,
+            "forcedisplay[0]": FIELD_ID,
+            "forcedisplay[1]": FIELD_EMAIL,
+            "sort": FIELD_ID,
+            "order": "ASC",
+        }
+        loaded, start = 0, 0
+        while True:
+            params["range"] = f"{start}-{start + self.page_size - 1}"
+            response = await self.client_getter().search("User", params)
+            if response.status_code not in (200, 206):
+                raise RuntimeError(f"Carga de usuários falhou: Status {response.status_code}")
+            data = response.json().get("data") or []
+            for item in data:
+                for email in _user_emails(item):
+                    self.cache.set(email, int(item[str(FIELD_ID)]))
+                    loaded += 1
+            if len(data) < self.page_size:
+                break
+            start += self.page_size
+        self.preloaded = loaded
+        if loaded > self.cache.maxsize:
+            logger.warning(f"Diretório com {loaded} e-mails maior que o cache ({self.cache.maxsize}); "
+                           f"aumente REQUESTER_CACHE_SIZE.")
+        logger.info(f"{loaded} e-mails de usuários do GLPI carregados.")
+        return loaded
+
+    async def _run(self):
+        while True:
+            try:
+                await self.preload()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Falha ao carregar usuários do GLPI: {str(e)}")
+            await asyncio.sleep(self.preload_interval)
+
+    def start(self):
+        """
+        Inicia a carga periódica do diretório (desligada com preload_interval <= 0).
+        """
+        if self._task is None and self.preload_interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {**self.cache.stats(), "lookups": self.lookups, "failures": self.failures,
+                "preloaded": self.preloaded}
+
+
+def resolver_from_env(client_getter):
+    return RequesterResolver(
+        client_getter,
+        maxsize=int(os.getenv("REQUESTER_CACHE_SIZE", "20000")),
+        ttl=float(os.getenv("REQUESTER_CACHE_TTL", "86400")),
+        negative_ttl=float(os.getenv("REQUESTER_NEGATIVE_TTL", "600")),
+        preload_interval=float(os.getenv("REQUESTER_PRELOAD_INTERVAL", "3600")),
+        page_size=int(os.getenv("REQUESTER_PRELOAD_PAGE_SIZE", "1000")),
+        timeout=float(os.getenv("REQUESTER_LOOKUP_TIMEOUT", "1.5")),
+    )
+
+
+_resolver = None
+
+
+def get_requester_resolver():
+    """
+    Retorna o resolvedor de solicitantes do processo, ligado ao cliente GLPI padrão.
+    """
+    global _resolver
+    if _resolver is None:
+        _resolver = resolver_from_env(get_glpi_client)
+    return _resolver
@@ -0,0 +1,179 @@
+import time
+import random
+import asyncio
+import logging
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Respostas do GLPI que indicam indisponibilidade (contam como falha e permitem retentativa)
+RETRYABLE_STATUS = {502, 503, 504}
+# Métodos que podem ser repetidos sem risco de duplicar dados
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """
+    O circuito da operação está aberto: a chamada falha na hora, sem ir ao GLPI.
+    """
+
+    def __init__(self, operation, retry_in):
+        super().__init__(f"GLPI indisponível ({operation}); nova tentativa em {retry_in:.0f}s")
+        self.operation = operation
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Disjuntor de uma operação do GLPI.
+
+    closed: as chamadas passam; `failure_threshold` falhas seguidas abrem o
+    circuito. open: as chamadas falham na hora por `reset_timeout`
+    segundos. half_open: passa até `half_open_max` chamadas de teste; um
+    sucesso fecha o circuito, uma falha o abre de novo.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_max=1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.rejected = 0
+        self._trials = 0
+
+    def before_call(self):
+        """
+        Levanta CircuitOpenError se a chamada não deve ir ao GLPI.
+        """
+        if self.state == OPEN:
+            retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+            if retry_in > 0:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, retry_in)
+            self.state = HALF_OPEN
+            self._trials = 0
+            logger.info(f"Circuito {self.name} meio-aberto: testando o GLPI.")
+        if self.state == HALF_OPEN:
+            if self._trials >= self.half_open_max:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, 0)
+            self._trials += 1
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info(f"Circuito {self.name} fechado: GLPI respondeu.")
+        self.state = CLOSED
+        self.failures = 0
+        self._trials = 0
+
+    def release_trial(self):
+        # Chamada de teste cancelada antes de terminar: libera a vaga sem decidir o estado
+        if self.state == HALF_OPEN and self._trials > 0:
+            self._trials -= 1
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                logger.warning(f"Circuito {self.name} aberto após {self.failures} falha(s) seguidas.")
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        retry_in = None
+        if self.state == OPEN:
+            retry_in = round(max(0.0, self.opened_at + self.reset_timeout - time.monotonic()), 1)
+        return {"state": self.state, "failures": self.failures, "rejected": self.rejected, "retry_in": retry_in}
+
+
+class BreakerRegistry:
+    """
+    Um disjuntor por operação do GLPI (Ticket, search/Solution, initSession...),
+    para que uma operação quebrada não bloqueie as demais.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._breakers = {}
+
+    def get(self, operation):
+        breaker = self._breakers.get(operation)
+        if breaker is None:
+            breaker = self._breakers[operation] = CircuitBreaker(
+                operation, self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def snapshot(self):
+        return {name: breaker.snapshot() for name, breaker in sorted(self._breakers.items())}
+
+
+class BreakerTransport(httpx.AsyncBaseTransport):
+    """
+    Aplica o disjuntor da operação antes de cada chamada ao GLPI e registra
+    o resultado: falhas de conexão, timeouts e 5xx contam como falha.
+    """
+
+    def __init__(self, transport, breakers, operation_of):
+        self.transport = transport
+        self.breakers = breakers
+        self.operation_of = operation_of
+
+    async def handle_async_request(self, request):
+        breaker = self.breakers.get(self.operation_of(request.url.path))
+        breaker.before_call()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.HTTPError:
+            breaker.record_failure()
+            raise
+        except asyncio.CancelledError:
+            breaker.release_trial()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def backoff_delay(attempt, base=0.2, cap=2.0):
+    """
+    Espera antes da retentativa `attempt` (0, 1, ...): exponencial limitada, com jitter total.
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def is_retryable(method, idempotent, response=None, error=None):
+    """
+    Só repete chamadas idempotentes, e apenas em falha de conexão/timeout ou 502/503/504.
+    Um circuito aberto não é repetido.
+    """
+    if not (idempotent or method.upper() in IDEMPOTENT_METHODS):
+        return False
+    if error is not None:
+        return not isinstance(error, CircuitOpenError)
+    return response is not None and response.status_code in RETRYABLE_STATUS
+
+
+def parse_timeouts(spec):
+    """
+    "initSession=5,Ticket=8,search=3" -> {"initSession": 5.0, "Ticket": 8.0, "search": 3.0}
+    """
+    timeouts = {}
+    for item in (spec or "").split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            timeouts[name.strip()] = float(value)
+    return timeouts
@@ -0,0 +1,145 @@
+import os
+import math
+
+import numpy as np
+
+from classifier import terms
+from kb_mirror import clean_html
+
+# Campos da busca de ITILSolution: 2 = ID, 1 = conteúdo
+FIELD_ID = 2
+FIELD_CONTENT = 1
+
+
+class BM25Stats:
+    """
+    Estatísticas de termos de um corpus: frequência de documentos, total de
+    documentos e tamanho médio. Calculadas uma vez e reaproveitadas em cada
+    ranqueamento.
+    """
+
+    def __init__(self, doc_freq, n_docs, avgdl):
+        self.doc_freq = doc_freq
+        self.n_docs = n_docs
+        self.avgdl = avgdl or 1.0
+
+    @classmethod
+    def from_token_lists(cls, token_lists):
+        doc_freq = {}
+        total = 0
+        for tokens in token_lists:
+            total += len(tokens)
+            for token in set(tokens):
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+        n_docs = len(token_lists)
+        return cls(doc_freq, n_docs, total / n_docs if n_docs else 1.0)
+
+    @classmethod
+    def from_texts(cls, texts):
+        return cls.from_token_lists([terms(texto) for texto in texts])
+
+    def idf(self, query_terms):
+        n = self.n_docs
+        return np.array(
+            [math.log(1 + (n - self.doc_freq.get(t, 0) + 0.5) / (self.doc_freq.get(t, 0) + 0.5)) for t in query_terms],
+            dtype=np.float64,
+        )
+
+
+class BM25Ranker:
+    """
+    Ranqueia candidatos por BM25 com pontuação vetorizada (NumPy).
+
+    Usa as estatísticas do corpus (`update_stats`, ex.: o espelho da base de
+    conhecimento) quando disponíveis; sem elas, as do próprio conjunto de
+    candidatos.
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.stats = None
+
+    def update_stats(self, texts):
+        stats = BM25Stats.from_texts(texts)
+        # Troca de uma vez: buscas em andamento continuam com as estatísticas anteriores
+        self.stats = stats if stats.n_docs else None
+
+    def rank(self, query, docs, k=3):
+        """
+        Retorna até `k` docs (dicts com "content") com "score" > 0, do maior para o menor.
+        """
+        query_terms = list(dict.fromkeys(terms(query)))
+        if not query_terms or not docs:
+            return []
+        doc_terms = [terms(doc["content"]) for doc in docs]
+        stats = self.stats or BM25Stats.from_token_lists(doc_terms)
+
+        column = {t: i for i, t in enumerate(query_terms)}
+        tf = np.zeros((len(docs), len(query_terms)), dtype=np.float64)
+        for row, tokens in enumerate(doc_terms):
+            for token in tokens:
+                col = column.get(token)
+                if col is not None:
+                    tf[row, col] += 1
+        lengths = np.fromiter((len(tokens) for tokens in doc_terms), dtype=np.float64, count=len(docs))
+        norm = self.k1 * (1 - self.b + self.b * lengths / stats.avgdl)
+        scores = (tf * (self.k1 + 1) / (tf + norm[:, None])) @ stats.idf(query_terms)
+
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [{**docs[i], "score": round(float(scores[i]), 4)} for i in top if scores[i] > 0]
+
+
+class SolutionSearch:
+    """
+    Busca de soluções no GLPI em duas etapas: uma única consulta traz até
+    `candidates` soluções que contenham qualquer termo relevante do problema
+    (só os campos ID e conteúdo), e o BM25 local escolhe as melhores.
+    """
+
+    def __init__(self, ranker=None, candidates=50, max_terms=6):
+        self.ranker = ranker or BM25Ranker()
+        self.candidates = candidates
+        self.max_terms = max_terms
+
+    def _params(self, query_terms):
+        params = {
+            "forcedisplay[0]": FIELD_ID,
+            "forcedisplay[1]": FIELD_CONTENT,
+            "range": f"0-{self.candidates - 1}",
+        }
+        for i, term in enumerate(query_terms):
+            if i:
+                params[f"criteria[{i}][link]"] = "OR"
+            params[f"criteria[{i}][field]"] = FIELD_CONTENT
+            params[f"criteria[{i}][searchtype]"] = "contains"
+            params[f"criteria[{i}][value]"] = term
+        return params
+
+    async def fetch_candidates(self, client, problema):
+        # Termos mais longos tendem a ser os mais específicos
+        query_terms = sorted(dict.fromkeys(terms(problema)), key=len, reverse=True)[:self.max_terms]
+        if not query_terms:
+            return []
+        response = await client.search("ITILSolution", self._params(query_terms))
+        response.raise_for_status()
+        docs = []
+        for item in response.json().get("data") or []:
+            content = clean_html(item.get(str(FIELD_CONTENT)))
+            if content:
+                docs.append({"itemtype": "ITILSolution", "item_id": item.get(str(FIELD_ID)), "content": content})
+        return docs
+
+    async def search(self, client, problema, k=3):
+        """
+        Retorna as `k` melhores soluções do GLPI para o problema, com score BM25.
+        """
+        docs = await self.fetch_candidates(client, problema)
+        return self.ranker.rank(problema, docs, k)
+
+
+def search_from_env():
+    return SolutionSearch(
+        BM25Ranker(k1=float(os.getenv("BM25_K1", "1.2")), b=float(os.getenv("BM25_B", "0.75"))),
+        candidates=int(os.getenv("SOLUTION_CANDIDATES", "50")),
+    )
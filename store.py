@@ -0,0 +1,166 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+
+class MemoryStore:
+    """
+    Armazenamento chave/valor com expiração, local ao processo.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _purge(self):
+        # Limpeza preguiçosa das chaves expiradas, a cada 500 gravações
+        self._writes += 1
+        if self._writes % 500 == 0:
+            now = time.time()
+            for key in [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]:
+                del self._data[key]
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._purge()
+
+    def add(self, key, value, ttl=None):
+        """
+        Grava apenas se a chave não existir (ou tiver expirado). Retorna True se gravou.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (item[1] is None or item[1] > time.time()):
+                return False
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._purge()
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_if(self, key, value):
+        """
+        Remove a chave apenas se ainda guardar `value`.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] == value:
+                del self._data[key]
+
+
+class SQLiteStore:
+    """
+    Armazenamento chave/valor com expiração em um arquivo SQLite (modo WAL).
+
+    Vários workers uvicorn na mesma máquina apontam para o mesmo arquivo e
+    passam a compartilhar as entradas. Os valores são serializados em JSON.
+    """
+
+    def __init__(self, path, namespace="default"):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT, expires_at REAL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM kv WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def _purge(self):
+        # Limpeza preguiçosa das chaves expiradas, a cada 500 gravações
+        self._writes += 1
+        if self._writes % 500 == 0:
+            self._conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (self.namespace, key, json.dumps(value), expires_at),
+            )
+            self._purge()
+
+    def add(self, key, value, ttl=None):
+        """
+        Grava apenas se a chave não existir (ou tiver expirado). Retorna True se gravou.
+        A operação é atômica entre processos.
+        """
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO kv (namespace, key, value, expires_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (namespace, key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE kv.expires_at IS NOT NULL AND kv.expires_at <= ?",
+                (self.namespace, key, json.dumps(value), expires_at, now),
+            )
+            self._purge()
+            return cursor.rowcount > 0
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def delete_if(self, key, value):
+        """
+        Remove a chave apenas se ainda guardar `value` (atômico entre processos).
+        """
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM kv WHERE namespace = ? AND key = ? AND value = ?",
+                (self.namespace, key, json.dumps(value)),
+            )
+
+
+def shared_store_from_env(namespace):
+    """
+    Retorna o backend compartilhado entre workers (SQLite em SHARED_STORE_PATH)
+    ou None se não estiver configurado.
+    """
+    path = os.getenv("SHARED_STORE_PATH")
+    if path:
+        return SQLiteStore(path, namespace=namespace)
+    return None
+
+
+def store_from_env(namespace):
+    """
+    Backend compartilhado se configurado, senão um armazenamento em memória do processo.
+    """
+    return shared_store_from_env(namespace) or MemoryStore()
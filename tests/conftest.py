@@ -0,0 +1,14 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# Os módulos da aplicação leem o ambiente na importação
+os.environ.setdefault("GLPI_URL", "http://fake-glpi/apirest.php")
+os.environ.setdefault("GLPI_APP_TOKEN", "test-app-token")
+os.environ.setdefault("GLPI_USER_TOKEN", "test-user-token")
+os.environ.setdefault("VAPI_API_KEY", "test-vapi-key")
+os.environ.setdefault("TRACE_FILE", "")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
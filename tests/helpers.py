@@ -0,0 +1,14 @@
+import httpx
+
+import glpi_client
+from fake_glpi import FakeGLPI
+
+
+def fake_client(fake=None, **options):
+    """
+    AsyncGLPIClient ligado ao GLPI falso (em memória, sem rede). Retorna (cliente, fake).
+    """
+    fake = fake or FakeGLPI(seed=1)
+    options.setdefault("max_retries", 0)
+    client = glpi_client.client_from_env(transport=httpx.ASGITransport(app=fake.app), session_store=None, **options)
+    return client, fake
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from admission import (AdmissionControl, ConcurrencyLimit, Overloaded, RateLimiter, TokenBucket, caller_key,
+                       parse_networks)
+
+
+def make_request(headers=None, client=("10.0.0.1", 1234)):
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+        "client": client,
+    }
+    return Request(scope)
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(rate=2, burst=2)
+    now = bucket.updated
+    assert bucket.take(now) == 0
+    assert bucket.take(now) == 0
+    assert bucket.take(now) == pytest.approx(0.5)
+    assert bucket.take(now + 0.6) == 0
+
+
+def test_rate_limiter_isolates_callers():
+    limiter = RateLimiter(rate=0.001, burst=1)
+    limiter.check("a")
+    with pytest.raises(Overloaded) as e:
+        limiter.check("a")
+    assert e.value.retry_after >= 1
+    limiter.check("b")
+
+
+def test_caller_key_prefers_call_id_over_shared_credential():
+    shared = {"authorization": "Bearer vapi-secret"}
+    one = caller_key(make_request({**shared, "x-call-id": "call-1"}))
+    two = caller_key(make_request({**shared, "x-call-id": "call-2"}))
+    assert one == "call:call-1" and two == "call:call-2"
+    assert caller_key(make_request(shared), "call-3") == "call:call-3"
+    assert caller_key(make_request(shared)).startswith("key:")
+    assert "vapi-secret" not in caller_key(make_request(shared))
+    assert caller_key(make_request()) == "ip:10.0.0.1"
+
+
+def test_concurrency_limit_sheds_when_queue_is_full():
+    async def scenario():
+        limit = ConcurrencyLimit("op", limit=1, max_waiting=1, max_wait=0.05)
+        await limit.acquire()
+        waiter = asyncio.create_task(limit.acquire())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded):
+            await limit.acquire()
+        with pytest.raises(Overloaded):
+            await waiter
+        limit.release()
+        await limit.acquire()
+        assert limit.snapshot()["rejected"] == 2
+        limit.release()
+        assert limit.in_use == 0
+
+    asyncio.run(scenario())
+
+
+def build_app(admission):
+    app = FastAPI()
+
+    @app.post("/tool", dependencies=[admission.limit("tool_test", rate="0.001/1")])
+    async def tool(request: Request):
+        return await request.json()
+
+    return app
+
+
+def test_rate_limit_is_per_vapi_call_from_body():
+    client = TestClient(build_app(AdmissionControl()))
+    headers = {"authorization": "Bearer shared"}
+
+    def call(call_id):
+        return client.post("/tool", json={"message": {"call": {"id": call_id}}}, headers=headers)
+
+    assert call("a").status_code == 200
+    response = call("a")
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+    # Outra ligação com a mesma chave do VAPI tem o seu próprio limite
+    assert call("b").status_code == 200
+    assert call("b").status_code == 429
+
+
+def test_disabled_admission_lets_everything_through():
+    client = TestClient(build_app(AdmissionControl(enabled=False)))
+    assert all(client.post("/tool", json={}).status_code == 200 for _ in range(5))
+
+
+def test_rotating_call_ids_are_throttled_per_credential():
+    client = TestClient(build_app(AdmissionControl(source_factor=3)))
+    headers = {"authorization": "Bearer shared"}
+    statuses = [client.post("/tool", json={}, headers={**headers, "x-call-id": f"call-{i}"}).status_code
+                for i in range(5)]
+    assert statuses == [200, 200, 200, 429, 429]
+    # Outra credencial tem o seu próprio balde
+    assert client.post("/tool", json={}, headers={"authorization": "Bearer outra", "x-call-id": "x"}).status_code == 200
+
+
+def test_forwarded_for_is_honoured_only_from_trusted_proxies():
+    proxies = parse_networks("10.0.0.0/8")
+    forwarded = {"x-forwarded-for": "203.0.113.9, 10.1.2.3"}
+    assert caller_key(make_request(forwarded)) == "ip:10.0.0.1"
+    assert caller_key(make_request(forwarded), trusted_proxies=proxies) == "ip:203.0.113.9"
+    spoofed = make_request(forwarded, client=("198.51.100.7", 1234))
+    assert caller_key(spoofed, trusted_proxies=proxies) == "ip:198.51.100.7"
@@ -0,0 +1,85 @@
+import asyncio
+
+import httpx
+
+from attachments import CallAttachments, attachments_from_env
+from helpers import fake_client
+
+MESSAGE = {"call": {"id": "call-1"}, "artifact": {"messages": [
+    {"role": "user", "message": "Minha impressora não imprime"},
+    {"role": "bot", "message": "Vou abrir um chamado."},
+]}}
+
+
+def vapi(status="in-progress", **call):
+    def handler(request):
+        if request.method == "HEAD":
+            return httpx.Response(200, headers={"content-length": "1000", "content-type": "audio/wav"})
+        if request.url.path.endswith(".wav"):
+            return httpx.Response(200, content=b"\0" * 1000)
+        return httpx.Response(200, json={"id": "call-1", "status": status, **call})
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def make_attachments(client, http, **options):
+    attachments = CallAttachments(lambda: client, vapi_key="chave", **options)
+    attachments.http = http
+    return attachments
+
+
+def test_ended_call_attaches_full_transcript_and_recording():
+    async def scenario():
+        client, fake = fake_client()
+        http = vapi("ended", artifact={"transcript": "Transcrição completa",
+                                       "recordingUrl": "https://vapi.test/rec.wav"})
+        attachments = make_attachments(client, http, recording=True, poll_interval=0.01)
+        attachments.schedule(7, MESSAGE)
+        await asyncio.gather(*attachments._tasks)
+        assert [(d["name"], d["items_id"]) for d in fake.documents] == [
+            ("Transcrição da ligação call-1", 7), ("Gravação da ligação call-1", 7)]
+        assert fake.documents[1]["bytes"] > 1000
+        await attachments.stop()
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_stop_uploads_partial_transcript_of_calls_still_in_progress():
+    async def scenario():
+        client, fake = fake_client()
+        attachments = make_attachments(client, vapi(), recording=True, wait=900, poll_interval=15)
+        attachments.schedule(7, MESSAGE)
+        await asyncio.sleep(0.05)
+        assert not fake.documents
+
+        await asyncio.wait_for(attachments.stop(), 2)
+        assert [d["name"] for d in fake.documents] == ["Transcrição parcial da ligação call-1"]
+        assert attachments.stats()["pending"] == 0
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_stop_cancels_uploads_past_the_grace_period():
+    async def scenario():
+        client, fake = fake_client()
+        fake.latency = {"Document": 5}
+        attachments = make_attachments(client, vapi(), wait=0, stop_grace=0.1)
+        attachments.schedule(7, MESSAGE)
+        await asyncio.sleep(0.05)
+        await asyncio.wait_for(attachments.stop(), 1)
+        assert not attachments._tasks and not fake.documents
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_attachments_need_opt_in_and_the_private_key(monkeypatch):
+    monkeypatch.setenv("VAPI_API_KEY", "segredo-do-webhook")
+    monkeypatch.delenv("VAPI_PRIVATE_KEY", raising=False)
+    monkeypatch.delenv("CALL_ATTACHMENTS", raising=False)
+    assert attachments_from_env(lambda: None) is None
+    monkeypatch.setenv("CALL_ATTACHMENTS", "1")
+    assert attachments_from_env(lambda: None) is None
+    monkeypatch.setenv("VAPI_PRIVATE_KEY", "chave-privada")
+    assert attachments_from_env(lambda: None).vapi_key == "chave-privada"
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+from cache import TTLCache
+from store import SQLiteStore
+
+
+def test_cancelled_leader_does_not_fail_coalesced_waiters():
+    async def scenario():
+        cache = TTLCache(ttl=60)
+        calls = 0
+
+        async def loader():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.1)
+            return "solução"
+
+        leader = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(cache.get_or_load("k", loader))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await waiter == "solução"
+        assert calls == 1 and cache.coalesced == 1
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(scenario())
+
+
+def test_load_fills_cache_after_every_caller_gave_up():
+    async def scenario():
+        cache = TTLCache(ttl=60)
+
+        async def loader():
+            await asyncio.sleep(0.05)
+            return 42
+
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(cache.get_or_load("k", loader), 0.01)
+        await asyncio.sleep(0.1)
+        assert cache.get("k") == 42
+        assert cache.stats()["inflight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_loader_errors_reach_every_waiter_and_are_not_cached():
+    async def scenario():
+        cache = TTLCache(ttl=60)
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise ValueError("GLPI fora")
+
+        results = await asyncio.gather(*(cache.get_or_load("k", failing) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+
+        async def ok():
+            return "ok"
+
+        assert await cache.get_or_load("k", ok) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_ttl_and_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.evictions == 1
+    cache.set("d", 4, ttl=0)
+    assert cache.get("d") is None
+
+
+def test_workers_share_entries_through_the_backend(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "shared.db")
+        first = TTLCache(ttl=60, backend=SQLiteStore(path, "solucoes"))
+        second = TTLCache(ttl=60, backend=SQLiteStore(path, "solucoes"))
+
+        async def loader():
+            return "reinicie o roteador"
+
+        assert await first.get_or_load("k", loader) == "reinicie o roteador"
+        assert await second.get_async("k") == "reinicie o roteador" and second.backend_hits == 1
+        await second.delete_async("k")
+        assert await first.get_async("k") == "reinicie o roteador"  # cópia local até expirar
+        assert await TTLCache(backend=SQLiteStore(path, "solucoes")).get_async("k") is None
+
+    asyncio.run(scenario())
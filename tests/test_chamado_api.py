@@ -0,0 +1,25 @@
+import httpx
+from fastapi.testclient import TestClient
+
+import glpi_client
+from fake_glpi import FakeGLPI
+
+
+def test_client_is_created_from_env_on_first_use(monkeypatch, tmp_path):
+    fake = FakeGLPI(seed=1)
+    client_from_env = glpi_client.client_from_env
+    monkeypatch.setattr(glpi_client, "_client", None)
+    monkeypatch.setattr(glpi_client, "client_from_env", lambda: client_from_env(
+        transport=httpx.ASGITransport(app=fake.app), session_store=None))
+    monkeypatch.setenv("CATEGORY_SNAPSHOT_PATH", str(tmp_path / "categorias.json"))
+    monkeypatch.delenv("GLPI_USER", raising=False)
+    monkeypatch.delenv("GLPI_PASSWORD", raising=False)
+
+    # A importação não abre o cliente nem exige usuário e senha (basta o GLPI_USER_TOKEN)
+    import chamado_api
+
+    assert glpi_client._client is None
+    with TestClient(chamado_api.app) as client:
+        response = client.post("/chamado", params={"texto": "minha impressora está sem toner"})
+    assert response.status_code == 200 and response.json()["id"] in fake.tickets
+    assert glpi_client._client is None
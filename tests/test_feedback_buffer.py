@@ -0,0 +1,97 @@
+import asyncio
+
+from feedback_buffer import FeedbackBuffer
+from helpers import fake_client
+
+
+def make_buffer(tmp_path, fake=None, **options):
+    client, fake = fake_client(fake)
+    buffer = FeedbackBuffer(lambda: client, str(tmp_path / "feedback.db"), **options)
+    return buffer, client, fake
+
+
+def pending_rows(buffer):
+    return buffer._conn.execute("SELECT COUNT(*) FROM feedback WHERE status = 'pendente'").fetchone()[0]
+
+
+def test_cancelled_flush_puts_batch_back(tmp_path):
+    async def scenario():
+        buffer, client, fake = make_buffer(tmp_path, max_batch=10)
+        fake.latency = 0.5
+        for i in range(3):
+            await buffer.add(5, "ok", str(i + 1))
+        task = asyncio.create_task(buffer.flush())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert [item["ticket_id"] for item in buffer._buffer] == ["1", "2", "3"]
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_stop_drains_every_batch(tmp_path):
+    async def scenario():
+        buffer, client, fake = make_buffer(tmp_path, max_batch=2)
+        for i in range(5):
+            await buffer.add(4, None, str(i + 1))
+        await buffer.stop()
+        assert len(fake.followups) == 5
+        assert len(buffer) == 0 and pending_rows(buffer) == 0
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_stop_persists_leftovers_and_next_start_resends_them(tmp_path):
+    async def scenario():
+        buffer, client, fake = make_buffer(tmp_path, max_batch=2, drain_timeout=0.5)
+        fake.error_rate = 1.0
+        for i in range(3):
+            await buffer.add(3, "lento", str(i + 1))
+        await buffer.stop()
+        assert len(fake.followups) == 0 and pending_rows(buffer) == 3
+
+        # Próximo processo: GLPI de volta, os pendentes saem no primeiro ciclo
+        fake.error_rate = 0.0
+        restarted = FeedbackBuffer(lambda: client, str(tmp_path / "feedback.db"), max_batch=2, flush_interval=0.05)
+        restarted.start()
+        await asyncio.sleep(0.3)
+        await restarted.stop()
+        assert sorted(f["tickets_id"] for f in fake.followups) == ["1", "2", "3"]
+        assert pending_rows(restarted) == 0
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_buffer_is_capped_and_overflow_is_sent_later(tmp_path):
+    async def scenario():
+        buffer, client, fake = make_buffer(tmp_path, max_batch=2, max_buffer=2, flush_interval=0.05)
+        for i in range(6):
+            await buffer.add(5, None, str(i + 1))
+        assert len(buffer) == 2 and pending_rows(buffer) == 4
+        buffer.start()
+        await asyncio.sleep(0.5)
+        await buffer.stop()
+        assert sorted(int(f["tickets_id"]) for f in fake.followups) == [1, 2, 3, 4, 5, 6]
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalid_feedback_does_not_fail_the_rest_of_the_batch(tmp_path):
+    async def scenario():
+        buffer, client, fake = make_buffer(tmp_path, max_batch=10)
+        fake.reject = lambda item: item.get("tickets_id") == "999"
+        for ticket_id in ("1", "999", "2", "3"):
+            await buffer.add(5, None, ticket_id)
+        await buffer.flush()
+
+        assert sorted(f["tickets_id"] for f in fake.followups) == ["1", "2", "3"]
+        assert buffer.sent == 3 and buffer.failed == 1 and len(buffer) == 0
+        dead = buffer._conn.execute("SELECT ticket_id FROM feedback WHERE status = 'falha_glpi'").fetchall()
+        assert dead == [("999",)]
+        await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,53 @@
+import asyncio
+
+import httpx
+
+from fake_glpi import FakeGLPI
+from glpi_session import GLPISessionPool
+from store import SQLiteStore
+
+
+def make_pool(fake, store, timeout=0.2):
+    http = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app))
+    return GLPISessionPool(http, "http://fake-glpi", "app", user_token="user", size=1, timeout=timeout, store=store)
+
+
+def test_workers_share_one_session(tmp_path):
+    async def scenario():
+        fake = FakeGLPI(seed=1, latency={"initSession": 0.05})
+        pools = [make_pool(fake, SQLiteStore(str(tmp_path / "shared.db"), "glpi")) for _ in range(3)]
+        tokens = await asyncio.gather(*(pool._ensure_token(pool._slots[0]) for pool in pools))
+        assert len(set(tokens)) == 1 and fake.calls["initSession"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_fallback_session_after_stuck_lock_is_published(tmp_path):
+    async def scenario():
+        fake = FakeGLPI(seed=1)
+        path = str(tmp_path / "shared.db")
+        # Worker que reservou o initSession e morreu antes de gravar o token
+        SQLiteStore(path, "glpi").add("init:0", 1234, 60)
+        first, second = (make_pool(fake, SQLiteStore(path, "glpi")) for _ in range(2))
+
+        token = await first._ensure_token(first._slots[0])
+        assert await second._ensure_token(second._slots[0]) == token
+        assert fake.sessions == {token}
+
+    asyncio.run(scenario())
+
+
+def test_fallback_session_is_killed_when_another_worker_published(tmp_path):
+    async def scenario():
+        fake = FakeGLPI(seed=1, latency={"initSession": 0.4})
+        store = SQLiteStore(str(tmp_path / "shared.db"), "glpi")
+        store.add("init:0", 1234, 60)
+        pool = make_pool(fake, store, timeout=0.1)
+        waiting = asyncio.create_task(pool._ensure_token(pool._slots[0]))
+        # Outro worker publica o token enquanto este abre a sessão de reserva
+        await asyncio.sleep(0.3)
+        store.set("slot:0", "token-do-outro-worker")
+        assert await waiting == "token-do-outro-worker"
+        assert fake.calls["killSession"] == 1 and not fake.sessions
+
+    asyncio.run(scenario())
@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from helpers import fake_client
+from idempotency import IdempotencyStore
+from store import MemoryStore, SQLiteStore
+
+
+def test_repeated_tool_call_creates_one_ticket():
+    async def scenario():
+        client, fake = fake_client()
+        fake.latency = 0.05
+        store = IdempotencyStore(MemoryStore())
+
+        async def create():
+            response = await client.create_ticket({"name": "VPN"})
+            return response.json()["id"]
+
+        ids = await asyncio.gather(*(store.run("call_1", create) for _ in range(3)))
+        assert len(set(ids)) == 1 and len(fake.tickets) == 1
+        assert await store.run("call_1", create) == ids[0]
+        assert store.replays == 3
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_failure_releases_the_key():
+    async def scenario():
+        store = IdempotencyStore(MemoryStore())
+
+        async def fail():
+            raise RuntimeError("GLPI indisponível")
+
+        async def succeed():
+            return 42
+
+        with pytest.raises(RuntimeError):
+            await store.run("call_1", fail)
+        assert await store.run("call_1", succeed) == 42
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_leader_fails_waiters_without_cancelling_them():
+    async def scenario():
+        store = IdempotencyStore(MemoryStore())
+
+        async def slow():
+            await asyncio.sleep(1)
+            return "ok"
+
+        leader = asyncio.create_task(store.run("call_1", slow))
+        await asyncio.sleep(0.01)
+        waiter = asyncio.create_task(store.run("call_1", slow))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(RuntimeError, match="cancelada"):
+            await waiter
+        await asyncio.gather(leader, return_exceptions=True)
+        assert store.backend.get("call_1") is None
+
+    asyncio.run(scenario())
+
+
+def test_other_worker_waits_for_the_stored_result(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "shared.db")
+        first = IdempotencyStore(SQLiteStore(path, "idempotency"), poll_interval=0.01)
+        second = IdempotencyStore(SQLiteStore(path, "idempotency"), poll_interval=0.01)
+        runs = []
+
+        async def create():
+            runs.append(1)
+            await asyncio.sleep(0.05)
+            return {"id": 7}
+
+        results = await asyncio.gather(first.run("call_1", create), second.run("call_1", create))
+        assert results == [{"id": 7}, {"id": 7}] and len(runs) == 1
+
+    asyncio.run(scenario())
+
+
+def test_waiting_on_other_worker_backs_off(tmp_path):
+    class CountingStore(SQLiteStore):
+        gets = 0
+
+        def get(self, key):
+            self.gets += 1
+            return super().get(key)
+
+    async def scenario():
+        backend = CountingStore(str(tmp_path / "shared.db"), "idempotency")
+        backend.add("call_1", {"state": "pending"}, 60)
+        store = IdempotencyStore(backend, poll_interval=0.01, max_poll_interval=0.2)
+
+        async def other_worker_finishes():
+            await asyncio.sleep(0.6)
+            backend.set("call_1", {"state": "done", "result": 7}, 60)
+
+        async def create():
+            raise AssertionError("a chave já está com outro worker")
+
+        result, _ = await asyncio.gather(store.run("call_1", create), other_worker_finishes())
+        # Intervalo fixo de 10 ms faria ~60 consultas
+        assert result == 7 and backend.gets <= 10
+
+    asyncio.run(scenario())
@@ -0,0 +1,74 @@
+import asyncio
+
+from helpers import fake_client
+from incidents import IncidentAggregator, aggregator_from_env
+from ticket_batcher import post_batch
+
+RELATO = "A internet caiu no prédio inteiro, sem rede em nenhum computador"
+
+
+def ticket(texto=RELATO):
+    return {"name": "Sem rede", "content": texto, "itilcategories_id": 7, "entities_id": 1}
+
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("INCIDENT_AGGREGATION", raising=False)
+    assert aggregator_from_env(lambda: None) is None
+    monkeypatch.setenv("INCIDENT_AGGREGATION", "1")
+    assert isinstance(aggregator_from_env(lambda: None), IncidentAggregator)
+
+
+def test_ticket_in_flight_is_linked_to_master_created_meanwhile():
+    async def scenario():
+        client, fake = fake_client()
+        aggregator = IncidentAggregator(lambda: client, threshold=2, followup_wait=0.01)
+        slow = asyncio.Event()
+
+        async def create_ticket(ticket_input):
+            if not slow.is_set():
+                slow.set()
+                await asyncio.sleep(0.2)
+            return (await post_batch(client, [ticket_input]))[0]["id"]
+
+        first = asyncio.create_task(aggregator.report(ticket(), RELATO, create_ticket))
+        await slow.wait()
+        master = await aggregator.report(ticket(), RELATO, create_ticket)
+        assert master["action"] == "master"
+        first = await first
+        assert first["action"] == "ticket"
+
+        links = [f for f in fake.followups if "tickets_id_1" in f]
+        assert links == [{"id": links[0]["id"], "tickets_id_1": first["ticket_id"],
+                          "tickets_id_2": master["ticket_id"], "link": 1}]
+
+        followup = await aggregator.report(ticket(), RELATO, create_ticket)
+        assert followup == {"ticket_id": master["ticket_id"], "action": "followup", "reports": 3, "known": True}
+        assert len(fake.tickets) == 2
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_failed_master_falls_back_to_own_ticket():
+    async def scenario():
+        client, fake = fake_client()
+        aggregator = IncidentAggregator(lambda: client, threshold=2)
+        calls = []
+
+        async def create_ticket(ticket_input):
+            calls.append(ticket_input["name"])
+            if ticket_input["name"].startswith("[Incidente]") and len(calls) == 2:
+                raise RuntimeError("GLPI indisponível")
+            return (await post_batch(client, [ticket_input]))[0]["id"]
+
+        await aggregator.report(ticket(), RELATO, create_ticket)
+        try:
+            await aggregator.report(ticket(), RELATO, create_ticket)
+        except RuntimeError:
+            pass
+        # O próximo relato tenta criar o mestre de novo
+        retry = await aggregator.report(ticket(), RELATO, create_ticket)
+        assert retry["action"] == "master"
+        await client.close()
+
+    asyncio.run(scenario())
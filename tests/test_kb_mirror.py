@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+from helpers import fake_client
+from kb_mirror import KnowledgeMirror
+
+
+def make_mirror(tmp_path, **options):
+    mirror = KnowledgeMirror(str(tmp_path / "kb.db"), **options)
+    mirror._apply("KnowbaseItem", [
+        (1, "Impressora sem toner", "Troque o toner da impressora e imprima uma página de teste.", "2024-01-01"),
+        (2, "VPN não conecta", "Reinstale o cliente da VPN e confirme o usuário no AD.", "2024-01-01"),
+    ], "2024-01-01")
+    return mirror
+
+
+def test_search_requires_term_coverage(tmp_path):
+    mirror = make_mirror(tmp_path)
+    found = mirror.search("a impressora está sem toner")
+    assert [r["item_id"] for r in found] == [1] and found[0]["coverage"] == 1.0
+    # Um único termo em comum não basta: a busca fica para o GLPI
+    assert mirror.search("o monitor do computador pisca quando ligo a impressora") == []
+    mirror.close()
+
+
+def test_search_does_not_wait_for_the_writer(tmp_path):
+    mirror = make_mirror(tmp_path)
+    results = []
+    with mirror._lock:  # sincronização gravando em outra thread
+        reader = threading.Thread(target=lambda: results.append(mirror.search("vpn não conecta")))
+        reader.start()
+        reader.join(2)
+    assert not reader.is_alive() and [r["item_id"] for r in results[0]] == [2]
+    assert len(mirror) == 2
+    mirror.close()
+
+
+def test_full_sync_removes_articles_deleted_in_glpi(tmp_path):
+    async def scenario():
+        client, fake = fake_client()
+        mirror = KnowledgeMirror(str(tmp_path / "kb.db"))
+        await mirror.sync_once(client)
+        total = len(fake.solutions)
+        assert len(mirror) == 2 * total  # ITILSolution e KnowbaseItem
+
+        removed = fake.solutions.pop(0)
+        await mirror.sync_once(client)
+        assert len(mirror) == 2 * total  # incremental só acrescenta
+
+        # GLPI fora no meio da listagem: nada é removido
+        fake.error_rate = {"search/KnowbaseItem": 1.0}
+        await mirror.sync_once(client, full=True)
+        assert len(mirror) == 2 * total - 1
+        fake.error_rate = 0.0
+
+        await mirror.sync_once(client, full=True)
+        assert len(mirror) == 2 * (total - 1)
+        ids = {row[0] for row in mirror._reader().execute("SELECT item_id FROM docs")}
+        assert removed["id"] not in ids
+        await client.close()
+        mirror.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,78 @@
+import asyncio
+
+import httpx
+import pytest
+
+import glpi_client
+from fake_glpi import FakeGLPI
+from helpers import fake_client
+from resilience import CircuitOpenError
+
+
+def test_breaker_opens_and_recovers_against_glpi():
+    async def scenario():
+        client, fake = fake_client(FakeGLPI(seed=1, error_rate={"search/Ticket": 1.0}),
+                                   breaker_threshold=2, breaker_reset=0.1)
+        for _ in range(2):
+            assert (await client.search("Ticket", {})).status_code == 503
+        with pytest.raises(CircuitOpenError):
+            await client.search("Ticket", {})
+        assert fake.calls["search/Ticket"] == 2
+        # Outras operações não são afetadas
+        assert (await client.create_ticket({"name": "VPN"})).status_code == 201
+
+        fake.error_rate = 0.0
+        await asyncio.sleep(0.12)
+        assert (await client.search("Ticket", {})).status_code == 200
+        assert client.breakers.snapshot()["search/Ticket"]["state"] == "closed"
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_trial_call_frees_the_half_open_slot():
+    async def scenario():
+        client, fake = fake_client(FakeGLPI(seed=1, error_rate={"search/Ticket": 1.0}),
+                                   breaker_threshold=1, breaker_reset=0.05)
+        assert (await client.search("Ticket", {})).status_code == 503
+        fake.error_rate, fake.latency = 0.0, {"search/Ticket": 1.0}
+        await asyncio.sleep(0.06)
+        trial = asyncio.create_task(client.search("Ticket", {}))
+        await asyncio.sleep(0.05)
+        trial.cancel()
+        await asyncio.gather(trial, return_exceptions=True)
+
+        fake.latency = 0.0
+        assert (await client.search("Ticket", {})).status_code == 200
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+class RefuseSearch(httpx.AsyncBaseTransport):
+    """
+    GLPI falso que recusa a conexão nas buscas.
+    """
+
+    def __init__(self, fake):
+        self.inner = httpx.ASGITransport(app=fake.app)
+
+    async def handle_async_request(self, request):
+        if "/search/" in request.url.path:
+            raise httpx.ConnectError("conexão recusada", request=request)
+        return await self.inner.handle_async_request(request)
+
+
+def test_connection_errors_count_as_failures():
+    async def scenario():
+        fake = FakeGLPI(seed=1)
+        client = glpi_client.client_from_env(transport=RefuseSearch(fake), session_store=None, max_retries=0,
+                                             breaker_threshold=1, breaker_reset=60)
+        with pytest.raises(httpx.ConnectError):
+            await client.search("Ticket", {})
+        with pytest.raises(CircuitOpenError):
+            await client.search("Ticket", {})
+        assert client.breakers.snapshot()["search/Ticket"]["rejected"] == 1
+        await client.close()
+
+    asyncio.run(scenario())
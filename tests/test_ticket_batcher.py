@@ -0,0 +1,91 @@
+import asyncio
+
+import httpx
+
+import glpi_client
+from fake_glpi import FakeGLPI
+from helpers import fake_client
+from ticket_batcher import TicketBatcher
+
+
+class LostResponse(httpx.AsyncBaseTransport):
+    """
+    Entrega o primeiro POST de Ticket ao GLPI falso e perde a resposta (timeout de leitura).
+    """
+
+    def __init__(self, fake):
+        self.inner = httpx.ASGITransport(app=fake.app)
+        self.lost = False
+
+    async def handle_async_request(self, request):
+        response = await self.inner.handle_async_request(request)
+        if request.method == "POST" and request.url.path.endswith("/Ticket") and not self.lost:
+            self.lost = True
+            raise httpx.ReadTimeout("resposta perdida", request=request)
+        return response
+
+
+def test_batches_concurrent_submits_and_keeps_task_references():
+    async def scenario():
+        client, fake = fake_client()
+        batcher = TicketBatcher(lambda: client, max_batch=10, max_wait=0.05)
+        pending = [asyncio.create_task(batcher.create({"name": f"Ticket {i}"})) for i in range(3)]
+        await asyncio.sleep(0)
+        assert len(batcher._tasks) == 1  # o timer da janela
+        ids = await asyncio.gather(*pending)
+        assert sorted(ids) == sorted(fake.tickets)
+        assert fake.calls["Ticket"] == 1 and batcher.batches_sent == 1
+        await asyncio.sleep(0)
+        assert not batcher._tasks
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_lost_response_reports_tickets_already_created():
+    async def scenario():
+        fake = FakeGLPI(seed=1)
+        fake._create("Ticket", {"name": "VPN", "content": "<p>Chamado antigo</p>"})
+        client = glpi_client.client_from_env(transport=LostResponse(fake), session_store=None, max_retries=0)
+        batcher = TicketBatcher(lambda: client, max_batch=3, max_wait=0.05)
+        inputs = [{"name": "VPN", "content": "Sem VPN em casa"}, {"name": "Impressora", "content": "Sem toner"}]
+        results = await asyncio.gather(*(batcher.submit(item) for item in inputs))
+
+        assert [r["status"] for r in results] == [201, 201]
+        assert [fake.tickets[r["id"]]["content"] for r in results] == ["Sem VPN em casa", "Sem toner"]
+        assert fake.calls["Ticket"] == 1 and len(fake.tickets) == 3
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_connection_failure_is_not_reconciled():
+    async def scenario():
+        client, fake = fake_client(FakeGLPI(seed=1, error_rate={"Ticket": 1.0}))
+        batcher = TicketBatcher(lambda: client, max_batch=2)
+        results = await asyncio.gather(*(batcher.submit({"name": n}) for n in ("a", "b")))
+        assert [r["id"] for r in results] == [None, None]
+        assert fake.calls["search/Ticket"] == 0
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_one_invalid_ticket_fails_only_its_own_caller():
+    async def scenario():
+        client, fake = fake_client()
+        fake.reject = lambda item: item.get("name") == "inválido"
+        batcher = TicketBatcher(lambda: client, max_batch=4)
+        names = ["VPN", "inválido", "Impressora", "E-mail"]
+        results = await asyncio.gather(*(batcher.submit({"name": n}) for n in names))
+
+        assert [r["status"] for r in results] == [201, 400, 201, 201]
+        assert sorted(t["name"] for t in fake.tickets.values()) == ["E-mail", "Impressora", "VPN"]
+        # Um POST com o lote e um por item depois da recusa
+        assert fake.calls["Ticket"] == 5
+
+        many = await batcher.submit_many([{"name": "inválido"}, {"name": "Rede"}])
+        assert [r["status"] for r in many] == [400, 201]
+        await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,64 @@
+import asyncio
+
+from helpers import fake_client
+from ticket_queue import TicketQueue
+
+
+def test_rejected_batch_is_resent_item_by_item(tmp_path):
+    async def scenario():
+        client, fake = fake_client()
+        fake.reject = lambda item: item.get("name") == "inválido"
+        queue = TicketQueue(str(tmp_path / "queue.db"), batch_size=5)
+        refs = [queue.enqueue({"name": name}) for name in ("VPN", "inválido", "Impressora")]
+
+        await queue._send(client, queue._claim())
+        assert fake.calls["Ticket"] == 4
+        states = [queue.lookup(ref) for ref in refs]
+        assert [s["status"] for s in states] == ["done", "failed", "done"]
+        assert states[1]["last_error"].startswith("Status 400")
+        assert sorted(t["name"] for t in fake.tickets.values()) == ["Impressora", "VPN"]
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_stop_mid_send_leaves_items_in_doubt(tmp_path):
+    async def scenario():
+        client, fake = fake_client()
+        fake.latency = 1.0
+        queue = TicketQueue(str(tmp_path / "queue.db"), workers=1, poll_interval=0.01)
+        queue.start(lambda: client)
+        ref = await queue.put({"name": "VPN"})
+        await asyncio.sleep(0.2)
+        assert queue.lookup(ref)["status"] == "sending"
+        await queue.stop()
+        assert queue.lookup(ref)["status"] == "unknown"
+        assert queue.pending() == 1
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_restart_reconciles_interrupted_items_before_resending(tmp_path):
+    async def scenario():
+        client, fake = fake_client()
+        path = str(tmp_path / "queue.db")
+        queue = TicketQueue(path, batch_size=5)
+        sent = {"name": "VPN", "content": "<p>Sem acesso</p>"}
+        lost = {"name": "Impressora", "content": "Não imprime"}
+        refs = [queue.enqueue(sent), queue.enqueue(lost)]
+        queue._interrupt([job[0] for job in queue._claim()])
+        # O POST interrompido chegou a criar o primeiro ticket no GLPI
+        created = (await client.create_ticket(sent)).json()["id"]
+        posts = fake.calls["Ticket"]
+
+        restarted = TicketQueue(path, batch_size=5)
+        await restarted._send(client, restarted._claim())
+        states = [restarted.lookup(ref) for ref in refs]
+        assert [s["status"] for s in states] == ["done", "done"]
+        assert states[0]["ticket_id"] == created
+        assert fake.calls["Ticket"] == posts + 1
+        assert sorted(t["name"] for t in fake.tickets.values()) == ["Impressora", "VPN"]
+        await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,68 @@
+import asyncio
+
+from helpers import fake_client
+from store import SQLiteStore
+from ticket_status import TicketStatusService
+
+
+def test_single_lookup_per_request_and_short_not_found_ttl():
+    async def scenario():
+        client, fake = fake_client()
+        fake._create("Ticket", {"name": "Impressora sem toner"})
+        service = TicketStatusService(fresh_ttl=60, not_found_ttl=0.05)
+
+        first = await service.status(client, "1")
+        again = await service.status(client, "1")
+        assert first["found"] and first["status"] == "novo" and again is first
+        stats = service.stats()
+        assert (stats["misses"], stats["hits"]) == (1, 1)
+
+        # Consultas repetidas não renovam o cache curto de "não encontrado"
+        assert not (await service.status(client, "99"))["found"]
+        searches = fake.calls["search/Ticket"]
+        await asyncio.sleep(0.03)
+        await service.status(client, "99")
+        await asyncio.sleep(0.03)
+        await service.status(client, "99")
+        assert fake.calls["search/Ticket"] == searches + 1
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_lookups_share_one_glpi_search():
+    async def scenario():
+        client, fake = fake_client()
+        fake.latency = 0.02
+        fake._create("Ticket", {"name": "VPN"})
+        service = TicketStatusService()
+        results = await asyncio.gather(*(service.status(client, "1") for _ in range(5)))
+        assert all(r["found"] for r in results)
+        assert fake.calls["search/Ticket"] == 1
+        await client.close()
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_reaches_other_workers_through_the_shared_store(tmp_path):
+    async def scenario():
+        client, fake = fake_client()
+        path = str(tmp_path / "shared.db")
+
+        def worker():
+            return TicketStatusService(fresh_ttl=60, not_found_ttl=60,
+                                       fresh_backend=SQLiteStore(path, "ticket_status"),
+                                       known_backend=SQLiteStore(path, "ticket_status_known"))
+
+        first, second = worker(), worker()
+        assert not (await first.status(client, "1"))["found"]
+        assert not (await second.status(client, "1"))["found"]
+        assert fake.calls["search/Ticket"] == 1
+
+        # O ticket é criado pelo segundo worker, que invalida a entrada de todos
+        fake._create("Ticket", {"name": "VPN"})
+        await second.invalidate("1")
+        assert (await first.status(client, "1"))["found"]
+        await client.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,31 @@
+from tracing import Tracer, setup_tracing, trace_id_for
+
+
+class Collector:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+
+
+def test_call_id_starts_a_new_root_without_the_foreign_parent():
+    collector = Collector()
+    tracer = Tracer(collector, sample_rate=1.0)
+    with tracer.start_trace("POST /vapi/tool-calls", "a" * 32, "b" * 16) as root:
+        tracer.use_call_id("call-1")
+        with tracer.span("glpi"):
+            pass
+    child, exported_root = collector.spans
+    assert exported_root is root and root.parent_id is None
+    assert root.trace.trace_id == trace_id_for("call-1")
+    assert root.attributes["trace.previous_parent"] == f"{'a' * 32}-{'b' * 16}"
+    assert child.parent_id == root.span_id
+
+
+def test_tracing_is_off_by_default(monkeypatch):
+    import tracing
+
+    monkeypatch.delenv("TRACE_FILE", raising=False)
+    monkeypatch.setattr(tracing.TRACER, "exporter", None)
+    assert setup_tracing().exporter is None
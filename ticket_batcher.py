@@ -0,0 +1,252 @@
+import os
+import re
+import html
+import time
+import asyncio
+import logging
+
+import httpx
+
+from glpi_client import get_glpi_client
+from glpi_session import GLPIAuthError
+
+logger = logging.getLogger(__name__)
+
+# Falhas em que o POST pode ter chegado ao GLPI e só a resposta se perdeu
+_UNCERTAIN_ERRORS = (httpx.ReadTimeout, httpx.WriteTimeout, httpx.ReadError, httpx.WriteError,
+                     httpx.RemoteProtocolError)
+# Status com que o GLPI recusa o lote inteiro quando um dos itens é inválido
+_BATCH_REJECTED = {400, 404, 422}
+# Campos da busca de Ticket: ID, título, descrição e data de criação
+FIELD_ID, FIELD_NAME, FIELD_CONTENT, FIELD_DATE_CREATION = 2, 1, 21, 15
+# Folga (s) entre os relógios da aplicação e do GLPI na busca por tickets recém-criados
+CLOCK_SKEW = 300
+
+
+class TicketCreationError(Exception):
+    """
+    Falha ao criar um ticket específico dentro de um lote.
+    """
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+async def post_batch(client, inputs, itemtype="Ticket"):
+    """
+    Cria vários itens em um único POST (`input` como lista).
+    Retorna um resultado por item, na mesma ordem:
+    {"id": int | None, "status": int, "message": str}.
+
+    Se o GLPI recusar o lote inteiro (um item inválido derruba o POST), os
+    itens são reenviados um a um: só o item recusado sozinho fica com erro.
+    """
+    since = time.time()
+    try:
+        response = await client.request("POST", itemtype, json={"input": list(inputs)})
+    except GLPIAuthError as e:
+        return [{"id": None, "status": e.status_code, "message": e.detail} for _ in inputs]
+    except httpx.HTTPError as e:
+        results = [{"id": None, "status": 503, "message": f"Erro ao conectar ao GLPI: {str(e)}"} for _ in inputs]
+        if itemtype == "Ticket" and isinstance(e, _UNCERTAIN_ERRORS):
+            # Sem a resposta não dá para saber o que foi criado: repetir duplicaria os tickets
+            await _reconcile(client, inputs, results, since)
+        return results
+
+    if response.status_code in _BATCH_REJECTED and len(inputs) > 1:
+        logger.warning(f"Lote de {len(inputs)} {itemtype} recusado pelo GLPI (Status {response.status_code}); "
+                       f"reenviando os itens um a um.")
+        singles = await asyncio.gather(*(post_batch(client, [item], itemtype) for item in inputs))
+        return [single[0] for single in singles]
+    if response.status_code not in (200, 201, 207):
+        return [{"id": None, "status": response.status_code, "message": response.text} for _ in inputs]
+
+    items = response.json()
+    if isinstance(items, dict):
+        items = [items]
+    results = []
+    for i in range(len(inputs)):
+        item = items[i] if i < len(items) and isinstance(items[i], dict) else {}
+        item_id = item.get("id")
+        if item_id:
+            results.append({"id": item_id, "status": 201, "message": item.get("message", "")})
+        else:
+            results.append({"id": None, "status": 400, "message": item.get("message") or "Item não criado pelo GLPI"})
+    return results
+
+
+def _plain(text):
+    """
+    Texto sem HTML e com espaços normalizados (o GLPI guarda a descrição em HTML).
+    """
+    return " ".join(html.unescape(re.sub(r"<[^>]+>", " ", text or "")).split())
+
+
+async def find_created(client, inputs, since):
+    """
+    Procura no GLPI os tickets de um envio cujo resultado se perdeu (criados
+    desde `since`, casados pelo título e pela descrição). Retorna o ID de
+    cada item, ou None para os não encontrados; None no lugar da lista se a
+    busca falhar (não dá para saber se foram criados).
+    """
+    params = {
+        "criteria[0][field]": FIELD_DATE_CREATION,
+        "criteria[0][searchtype]": "morethan",
+        "criteria[0][value]": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(since - CLOCK_SKEW)),
+        "forcedisplay[0]": FIELD_ID,
+        "forcedisplay[1]": FIELD_NAME,
+        "forcedisplay[2]": FIELD_CONTENT,
+        "sort": FIELD_ID,
+        "order": "DESC",
+        "range": "0-999",
+    }
+    try:
+        response = await client.search("Ticket", params)
+        rows = (response.json().get("data") or []) if response.status_code in (200, 206) else []
+    except (httpx.HTTPError, GLPIAuthError, ValueError) as e:
+        logger.warning(f"Não foi possível conferir os tickets criados pelo lote: {str(e)}")
+        return None
+    # Do mais antigo para o mais recente, na ordem em que o GLPI cria os itens do lote
+    created = sorted((int(row[str(FIELD_ID)]), row.get(str(FIELD_NAME)), _plain(row.get(str(FIELD_CONTENT))))
+                     for row in rows if row.get(str(FIELD_ID)))
+    used, found = set(), []
+    for ticket_input in inputs:
+        content = _plain(ticket_input.get("content"))
+        match = next((ticket_id for ticket_id, name, created_content in created
+                      if ticket_id not in used and name == ticket_input.get("name") and created_content == content),
+                     None)
+        if match is not None:
+            used.add(match)
+        found.append(match)
+    return found
+
+
+async def _reconcile(client, inputs, results, since):
+    """
+    Marca como criados os tickets de um POST cuja resposta se perdeu e que
+    já estão no GLPI (ver find_created). Os demais continuam como falha e
+    podem ser reenviados.
+    """
+    found = await find_created(client, inputs, since) or []
+    for result, ticket_id in zip(results, found):
+        if ticket_id is not None:
+            result.update(id=ticket_id, status=201, message="Criado (confirmado após falha na resposta)")
+    confirmed = sum(1 for ticket_id in found if ticket_id is not None)
+    if confirmed:
+        logger.warning(f"Resposta do lote perdida; {confirmed} de {len(inputs)} ticket(s) já criados no GLPI.")
+
+
+class TicketBatcher:
+    """
+    Agrupa criações de ticket em POSTs com vários itens.
+
+    Cada submit() entra no lote atual, que é enviado quando atinge
+    `max_batch` itens ou quando a janela de `max_wait` segundos termina.
+    O ID (ou erro) de cada item volta para quem o submeteu; se a resposta
+    do POST se perder (timeout), os tickets já criados são procurados no
+    GLPI antes de devolver o erro. Outros itens
+    do GLPI (ex.: TicketFollowup) usam o mesmo agrupamento com `itemtype`.
+    """
+
+    def __init__(self, client_getter, max_batch=20, max_wait=0.02, itemtype="Ticket"):
+        self.client_getter = client_getter
+        self.itemtype = itemtype
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self._pending = []
+        self._timer = None
+        # Referências das tarefas de envio (o event loop só guarda referências fracas)
+        self._tasks = set()
+        self.batches_sent = 0
+        self.items_sent = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    async def _send(self, batch):
+        self.batches_sent += 1
+        self.items_sent += len(batch)
+        try:
+            results = await post_batch(self.client_getter(), [item for item, _ in batch], self.itemtype)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _flush(self):
+        batch, self._pending = self._pending, []
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if batch:
+            self._spawn(self._send(batch))
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait)
+        self._timer = None
+        self._flush()
+
+    async def submit(self, ticket_input):
+        """
+        Cria um ticket (via lote) e retorna o resultado do item.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((ticket_input, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = self._spawn(self._flush_later())
+        return await future
+
+    async def create(self, ticket_input):
+        """
+        Como submit(), mas retorna apenas o ID e levanta TicketCreationError em caso de falha.
+        """
+        result = await self.submit(ticket_input)
+        if not result["id"]:
+            raise TicketCreationError(result["status"], result["message"])
+        return result["id"]
+
+    async def submit_many(self, inputs):
+        """
+        Envia uma lista grande (importação em massa) em lotes de `max_batch`.
+        """
+        chunks = [inputs[i:i + self.max_batch] for i in range(0, len(inputs), self.max_batch)]
+        client = self.client_getter()
+        results = await asyncio.gather(*(post_batch(client, chunk, self.itemtype) for chunk in chunks))
+        self.batches_sent += len(chunks)
+        self.items_sent += len(inputs)
+        return [result for chunk in results for result in chunk]
+
+
+def batcher_from_env(client_getter):
+    return TicketBatcher(
+        client_getter,
+        max_batch=int(os.getenv("TICKET_BATCH_SIZE", "20")),
+        max_wait=float(os.getenv("TICKET_BATCH_WINDOW_MS", "20")) / 1000,
+    )
+
+
+_batcher = None
+
+
+def get_ticket_batcher():
+    """
+    Retorna o agrupador de tickets do processo, ligado ao cliente GLPI padrão.
+    """
+    global _batcher
+    if _batcher is None:
+        _batcher = batcher_from_env(get_glpi_client)
+    return _batcher
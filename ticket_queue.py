@@ -0,0 +1,263 @@
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import logging
+import sqlite3
+import threading
+
+from ticket_batcher import find_created, post_batch
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ticket_queue (
+    ref TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    ticket_id INTEGER,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    in_doubt_since REAL
+);
+CREATE INDEX IF NOT EXISTS ticket_queue_due ON ticket_queue (status, next_attempt_at);
+"""
+
+# Colunas acrescentadas depois da primeira versão da tabela
+_MIGRATIONS = {"in_doubt_since": "ALTER TABLE ticket_queue ADD COLUMN in_doubt_since REAL"}
+
+# Respostas do GLPI que não adianta repetir (payload inválido, permissão negada...)
+_PERMANENT_STATUS = {400, 403, 404, 422}
+
+
+class TicketQueue:
+    """
+    Fila durável (SQLite em modo WAL) para criação de tickets em segundo plano.
+
+    enqueue() grava o payload do ticket em disco e devolve na hora um
+    protocolo provisório. Workers assíncronos enviam os itens pendentes ao
+    GLPI em lotes (um POST com vários itens), com novas tentativas e backoff
+    exponencial, e guardam o ID real do
+    ticket para consulta pelo protocolo.
+
+    Um item cujo envio foi interrompido (encerramento no meio do POST, ou
+    mais de `lease` segundos em "sending" porque o processo caiu) pode já
+    ter sido criado no GLPI: fica como "unknown" e, antes de ser reenviado,
+    é procurado no GLPI (ticket_batcher.find_created) para não duplicar.
+    """
+
+    def __init__(self, path, workers=2, max_attempts=20, base_delay=2.0, max_delay=300.0,
+                 poll_interval=1.0, lease=300.0, batch_size=20):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._tasks = []
+        self._wakeup = None
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ticket_queue)")}
+        for column, statement in _MIGRATIONS.items():
+            if column not in columns:
+                self._conn.execute(statement)
+
+    # -- fila -----------------------------------------------------------------
+    def enqueue(self, ticket_input):
+        """
+        Grava o ticket na fila e retorna o protocolo provisório.
+        """
+        ref = f"PROV-{uuid.uuid4().hex[:12].upper()}"
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ticket_queue (ref, payload, next_attempt_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (ref, json.dumps(ticket_input), now, now, now),
+            )
+        return ref
+
+    async def put(self, ticket_input):
+        """
+        Versão assíncrona de enqueue(): grava fora do event loop e acorda os workers.
+        """
+        ref = await asyncio.to_thread(self.enqueue, ticket_input)
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return ref
+
+    def lookup(self, ref):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT ref, status, ticket_id, attempts, last_error FROM ticket_queue WHERE ref = ?",
+                (ref,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"ref": row[0], "status": row[1], "ticket_id": row[2], "attempts": row[3], "last_error": row[4]}
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM ticket_queue WHERE status IN ('pending', 'sending', 'unknown')"
+            ).fetchone()[0]
+
+    def _claim(self):
+        """
+        Reserva até `batch_size` itens vencidos. Retorna lista de
+        (ref, payload, attempts, in_doubt_since); `in_doubt_since` é o início
+        do envio interrompido (None se o item nunca foi enviado sem resposta).
+        """
+        # UPDATE ... RETURNING é atômico mesmo com vários processos usando o mesmo arquivo.
+        # No SET, status e updated_at ainda são os valores anteriores à reserva.
+        now = time.time()
+        due = ("(status IN ('pending', 'unknown') AND next_attempt_at <= :now) "
+               "OR (status = 'sending' AND updated_at <= :expired)")
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE ticket_queue SET status = 'sending', updated_at = :now, in_doubt_since = "
+                "CASE WHEN status = 'pending' THEN NULL ELSE COALESCE(in_doubt_since, updated_at) END "
+                f"WHERE ref IN (SELECT ref FROM ticket_queue WHERE {due} ORDER BY next_attempt_at LIMIT :limit) "
+                f"AND ({due}) RETURNING ref, payload, attempts, in_doubt_since",
+                {"now": now, "expired": now - self.lease, "limit": self.batch_size},
+            ).fetchall()
+        return [(row[0], json.loads(row[1]), row[2], row[3]) for row in rows]
+
+    def _finish(self, ref, ticket_id):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ticket_queue SET status = 'done', ticket_id = ?, last_error = NULL, updated_at = ? "
+                "WHERE ref = ?",
+                (ticket_id, time.time(), ref),
+            )
+
+    def _interrupt(self, refs):
+        """
+        Envio interrompido: o POST pode ter chegado ao GLPI, então os itens
+        ficam "unknown" (updated_at continua sendo o início do envio) e são
+        conferidos no GLPI antes de um novo envio.
+        """
+        with self._lock:
+            self._conn.executemany("UPDATE ticket_queue SET status = 'unknown' WHERE ref = ? AND status = 'sending'",
+                                   [(ref,) for ref in refs])
+
+    def _retry(self, ref, attempts, error, permanent=False, uncertain=False):
+        attempts += 1
+        failed = permanent or attempts >= self.max_attempts
+        status = "failed" if failed else "unknown" if uncertain else "pending"
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE ticket_queue SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, "
+                "updated_at = ? WHERE ref = ?",
+                (status, attempts, time.time() + delay, error[:500], time.time(), ref),
+            )
+        if failed:
+            logger.error(f"Ticket {ref} descartado após {attempts} tentativas: {error}")
+
+    # -- workers --------------------------------------------------------------
+    def _record(self, jobs, results):
+        for (ref, _, attempts, _), result in zip(jobs, results):
+            if result["id"]:
+                self._finish(ref, result["id"])
+                logger.info(f"Ticket {ref} criado no GLPI. ID: {result['id']}")
+            else:
+                self._retry(ref, attempts, f"Status {result['status']}: {result['message']}",
+                            result["status"] in _PERMANENT_STATUS)
+
+    def _unresolved(self, jobs):
+        # Busca no GLPI falhou: os itens continuam "unknown" e são conferidos de novo mais tarde
+        for ref, _, attempts, _ in jobs:
+            self._retry(ref, attempts, "Envio interrompido; não foi possível conferir no GLPI", uncertain=True)
+
+    async def _reconcile(self, client, jobs):
+        """
+        Confere no GLPI os itens de envios interrompidos. Marca os já criados
+        como concluídos e retorna os que podem ser enviados.
+        """
+        doubtful = [job for job in jobs if job[3] is not None]
+        if not doubtful:
+            return jobs
+        found = await find_created(client, [payload for _, payload, _, _ in doubtful],
+                                   min(since for _, _, _, since in doubtful))
+        if found is None:
+            await asyncio.to_thread(self._unresolved, doubtful)
+            return [job for job in jobs if job[3] is None]
+        created = {job[0]: ticket_id for job, ticket_id in zip(doubtful, found) if ticket_id is not None}
+        if created:
+            logger.warning(f"{len(created)} ticket(s) de envios interrompidos já estavam no GLPI; não serão reenviados.")
+            done = [job for job in doubtful if job[0] in created]
+            await asyncio.to_thread(self._record, done,
+                                    [{"id": created[job[0]], "status": 201, "message": ""} for job in done])
+        return [job for job in jobs if job[0] not in created]
+
+    async def _send(self, client, jobs):
+        jobs = await self._reconcile(client, jobs)
+        if not jobs:
+            return
+        # Lote recusado por um item inválido: post_batch reenvia os itens um a um
+        results = await post_batch(client, [payload for _, payload, _, _ in jobs])
+        await asyncio.to_thread(self._record, jobs, results)
+
+    async def _worker(self, client_getter):
+        while True:
+            jobs = await asyncio.to_thread(self._claim)
+            if not jobs:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._send(client_getter(), jobs)
+            except asyncio.CancelledError:
+                # Shutdown no meio do envio: o POST pode ter sido aceito; os itens voltam
+                # para a fila como "unknown" e são conferidos no GLPI antes de reenviar
+                self._interrupt([job[0] for job in jobs])
+                raise
+            except Exception as e:
+                logger.error(f"Erro inesperado ao enviar tickets {[job[0] for job in jobs]}: {str(e)}")
+
+    def start(self, client_getter):
+        """
+        Inicia os workers que enviam os tickets pendentes ao GLPI.
+        """
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(client_getter)) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def queue_from_env():
+    """
+    Cria a fila de tickets se TICKET_WRITE_BEHIND=1 (None caso contrário).
+    """
+    if os.getenv("TICKET_WRITE_BEHIND", "0") != "1":
+        return None
+    return TicketQueue(
+        os.getenv("TICKET_QUEUE_PATH", "data/ticket_queue.db"),
+        workers=int(os.getenv("TICKET_QUEUE_WORKERS", "2")),
+        max_attempts=int(os.getenv("TICKET_QUEUE_MAX_ATTEMPTS", "20")),
+        batch_size=int(os.getenv("TICKET_BATCH_SIZE", "20")),
+    )
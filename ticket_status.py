@@ -0,0 +1,181 @@
+import os
+import logging
+
+import httpx
+
+from cache import TTLCache
+from kb_mirror import clean_html
+from store import shared_store_from_env
+
+logger = logging.getLogger(__name__)
+
+# Campos da busca de Ticket: 2 = ID, 1 = título, 12 = status, 8 = grupo atribuído, 19 = data de modificação
+FIELD_ID = 2
+FIELD_NAME = 1
+FIELD_STATUS = 12
+FIELD_GROUP = 8
+FIELD_DATE_MOD = 19
+
+STATUS_NAMES = {
+    1: "novo",
+    2: "em atendimento",
+    3: "em atendimento (planejado)",
+    4: "pendente",
+    5: "solucionado",
+    6: "fechado",
+}
+
+# Acompanhamentos lidos por consulta: o mais recente que não for privado é o usado
+FOLLOWUPS_SCAN = 5
+# Tamanho máximo do texto do acompanhamento falado ao usuário
+FOLLOWUP_MAX_CHARS = 300
+
+
+def _criteria(ticket_id, fields):
+    params = {
+        "criteria[0][field]": FIELD_ID,
+        "criteria[0][searchtype]": "equals",
+        "criteria[0][value]": ticket_id,
+    }
+    for i, field in enumerate(fields):
+        params[f"forcedisplay[{i}]"] = field
+    return params
+
+
+def describe(status):
+    """
+    Frase com o status do ticket para o assistente de voz.
+    """
+    if not status["found"]:
+        return f"Não encontrei o chamado {status['ticket_id']}. Pode confirmar o número?"
+    texto = f"O chamado {status['ticket_id']} está {status['status']}"
+    texto += f", com o grupo {status['group']}." if status["group"] else ", ainda sem grupo atribuído."
+    if status["followup"]:
+        texto += f" Último acompanhamento: {status['followup']}"
+    return texto
+
+
+class TicketStatusService:
+    """
+    Status, grupo atribuído e último acompanhamento de um ticket do GLPI.
+
+    Respostas ficam em cache por `fresh_ttl` segundos, com consultas
+    concorrentes ao mesmo ticket agrupadas. Vencido esse prazo, a última
+    resposta conhecida (guardada por `max_age`) é revalidada com uma busca
+    que traz só o ID e a data de modificação: se o ticket não mudou, nada
+    mais é buscado. Se o GLPI falhar, a resposta conhecida é devolvida.
+    Tickets inexistentes ficam em cache por `not_found_ttl`.
+
+    `invalidate()` descarta o ticket quando a própria aplicação o altera
+    (criação, feedback). Com backends compartilhados (store.SQLiteStore) as
+    entradas ficam só neles, sem cópia local: a invalidação feita por um
+    worker vale para todos.
+    """
+
+    def __init__(self, maxsize=2048, fresh_ttl=30.0, max_age=900.0, not_found_ttl=10.0,
+                 fresh_backend=None, known_backend=None):
+        self.fresh = TTLCache(maxsize=maxsize, ttl=fresh_ttl, backend=fresh_backend, local_ttl=0)
+        self.known = TTLCache(maxsize=maxsize, ttl=max_age, backend=known_backend, local_ttl=0)
+        self.not_found_ttl = not_found_ttl
+        self.revalidated = 0
+        self.fetched = 0
+        self.stale_served = 0
+
+    async def _search(self, client, ticket_id, fields):
+        response = await client.search("Ticket", _criteria(ticket_id, fields))
+        response.raise_for_status()
+        for item in response.json().get("data") or []:
+            if str(item.get(str(FIELD_ID))) == str(ticket_id):
+                return item
+        return None
+
+    async def _latest_followup(self, client, ticket_id):
+        response = await client.request("GET", f"Ticket/{ticket_id}/ITILFollowup", params={
+            "range": f"0-{FOLLOWUPS_SCAN - 1}",
+            "sort": "id",
+            "order": "DESC",
+        })
+        if response.status_code not in (200, 206):
+            return None, None
+        for followup in response.json() or []:
+            if not followup.get("is_private"):
+                content = clean_html(followup.get("content"))
+                if len(content) > FOLLOWUP_MAX_CHARS:
+                    content = content[:FOLLOWUP_MAX_CHARS].rsplit(" ", 1)[0] + "..."
+                return content, followup.get("date_creation") or followup.get("date")
+        return None, None
+
+    async def _fetch(self, client, ticket_id):
+        item = await self._search(client, ticket_id, (FIELD_ID, FIELD_NAME, FIELD_STATUS, FIELD_GROUP, FIELD_DATE_MOD))
+        self.fetched += 1
+        if item is None:
+            return {"ticket_id": ticket_id, "found": False}
+        followup, followup_date = await self._latest_followup(client, ticket_id)
+        status = item.get(str(FIELD_STATUS))
+        groups = [g for g in str(item.get(str(FIELD_GROUP)) or "").split("$#$") if g]
+        return {
+            "ticket_id": ticket_id,
+            "found": True,
+            "title": item.get(str(FIELD_NAME)),
+            "status_id": int(status) if str(status).isdigit() else None,
+            "status": STATUS_NAMES.get(int(status), str(status)) if str(status).isdigit() else str(status),
+            "group": ", ".join(groups) or None,
+            "followup": followup,
+            "followup_date": followup_date,
+            "date_mod": item.get(str(FIELD_DATE_MOD)),
+        }
+
+    async def _load(self, client, ticket_id):
+        key = str(ticket_id)
+        known = await self.known.get_async(key)
+        try:
+            if known is not None and known["found"]:
+                item = await self._search(client, ticket_id, (FIELD_ID, FIELD_DATE_MOD))
+                if item is not None and item.get(str(FIELD_DATE_MOD)) == known["date_mod"]:
+                    self.revalidated += 1
+                    status = known
+                else:
+                    status = await self._fetch(client, ticket_id)
+            else:
+                status = await self._fetch(client, ticket_id)
+        except httpx.HTTPError as e:
+            if known is None:
+                raise
+            logger.warning(f"GLPI indisponível ao consultar o ticket {ticket_id}; usando o último status conhecido: {str(e)}")
+            self.stale_served += 1
+            return {**known, "stale": True}
+        await self.known.set_async(key, status)
+        return status
+
+    async def status(self, client, ticket_id):
+        """
+        Retorna o status do ticket (dict com "found"); usa o cache quando possível.
+        """
+        # Ticket recém-criado em outro worker pode ainda não existir aqui: cache curto
+        return await self.fresh.get_or_load(str(ticket_id), lambda: self._load(client, ticket_id),
+                                            ttl=lambda status: None if status["found"] else self.not_found_ttl)
+
+    async def invalidate(self, ticket_id):
+        if ticket_id:
+            await self.fresh.delete_async(str(ticket_id))
+            await self.known.delete_async(str(ticket_id))
+
+    def stats(self):
+        return {
+            **self.fresh.stats(),
+            "known": len(self.known),
+            "fetched": self.fetched,
+            "revalidated": self.revalidated,
+            "stale_served": self.stale_served,
+        }
+
+
+def status_from_env():
+    return TicketStatusService(
+        maxsize=int(os.getenv("TICKET_STATUS_CACHE_SIZE", "2048")),
+        fresh_ttl=float(os.getenv("TICKET_STATUS_TTL", "30")),
+        max_age=float(os.getenv("TICKET_STATUS_MAX_AGE", "900")),
+        not_found_ttl=float(os.getenv("TICKET_STATUS_NOT_FOUND_TTL", "10")),
+        fresh_backend=shared_store_from_env("ticket_status"),
+        known_backend=shared_store_from_env("ticket_status_known"),
+    )
@@ -0,0 +1,157 @@
+import json
+import asyncio
+import logging
+import contextvars
+from typing import Any, Dict, List, Optional, Union
+
+from fastapi import HTTPException
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from deadline import FALLBACKS, DEFAULT_FALLBACK, budget_from_request, run_with_deadline
+from admission import ADMISSION_REJECTED, Overloaded
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Mensagem do VAPI em atendimento, para handlers que precisam da chamada (ID, transcrição)
+current_message = contextvars.ContextVar("tool_message", default=None)
+
+
+# Envelope de tool calls enviado pelo VAPI (server URL das ferramentas)
+class ToolFunction(BaseModel):
+    name: str
+    arguments: Union[Dict[str, Any], str] = {}
+
+
+class ToolCall(BaseModel):
+    id: str
+    type: str = "function"
+    function: ToolFunction
+
+
+class ToolCallMessage(BaseModel):
+    type: Optional[str] = None
+    call: Optional[Dict[str, Any]] = None
+    artifact: Optional[Dict[str, Any]] = None
+    toolCalls: List[ToolCall] = []
+    toolCallList: List[ToolCall] = []
+    toolWithToolCallList: List[Dict[str, Any]] = []
+
+    def calls(self):
+        return self.toolCalls or self.toolCallList
+
+    def timeout_seconds(self):
+        for tool in self.toolWithToolCallList:
+            timeout = (tool.get("server") or {}).get("timeoutSeconds")
+            if timeout is not None:
+                return timeout
+        return None
+
+
+class ToolCallEnvelope(BaseModel):
+    message: ToolCallMessage
+
+
+# Validador compilado uma vez: o corpo é decodificado e validado em uma passada (pydantic-core)
+ENVELOPE = TypeAdapter(ToolCallEnvelope)
+
+
+def decode_envelope(body):
+    """
+    Decodifica o corpo (bytes) da requisição do VAPI. Levanta HTTPException 422 se inválido.
+    """
+    try:
+        return ENVELOPE.validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=f"Payload de tool calls inválido: {e.errors()[:3]}")
+
+
+def call_arguments(call):
+    arguments = call.function.arguments
+    if isinstance(arguments, str):
+        # Alguns modelos enviam os argumentos como string JSON
+        arguments = json.loads(arguments or "{}")
+    return arguments
+
+
+class ToolDispatcher:
+    """
+    Encaminha cada tool call do VAPI para o handler registrado com o mesmo
+    nome e executa as chamadas de uma mensagem em paralelo.
+
+    Cada handler recebe os argumentos (dict) e retorna o texto do resultado.
+    Todas as chamadas têm prazo (deadline.py): leituras são canceladas ao
+    estourar o prazo; escritas (`write=True`) continuam em segundo plano e,
+    com um IdempotencyStore, uma retentativa com o mesmo ID recebe o
+    resultado da primeira.
+
+    Com um AdmissionControl, a ferramenta registrada com `operation` ocupa
+    uma vaga dessa operação do GLPI enquanto executa (inclusive em segundo
+    plano); sem vaga, a chamada recebe erro em vez de esperar na fila.
+    """
+
+    def __init__(self, idempotency=None, admission=None):
+        self.idempotency = idempotency
+        self.admission = admission
+        self._handlers = {}
+
+    def tool(self, name, write=False, operation=None):
+        def register(handler):
+            self._handlers[name] = (handler, write, operation)
+            return handler
+        return register
+
+    async def _call(self, handler, arguments, operation):
+        if self.admission is None:
+            return await handler(arguments)
+        async with self.admission.slot(operation):
+            return await handler(arguments)
+
+    async def _run(self, call, message, headers):
+        with span(f"tool {call.function.name}", **{"tool.call_id": call.id}) as tool_span:
+            result = await self._run_call(call, message, headers)
+            if "error" in result:
+                tool_span.fail(result["error"])
+            return result
+
+    async def _run_call(self, call, message, headers):
+        name = call.function.name
+        registered = self._handlers.get(name)
+        if registered is None:
+            return {"toolCallId": call.id, "error": f"Ferramenta desconhecida: {name}"}
+        handler, write, upstream = registered
+        try:
+            arguments = call_arguments(call)
+            operation = lambda: self._call(handler, arguments, upstream)
+            if write and self.idempotency is not None:
+                coro = self.idempotency.run(f"{name}:{call.id}", operation)
+            else:
+                coro = operation()
+            budget = budget_from_request(name, headers=headers, timeout_seconds=message.timeout_seconds())
+            result = await run_with_deadline(name, coro, budget, FALLBACKS.get(name, DEFAULT_FALLBACK),
+                                             continue_in_background=write)
+            return {"toolCallId": call.id, "result": result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)}
+        except HTTPException as e:
+            return {"toolCallId": call.id, "error": str(e.detail)}
+        except Overloaded as e:
+            ADMISSION_REJECTED.inc(name, e.reason.split(":")[0])
+            logger.warning(f"Ferramenta {name} recusada: {str(e)}")
+            return {"toolCallId": call.id, "error": f"Sistema ocupado. Tente novamente em {e.retry_after} segundo(s)."}
+        except ValidationError as e:
+            campos = ", ".join(".".join(map(str, err["loc"])) or "argumentos" for err in e.errors())
+            return {"toolCallId": call.id, "error": f"Argumentos inválidos ou ausentes: {campos}"}
+        except ValueError as e:
+            # Argumentos que não são JSON válido
+            return {"toolCallId": call.id, "error": f"Argumentos inválidos: {str(e)[:300]}"}
+        except Exception as e:
+            logger.error(f"Erro na ferramenta {name}: {str(e)}")
+            return {"toolCallId": call.id, "error": "Erro ao executar a ferramenta."}
+
+    async def dispatch(self, envelope, headers=None):
+        """
+        Executa todas as tool calls da mensagem. Retorna {"results": [...]} na ordem recebida.
+        """
+        message = envelope.message
+        current_message.set(message)
+        results = await asyncio.gather(*(self._run(call, message, headers) for call in message.calls()))
+        return {"results": list(results)}
@@ -0,0 +1,381 @@
+import os
+import json
+import time
+import queue
+import atexit
+import hashlib
+import logging
+import secrets
+import threading
+import contextvars
+
+logger = logging.getLogger(__name__)
+
+# SpanKind do OTLP
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# Status do OTLP
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+
+
+def trace_id_for(call_id):
+    """
+    Trace ID (32 hex) derivado do ID da chamada do VAPI: todos os turnos da ligação ficam no mesmo trace.
+    """
+    return hashlib.sha256(str(call_id).encode()).hexdigest()[:32]
+
+
+def sampled_for(trace_id, rate):
+    """
+    Amostragem na cabeça do trace, determinística pelo trace ID (todos os
+    workers decidem igual para a mesma chamada).
+    """
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    return int(trace_id[-8:], 16) / 0xFFFFFFFF < rate
+
+
+def parse_traceparent(value):
+    """
+    Header W3C "00-<trace_id>-<span_id>-<flags>" -> (trace_id, span_id, sampled) ou None.
+    """
+    parts = (value or "").strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+def call_id(payload):
+    """
+    ID da chamada (`message.call.id`) no payload do VAPI, se houver.
+    """
+    if not isinstance(payload, dict):
+        return None
+    call = (payload.get("message") or {}).get("call") or payload.get("call") or {}
+    return call.get("id") if isinstance(call, dict) else None
+
+
+class _Trace:
+    __slots__ = ("trace_id", "sampled", "spans", "closed", "exporter")
+
+    def __init__(self, trace_id, sampled, exporter):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans = []
+        self.closed = False
+        self.exporter = exporter
+
+    def finish(self, span, root=False):
+        if not self.sampled:
+            return
+        if self.closed:
+            # Span que terminou depois da requisição (ex.: escrita em segundo plano)
+            self.exporter.export([span])
+            return
+        self.spans.append(span)
+        if root:
+            self.closed = True
+            spans, self.spans = self.spans, []
+            self.exporter.export(spans)
+
+
+class Span:
+    """
+    Um trecho cronometrado do trace. Use como context manager (`with`), em
+    código síncrono ou assíncrono; o span aberto vira o pai dos próximos.
+    """
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start", "end", "attributes",
+                 "error", "root", "_token")
+
+    def __init__(self, trace, name, parent_id=None, kind=KIND_INTERNAL, attributes=None, root=False):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes or {}
+        self.error = None
+        self.root = root
+        self._token = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def fail(self, message):
+        self.error = str(message)[:500]
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end = time.time_ns()
+        if exc_type is not None and self.error is None:
+            self.fail(f"{exc_type.__name__}: {exc}")
+        _current.reset(self._token)
+        self.trace.finish(self, root=self.root)
+        return False
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start),
+            "endTimeUnixNano": str(self.end or time.time_ns()),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": STATUS_ERROR, "message": self.error} if self.error else {"code": STATUS_OK},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class _NoopSpan:
+    """
+    Span de traces não amostrados: não mede nem guarda nada.
+    """
+
+    __slots__ = ()
+
+    def set(self, key, value):
+        pass
+
+    def fail(self, message):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class BatchSpanExporter:
+    """
+    Grava os spans em JSONL, uma linha por lote no formato JSON do OTLP
+    (ExportTraceServiceRequest, o mesmo do file exporter do OpenTelemetry
+    Collector). As requisições só colocam os spans em uma fila limitada;
+    uma thread separada agrupa e escreve. Com a fila cheia os spans são
+    descartados e contados, em vez de segurar a requisição.
+    """
+
+    def __init__(self, path, service_name="techvoice-api", batch_size=512, interval=2.0, max_queue=20000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.interval = interval
+        self.exported = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def export(self, spans):
+        for span in spans:
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                self.dropped += 1
+
+    def _drain(self):
+        spans = []
+        while len(spans) < self.batch_size:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _write(self, spans):
+        line = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", self.service_name),
+                                            _otlp_attribute("process.pid", os.getpid())]},
+                "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        }
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self.exported += len(spans)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._stop.wait(self.interval)
+            self.flush()
+
+    def flush(self):
+        while True:
+            spans = self._drain()
+            if not spans:
+                return
+            try:
+                self._write(spans)
+            except Exception as e:
+                logger.warning(f"Falha ao gravar spans: {str(e)}")
+                return
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+
+
+class Tracer:
+    """
+    Cria traces (um por requisição) e spans filhos, com amostragem na cabeça
+    do trace (`sample_rate`). Sem exportador, ou em trace não amostrado,
+    `span()` devolve um span vazio de custo desprezível.
+    """
+
+    def __init__(self, exporter=None, sample_rate=0.0):
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_trace(self, name, trace_id=None, parent_id=None, sampled=None, kind=KIND_SERVER, attributes=None):
+        """
+        Abre o span raiz de um trace (use com `with`).
+        """
+        trace_id = trace_id or secrets.token_hex(16)
+        if sampled is None:
+            sampled = sampled_for(trace_id, self.sample_rate)
+        trace = _Trace(trace_id, sampled and self.exporter is not None, self.exporter)
+        return Span(trace, name, parent_id=parent_id, kind=kind, attributes=attributes, root=True)
+
+    def span(self, name, kind=KIND_INTERNAL, **attributes):
+        parent = _current.get()
+        if parent is None or not parent.trace.sampled:
+            return NOOP_SPAN
+        return Span(parent.trace, name, parent_id=parent.span_id, kind=kind, attributes=attributes)
+
+    def use_call_id(self, vapi_call_id):
+        """
+        Passa o trace da requisição atual para o ID da chamada do VAPI (e
+        refaz a amostragem por ele). Deve ser chamado antes dos spans filhos.
+        """
+        current = _current.get()
+        if current is None or not vapi_call_id:
+            return
+        trace = current.trace
+        trace_id = trace_id_for(vapi_call_id)
+        if trace_id != trace.trace_id and current.parent_id:
+            # O pai do `traceparent` é de outro trace: o span vira raiz do trace da chamada
+            current.set("trace.previous_parent", f"{trace.trace_id}-{current.parent_id}")
+            current.parent_id = None
+        trace.trace_id = trace_id
+        trace.sampled = self.exporter is not None and sampled_for(trace.trace_id, self.sample_rate)
+        current.set("vapi.call_id", vapi_call_id)
+
+
+TRACER = Tracer()
+
+
+def span(name, kind=KIND_INTERNAL, **attributes):
+    """
+    Span filho do span atual (ou vazio, fora de um trace amostrado).
+    """
+    return TRACER.span(name, kind, **attributes)
+
+
+def current_span():
+    current = _current.get()
+    return current if current is not None and current.trace.sampled else NOOP_SPAN
+
+
+def use_call_id(vapi_call_id):
+    TRACER.use_call_id(vapi_call_id)
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI que abre o span raiz de cada requisição. O trace
+    continua o header W3C `traceparent`, ou usa o ID da chamada do VAPI
+    (header X-Vapi-Call-Id / X-Call-Id); os handlers que só conhecem o ID no
+    corpo chamam `use_call_id()`.
+    """
+
+    def __init__(self, app, routes, tracer=None):
+        self.app = app
+        self.routes = routes
+        self.tracer = tracer or TRACER
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.tracer.exporter is None:
+            await self.app(scope, receive, send)
+            return
+        from metrics import route_template
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        trace_id = parent_id = sampled = None
+        parent = parse_traceparent(headers.get("traceparent"))
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        elif headers.get("x-vapi-call-id") or headers.get("x-call-id"):
+            trace_id = trace_id_for(headers.get("x-vapi-call-id") or headers.get("x-call-id"))
+        if headers.get("x-trace") == "1":
+            # Pedido explícito de trace, para depuração
+            sampled = True
+
+        route = route_template(self.routes(), scope)
+        root = self.tracer.start_trace(f"{scope['method']} {route}", trace_id, parent_id, sampled,
+                                       attributes={"http.method": scope["method"], "http.route": route})
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.fail(f"HTTP {message['status']}")
+            await send(message)
+
+        with root:
+            await self.app(scope, receive, send_with_status)
+
+
+def setup_tracing():
+    """
+    Configura o tracer do processo: TRACE_FILE (JSONL no formato OTLP; vazio,
+    o padrão, desliga) e TRACE_SAMPLE_RATE (fração das requisições/chamadas amostradas).
+    """
+    if TRACER.exporter is not None:
+        return TRACER
+    path = os.getenv("TRACE_FILE", "")
+    if path:
+        TRACER.exporter = BatchSpanExporter(
+            path,
+            service_name=os.getenv("TRACE_SERVICE_NAME", "techvoice-api"),
+            interval=float(os.getenv("TRACE_EXPORT_INTERVAL", "2")),
+        )
+    TRACER.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+    return TRACER
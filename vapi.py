@@ -1,7 +1,14 @@
-from fastapi import FastAPI, HTTPException, Header
-import requests
+from fastapi import FastAPI, HTTPException, Header, Request
+from glpi_client import client_from_env
+from ticket_batcher import batcher_from_env
+from idempotency import idempotency_from_env, tool_call_id
+from deadline import FALLBACKS, budget_from_request, run_with_deadline
+from logging_config import setup_logging
+from admission import admission_from_env
+from requester import resolver_from_env
 import os
 
+setup_logging()
 app = FastAPI()
 
 # Configurações GLPI
@@ -16,26 +23,63 @@ VAPI_API_KEY = os.getenv("VAPI_API_KEY")
 if not GLPI_APP_TOKEN or not GLPI_USER_TOKEN:
     raise RuntimeError("GLPI_APP_TOKEN e GLPI_USER_TOKEN são obrigatórios.")
 
-# Função para autenticar no GLPI
-def get_glpi_session_token():
-    headers = {"Content-Type": "application/json", "App-Token": GLPI_APP_TOKEN}
-    payload = {"user_token": GLPI_USER_TOKEN}
-    response = requests.post(f"{GLPI_URL}/initSession", json=payload, headers=headers)
+# Cliente GLPI assíncrono: conexões keep-alive e sessões reaproveitadas entre requisições
+# (mesma configuração do ambiente: timeouts por operação, retentativas e disjuntores)
+glpi = client_from_env(glpi_url=GLPI_URL)
 
-    if response.status_code == 200:
-        return response.json().get("session_token")
-    raise HTTPException(status_code=401, detail=f"Falha na autenticação GLPI: {response.text}")
+# Tickets criados ao mesmo tempo seguem juntos em um único POST ao GLPI
+tickets = batcher_from_env(lambda: glpi)
 
-def close_glpi_session(session_token: str):
-    headers = {"App-Token": GLPI_APP_TOKEN, "Session-Token": session_token}
-    requests.get(f"{GLPI_URL}/killSession", headers=headers)
+# E-mail de contato -> usuário solicitante no GLPI (cache com carga periódica do diretório)
+requesters = resolver_from_env(lambda: glpi)
 
-@app.post("/armazenar-infos")
-async def armazenar_infos(data: dict, authorization: str = Header(None)):
+# Retentativas (mesma tool call ou Idempotency-Key) devolvem o resultado da primeira
+idempotency = idempotency_from_env()
+
+# Limite por chamador e teto de criações simultâneas de tickets no GLPI (429 com Retry-After)
+admission = admission_from_env()
+admission.operation("glpi_ticket", concurrency=10)
+
+def idempotency_key_for(endpoint, data, header_key):
+    key = header_key or data.get("toolCallId") or tool_call_id(data)
+    return f"{endpoint}:{key}" if key else None
+
+# Resposta imediata quando o GLPI não responde dentro do prazo; o registro continua em segundo plano
+PENDENTE = {"status": "pending", "message": FALLBACKS["criar_ticket"]}
+
+async def com_prazo(endpoint, data, headers, operation):
+    return await run_with_deadline(endpoint, operation, budget_from_request(endpoint, data, headers),
+                                   fallback=PENDENTE, continue_in_background=True)
+
+@app.on_event("startup")
+async def iniciar_solicitantes():
+    requesters.start()
+
+@app.on_event("shutdown")
+async def encerrar_sessoes():
+    await requesters.stop()
+    await glpi.close()
+
+async def criar_ticket_glpi(ticket_input):
+    result = await tickets.submit(ticket_input)
+    if result["id"]:
+        return result["id"]
+    if result["status"] == 401:
+        raise HTTPException(status_code=401, detail=f"Falha na autenticação GLPI: {result['message']}")
+    raise HTTPException(status_code=result["status"], detail="Falha ao criar GLPI ticket")
+
+@app.post("/armazenar-infos", dependencies=[admission.limit("armazenar-infos", rate="5/10", operation="glpi_ticket")])
+async def armazenar_infos(data: dict, request: Request, authorization: str = Header(None),
+                          idempotency_key: str = Header(None)):
     # Valida requisição da VAPI
     if authorization != f"Bearer {VAPI_API_KEY}":
         raise HTTPException(status_code=403, detail="Unauthorized")
 
+    key = idempotency_key_for("armazenar-infos", data, idempotency_key)
+    return await com_prazo("armazenar-infos", data, request.headers,
+                           idempotency.run(key, lambda: registrar_infos(data)))
+
+async def registrar_infos(data: dict):
     name = data.get("name")
     issue_description = data.get("issue_description")
     contact_email = data.get("contact_email", None)
@@ -48,61 +92,38 @@ async def armazenar_infos(data: dict, authorization: str = Header(None)):
     if contact_email:
         ticket_description += f"E-mail de contato: {contact_email}"
 
-    # Autentica no GLPI
-    session_token = get_glpi_session_token()
-
-    try:
-        # Cria ticket
-        ticket_payload = {
-            "input": {
-                "name": f"Problema Técnico - {name}",
-                "content": ticket_description,
-                "priority": 3,
-                "entities_id": [1],  # SENAC Blumenau entity ID
-                "groups_id": [1]   # N1 group ID
-            }
+    # Cria ticket
+    ticket_payload = {
+        "input": {
+            "name": f"Problema Técnico - {name}",
+            "content": ticket_description,
+            "priority": 3,
+            "entities_id": [1],  # SENAC Blumenau entity ID
+            "groups_id": [1],   # N1 group ID
+            **await requesters.fields(contact_email)
         }
-        headers = {
-            "Content-Type": "application/json",
-            "Session-Token": session_token,
-            "App-Token": GLPI_APP_TOKEN
-        }
-        response = requests.post(f"{GLPI_URL}/Ticket", json=ticket_payload, headers=headers)
+    }
+    ticket_id = await criar_ticket_glpi(ticket_payload["input"])
+    return {"status": "success", "ticket_id": ticket_id, "collected_data": data}
 
-        if response.status_code in [200, 201]:
-            return {"status": "success", "ticket_id": response.json().get("id"), "collected_data": data}
-        else:
-            raise HTTPException(status_code=response.status_code, detail="Falha ao criar GLPI ticket")
-    finally:
-        close_glpi_session(session_token)
+@app.post("/criar-chamado-glpi", dependencies=[admission.limit("criar-chamado-glpi", rate="5/10", operation="glpi_ticket")])
+async def criar_chamado_glpi(data: dict, request: Request, idempotency_key: str = Header(None)):
+    key = idempotency_key_for("criar-chamado-glpi", data, idempotency_key)
+    return await com_prazo("criar-chamado-glpi", data, request.headers,
+                           idempotency.run(key, lambda: registrar_chamado(data)))
 
-@app.post("/criar-chamado-glpi")
-async def criar_chamado_glpi(data: dict):
+async def registrar_chamado(data: dict):
     issue_title = data.get("title", "Problema Técnico")
     issue_description = data.get("description", "Problema relatado via assistente de voz")
     priority = data.get("priority", 3)
 
-    session_token = get_glpi_session_token()
-
-    try:
-        ticket_payload = {
-            "input": {
-                "name": issue_title,
-                "content": issue_description,
-                "priority": priority,
-                "entities_id": 0
-            }
-        }
-        headers = {
-            "Content-Type": "application/json",
-            "Session-Token": session_token,
-            "App-Token": GLPI_APP_TOKEN
+    ticket_payload = {
+        "input": {
+            "name": issue_title,
+            "content": issue_description,
+            "priority": priority,
+            "entities_id": 0
         }
-        response = requests.post(f"{GLPI_URL}/Ticket", json=ticket_payload, headers=headers)
-
-        if response.status_code in [200, 201]:
-            return {"status": "success", "ticket_id": response.json().get("id")}
-        else:
-            raise HTTPException(status_code=response.status_code, detail="Falha ao criar GLPI ticket")
-    finally:
-        close_glpi_session(session_token)
+    }
+    ticket_id = await criar_ticket_glpi(ticket_payload["input"])
+    return {"status": "success", "ticket_id": ticket_id}